@@ -0,0 +1,87 @@
+"""
+Benchmark the approximate (IVF / IVF-PQ) vector index against exact search.
+
+Builds a synthetic topical corpus, takes the exact top-k of every query as ground
+truth, and reports recall@k and per-query latency for a range of nprobe values,
+with and without product quantization, to pick KB_ANN_* operating points.
+
+Run from the project root:
+    python -m benchmarks.bench_ann_search --size 100000 --nprobe 1 4 16 64
+"""
+import argparse
+import time
+from typing import List
+
+import numpy as np
+
+from src.services.ann_index import IVFIndex
+from src.services.kb_service import EMBEDDING_DIM, KnowledgeBase, _top_k
+
+TOPICS = 500
+TOPIC_WORDS = 200
+COMMON_WORDS = 5000
+
+
+def sample_texts(count: int, length: int, rng: np.random.Generator) -> List[str]:
+    """Texts drawing most words from one topic's vocabulary and the rest from a shared one."""
+    topics = rng.integers(TOPICS, size=count)
+    specific = rng.integers(TOPIC_WORDS, size=(count, length - length // 4))
+    common = rng.integers(COMMON_WORDS, size=(count, length // 4))
+    return [
+        " ".join([f"t{topic}w{word}" for word in words] + [f"common{word}" for word in shared])
+        for topic, words, shared in zip(topics, specific, common)
+    ]
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    """Mean fraction of the exact top-k that the approximate search returned."""
+    return float(np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(found, truth)]))
+
+
+def main(size: int, queries: int, top_k: int, nlist: int, nprobes: List[int], pq: List[int], rerank: int) -> None:
+    rng = np.random.default_rng(0)
+    kb = KnowledgeBase()
+    embeddings = kb._embed_batch(sample_texts(size, 50, rng))
+    kb._set_embeddings(embeddings)
+    query_matrix = kb._embed_queries(sample_texts(queries, 8, rng))
+    nlist = nlist or int(np.sqrt(size))
+
+    truth, _ = _top_k(query_matrix @ embeddings.T, top_k)
+    # Chat retrieval embeds one query at a time, so the baseline is unbatched too
+    start = time.perf_counter()
+    for query in query_matrix:
+        _top_k(query[None, :] @ embeddings.T, top_k)
+    exact_ms = (time.perf_counter() - start) * 1000 / queries
+    print(f"chunks={size} dim={EMBEDDING_DIM} top_k={top_k} nlist={nlist} queries={queries}")
+    print(f"exact: {exact_ms:.3f} ms/query, {embeddings.nbytes / 1e6:.0f} MB of vectors")
+    print(f"{'index':>14} {'build s':>8} {'index MB':>9} {'nprobe':>7} {'recall@k':>9} {'ms/query':>9} {'speedup':>8}")
+
+    configs = [(0, 0)] + [(m, 0) for m in pq] + ([(m, rerank) for m in pq] if rerank else [])
+    for subspaces, rr in configs:
+        start = time.perf_counter()
+        index = IVFIndex.build(embeddings, nlist, pq_subspaces=subspaces, rerank=rr)
+        build_s = time.perf_counter() - start
+        memory = index.rows.nbytes + index.centroids.nbytes
+        memory += index.codes.nbytes + index.codebooks.nbytes if subspaces else embeddings.nbytes
+        name = f"ivfpq{subspaces}" + (f"+rr{rr}" if rr else "") if subspaces else "ivf"
+        for nprobe in nprobes:
+            start = time.perf_counter()
+            found = np.concatenate([index.search(query[None, :], top_k, nprobe=nprobe)[0] for query in query_matrix])
+            ms = (time.perf_counter() - start) * 1000 / queries
+            print(
+                f"{name:>14} {build_s:>8.1f} {memory / 1e6:>9.1f} {nprobe:>7} {recall(found, truth):>9.3f} "
+                f"{ms:>9.3f} {exact_ms / ms:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=0, help="coarse cells (default: sqrt of the corpus size)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--pq", type=int, nargs="+", default=[64, 128], help="PQ subspace counts to try")
+    parser.add_argument("--rerank", type=int, default=100, help="candidates re-scored exactly (0 to skip)")
+    args = parser.parse_args()
+    main(args.size, args.queries, args.top_k, args.nlist, args.nprobe, args.pq, args.rerank)
@@ -0,0 +1,53 @@
+"""
+Load-test running app nodes with concurrent chat turns and report turns/sec.
+
+Requests are spread round-robin over the given node URLs, each simulated user keeping
+its own session cookie. Start the nodes first, for example three nodes on PostgreSQL:
+    docker-compose -f docker-compose.postgres.yml up --build --scale app=3
+Point their OPENROUTER_BASE_URL at tests.fake_openrouter to keep the real LLM out of
+the measurement. Then run from the project root:
+    python -m benchmarks.bench_chat_nodes --urls http://localhost:8000 http://localhost:8001 http://localhost:8002
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+
+import httpx
+
+
+async def run(urls: List[str], users: int, turns: int) -> None:
+    errors = 0
+    latencies = []
+
+    async def user(i: int) -> None:
+        nonlocal errors
+        async with httpx.AsyncClient(base_url=urls[i % len(urls)], timeout=120) as client:
+            for turn in range(turns):
+                started = time.perf_counter()
+                response = await client.post("/chat/", json={"message": f"user {i} turn {turn}"})
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(i) for i in range(users)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    total = users * turns
+    print(f"nodes={len(urls)} users={users} turns/user={turns}")
+    print(f"{'turns':>7} {'seconds':>8} {'turns/sec':>10} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    print(
+        f"{total:>7} {elapsed:>8.2f} {total / elapsed:>10.1f} "
+        f"{latencies[len(latencies) // 2] * 1000:>8.1f} {latencies[int(len(latencies) * 0.99)] * 1000:>8.1f} {errors:>7}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--urls", nargs="+", default=["http://localhost:8000"])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.urls, args.users, args.turns))
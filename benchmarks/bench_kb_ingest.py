@@ -0,0 +1,51 @@
+"""
+Benchmark a cold knowledge base build with an increasing number of ingestion workers.
+
+Generates a synthetic corpus of text files in a temporary directory and reports
+files/sec and MB/sec for each worker count.
+
+Run from the project root:
+    python -m benchmarks.bench_kb_ingest --files 400 --words 20000 --workers 1 2 4 8
+"""
+import argparse
+import tempfile
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from src.services.kb_service import KnowledgeBase
+
+VOCABULARY = [f"term{i}" for i in range(20000)]
+
+
+def write_corpus(directory: Path, files: int, words: int, rng: np.random.Generator) -> None:
+    for i in range(files):
+        text = " ".join(rng.choice(VOCABULARY, size=words))
+        (directory / f"doc_{i:05d}.txt").write_text(text)
+
+
+def main(files: int, words: int, workers: List[int]) -> None:
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        write_corpus(directory, files, words, rng)
+
+        print(f"{'workers':>8} {'seconds':>9} {'files/sec':>10} {'MB/sec':>8} {'speedup':>8}")
+        baseline = None
+        for count in workers:
+            kb = KnowledgeBase()
+            kb.load_documents(str(directory), workers=count)
+            stats = kb.last_ingest_stats
+            baseline = baseline or stats.seconds
+            print(f"{stats.workers:>8} {stats.seconds:>9.2f} {stats.files_per_sec:>10.1f} "
+                  f"{stats.mb_per_sec:>8.2f} {baseline / stats.seconds:>7.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=400)
+    parser.add_argument("--words", type=int, default=20000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    main(args.files, args.words, args.workers)
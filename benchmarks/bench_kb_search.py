@@ -0,0 +1,100 @@
+"""
+Benchmark KnowledgeBase.search latency as the corpus grows.
+
+Compares the old per-chunk Python loop (norms + dot product + full argsort)
+against the matrix-backed search and the batched query path, all with a cold
+retrieval cache, and a repeated query answered from the retrieval cache.
+Lexical (BM25) timings cover the same multi-term query and an exact-code
+lookup, whose postings stay the same length however large the corpus is;
+hybrid runs both retrievers and fuses their rankings.
+
+Run from the project root:
+    python -m benchmarks.bench_kb_search --sizes 1000 10000 50000
+"""
+import argparse
+import time
+from typing import Callable, List
+
+import numpy as np
+from numpy.linalg import norm
+
+from src.services.chunk_store import ChunkStoreBuilder
+from src.services.kb_service import KnowledgeBase, EMBEDDING_DIM, retrieval_cache
+
+VOCABULARY = [f"term{i}" for i in range(5000)]
+
+
+def build_knowledge_base(size: int, rng: np.random.Generator) -> KnowledgeBase:
+    """Create a knowledge base with `size` synthetic, uniquely coded chunks, bypassing the file loader."""
+    kb = KnowledgeBase()
+    words = rng.choice(VOCABULARY, size=(size, 50))
+    texts = [f"sku{i} " + " ".join(row) for i, row in enumerate(words)]
+    builder = ChunkStoreBuilder()
+    builder.add({"source": "synthetic"}, texts)
+    kb._set_store(builder.build())
+    kb._set_embeddings(kb._embed_batch(texts))
+    return kb
+
+
+def legacy_search(kb: KnowledgeBase, query: str, top_k: int) -> list:
+    """The original loop-based implementation, kept here for comparison."""
+    query_embedding = kb._embed_queries([query])[0]
+    similarities = []
+    for doc_embedding in kb.embeddings:
+        sim = np.dot(query_embedding, doc_embedding) / (
+            norm(query_embedding) * norm(doc_embedding) + 1e-9
+        )
+        similarities.append(sim)
+    top_indices = np.argsort(similarities)[-top_k:][::-1]
+    return [(kb.documents[i], similarities[i]) for i in top_indices]
+
+
+def time_call(fn: Callable[[], object], repeat: int) -> float:
+    """Return the median wall time of `fn` in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def main(sizes: List[int], top_k: int, batch: int, repeat: int) -> None:
+    rng = np.random.default_rng(0)
+    queries = [" ".join(rng.choice(VOCABULARY, size=8)) for _ in range(batch)]
+
+    print(f"dim={EMBEDDING_DIM} top_k={top_k} batch={batch}")
+    print(
+        f"{'chunks':>10} {'loop ms':>10} {'matrix ms':>10} {'batch ms/q':>11} {'cached ms':>10} {'speedup':>8} "
+        f"{'bm25 ms':>10} {'sku ms':>10} {'hybrid ms':>10}"
+    )
+    for size in sizes:
+        kb = build_knowledge_base(size, rng)
+        loop_ms = time_call(lambda: legacy_search(kb, queries[0], top_k), repeat)
+        matrix_ms = time_call(lambda: (retrieval_cache.clear(), kb.search(queries[0], top_k=top_k)), repeat)
+        batch_ms = time_call(lambda: (retrieval_cache.clear(), kb.search_batch(queries, top_k=top_k)), repeat) / batch
+        kb.search(queries[0], top_k=top_k)
+        cached_ms = time_call(lambda: kb.search(queries[0], top_k=top_k), repeat)
+        bm25_ms = time_call(
+            lambda: (retrieval_cache.clear(), kb.search(queries[0], top_k=top_k, mode="lexical")), repeat
+        )
+        sku_ms = time_call(
+            lambda: (retrieval_cache.clear(), kb.search(f"sku{size // 2}", top_k=top_k, mode="lexical")), repeat
+        )
+        hybrid_ms = time_call(
+            lambda: (retrieval_cache.clear(), kb.search(queries[0], top_k=top_k, mode="hybrid")), repeat
+        )
+        print(
+            f"{size:>10} {loop_ms:>10.2f} {matrix_ms:>10.2f} {batch_ms:>11.3f} {cached_ms:>10.3f} "
+            f"{loop_ms / matrix_ms:>7.1f}x {bm25_ms:>10.3f} {sku_ms:>10.3f} {hybrid_ms:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000, 100_000])
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.sizes, args.top_k, args.batch, args.repeat)
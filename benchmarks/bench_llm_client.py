@@ -0,0 +1,92 @@
+"""
+Measure LLM round-trip throughput against the local OpenRouter stand-in.
+
+Starts tests.fake_openrouter on a local port with a simulated generation latency
+and fires concurrent chat completions through:
+  * a blocking, unpooled POST per call, like the old requests.post client (one at a
+    time, as it held the event loop)
+  * the shared, pooled httpx.AsyncClient
+
+Run from the project root:
+    python -m benchmarks.bench_llm_client --requests 200 --concurrency 50 --latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import socket
+import threading
+import time
+
+import httpx
+import uvicorn
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int) -> uvicorn.Server:
+    from tests.fake_openrouter import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+async def run_blocking(base_url: str, total: int) -> float:
+    started = time.perf_counter()
+    for i in range(total):
+        # The old client: a fresh connection and a blocked event loop per call
+        httpx.post(
+            f"{base_url}/chat/completions",
+            json={"model": "bench", "messages": [{"role": "user", "content": f"q{i}"}], "max_tokens": 512},
+        ).json()
+    return time.perf_counter() - started
+
+
+async def run_pooled(total: int, concurrency: int) -> float:
+    from src.services import llm_client
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            await llm_client.ask_openrouter([{"role": "user", "content": f"q{i}"}])
+
+    await llm_client.open_client()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+    await llm_client.close_client()
+    return elapsed
+
+
+def main(total: int, concurrency: int, latency: float) -> None:
+    os.environ["FAKE_OPENROUTER_LATENCY"] = str(latency)
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}/api/v1"
+    os.environ["OPENROUTER_BASE_URL"] = base_url
+    server = start_server(port)
+
+    blocking_total = max(1, min(total, int(5 / max(latency, 0.01))))
+    blocking = asyncio.run(run_blocking(base_url, blocking_total))
+    pooled = asyncio.run(run_pooled(total, concurrency))
+    server.should_exit = True
+
+    print(f"upstream latency={latency}s concurrency={concurrency}")
+    print(f"{'client':>10} {'requests':>9} {'seconds':>8} {'req/sec':>8}")
+    print(f"{'blocking':>10} {blocking_total:>9} {blocking:>8.2f} {blocking_total / blocking:>8.1f}")
+    print(f"{'pooled':>10} {total:>9} {pooled:>8.2f} {total / pooled:>8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+    main(args.requests, args.concurrency, args.latency)
@@ -0,0 +1,95 @@
+"""
+Measure concurrent chat-turn writes per second against a SQLite file.
+
+Each simulated request saves one turn (user message + assistant reply). Three setups
+are compared on a fresh database each:
+  * default  - SQLite defaults (rollback journal, synchronous=FULL), one transaction per turn
+  * pragmas  - the production profile from src.database (WAL, synchronous=NORMAL, ...)
+  * writer   - the production profile plus the single group-committing MessageWriter
+
+Run from the project root:
+    python -m benchmarks.bench_sqlite_writes --turns 2000 --concurrency 100
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Tuple
+
+# src.database builds its engine at import time
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src.database import Base, apply_sqlite_pragmas
+from src.database_operations import add_messages, create_chat_session
+from src.models import ChatSession  # noqa: F401 - registers the tables on Base
+from src.services.message_writer import MessageWriter
+
+# src.models clears Base.metadata on create_all, so keep the tables for the later runs
+TABLES = list(Base.metadata.sorted_tables)
+
+
+def create_tables(conn) -> None:
+    for table in TABLES:
+        table.create(conn)
+
+
+async def run(path: Path, mode: str, turns: int, concurrency: int) -> Tuple[float, int]:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", pool_size=concurrency, max_overflow=0)
+    if mode != "default":
+        apply_sqlite_pragmas(engine)
+    sessions = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    async with engine.begin() as conn:
+        await conn.run_sync(create_tables)
+    async with sessions() as db:
+        session_ids = [(await create_chat_session(db, f"bench-{i}")).id for i in range(concurrency)]
+
+    writer = MessageWriter(sessions)
+    if mode == "writer":
+        await writer.start()
+
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        session_id = session_ids[i % concurrency]
+        messages = [("user", f"question {i} " * 20), ("assistant", f"answer {i} " * 80)]
+        async with semaphore:
+            try:
+                if mode == "writer":
+                    await writer.submit(session_id, messages)
+                else:
+                    async with sessions() as db:
+                        await add_messages(db, session_id, messages)
+            except OperationalError:
+                # "database is locked" once the busy timeout runs out
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(turns)))
+    elapsed = time.perf_counter() - started
+    await writer.stop()
+    await engine.dispose()
+    return elapsed, errors
+
+
+def main(turns: int, concurrency: int) -> None:
+    print(f"turns={turns} concurrency={concurrency}")
+    print(f"{'setup':>8} {'seconds':>8} {'turns/sec':>10} {'errors':>7}")
+    for mode in ("default", "pragmas", "writer"):
+        with tempfile.TemporaryDirectory() as tmp:
+            elapsed, errors = asyncio.run(run(Path(tmp) / "bench.sqlite", mode, turns, concurrency))
+        print(f"{mode:>8} {elapsed:>8.2f} {(turns - errors) / elapsed:>10.1f} {errors:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+    main(args.turns, args.concurrency)
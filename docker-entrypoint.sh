@@ -1,19 +1,26 @@
 #!/bin/sh
 set -e
 
-# Create data directory if it doesn't exist
-mkdir -p /app/data
+case "$DATABASE_URL" in
+sqlite*)
+    # Create data directory if it doesn't exist
+    mkdir -p /app/data
 
-# Check if database file exists, if not create it
-if [ ! -f "/app/data/db.sqlite" ]; then
-    echo "Creating new SQLite database..."
-    touch /app/data/db.sqlite
-    chmod 664 /app/data/db.sqlite
-fi
+    # Check if database file exists, if not create it
+    if [ ! -f "/app/data/db.sqlite" ]; then
+        echo "Creating new SQLite database..."
+        touch /app/data/db.sqlite
+        chmod 664 /app/data/db.sqlite
+    fi
+    ;;
+esac
 
-# Run migrations
+# Run migrations (concurrent app nodes on PostgreSQL take turns via an advisory lock)
 cd /app
 alembic upgrade head
 
+# Build the knowledge base index once so every worker can memory-map it at startup
+python -m src.build_index
+
 # Execute the CMD from docker-compose
 exec "$@"
\ No newline at end of file
@@ -0,0 +1,2 @@
+-- Runs once when the PostgreSQL volume is first initialized
+CREATE DATABASE aichat_test OWNER aichat;
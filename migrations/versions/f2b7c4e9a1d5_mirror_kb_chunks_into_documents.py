@@ -0,0 +1,68 @@
+"""Mirror knowledge base chunks into documents, with full-text search
+
+Revision ID: f2b7c4e9a1d5
+Revises: e4d8a6c2b9f1
+Create Date: 2026-10-18 15:20:41.583102
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b7c4e9a1d5'
+down_revision: Union[str, Sequence[str], None] = 'e4d8a6c2b9f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SQLITE_DOCUMENTS_FTS = [
+    "CREATE VIRTUAL TABLE documents_fts USING fts5(content, content='documents', content_rowid='id')",
+    "CREATE TRIGGER documents_fts_insert AFTER INSERT ON documents BEGIN "
+    "INSERT INTO documents_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER documents_fts_delete AFTER DELETE ON documents BEGIN "
+    "INSERT INTO documents_fts(documents_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER documents_fts_update AFTER UPDATE OF content ON documents BEGIN "
+    "INSERT INTO documents_fts(documents_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO documents_fts(rowid, content) VALUES (new.id, new.content); END",
+    # Index the rows that already exist
+    "INSERT INTO documents_fts(documents_fts) VALUES ('rebuild')",
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('documents', sa.Column('chunk', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('documents', sa.Column('file_hash', sa.String(length=32), nullable=True))
+    op.add_column('documents', sa.Column('file_size', sa.BigInteger(), nullable=True))
+    op.add_column('documents', sa.Column('file_mtime', sa.Float(), nullable=True))
+    op.create_index('ix_documents_filename_chunk', 'documents', ['filename', 'chunk'], unique=False)
+
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_DOCUMENTS_FTS:
+            op.execute(statement)
+    elif dialect == 'postgresql':
+        op.create_index(
+            'ix_documents_content_fts', 'documents', [sa.text("to_tsvector('simple', content)")],
+            unique=False, postgresql_using='gin',
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for trigger in ('documents_fts_insert', 'documents_fts_delete', 'documents_fts_update'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS documents_fts")
+    elif dialect == 'postgresql':
+        op.drop_index('ix_documents_content_fts', table_name='documents')
+
+    op.drop_index('ix_documents_filename_chunk', table_name='documents')
+    with op.batch_alter_table('documents') as batch_op:
+        batch_op.drop_column('file_mtime')
+        batch_op.drop_column('file_size')
+        batch_op.drop_column('file_hash')
+        batch_op.drop_column('chunk')
@@ -0,0 +1,19 @@
+from src.config import KB_PATH, KB_INDEX_PATH
+from src.services.kb_service import IndexLock, get_knowledge_base
+
+"""
+Build (or incrementally refresh) the persisted knowledge base index once,
+before starting the workers:
+ python -m src.build_index
+
+"""
+
+if __name__ == "__main__":
+    lock = IndexLock(KB_INDEX_PATH)
+    if not lock.acquire(blocking=False):
+        # A running server's indexer owns the index and already keeps it up to date
+        raise SystemExit(f"{KB_INDEX_PATH} is being written by another process")
+    kb = get_knowledge_base()
+    stats = kb.refresh_index(KB_PATH, KB_INDEX_PATH)
+    lock.release()
+    print(f"Indexed {len(kb.documents)} chunks from {KB_PATH} into {KB_INDEX_PATH}: {stats}")
@@ -5,8 +5,98 @@ from pathlib import Path
 load_dotenv()
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
 MODEL_NAME = "openai/gpt-oss-20b:free"
+
+# Pooled HTTP client settings for LLM calls
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+
+# Conversation context sent to the LLM: the newest messages that fit both limits,
+# with older turns folded into a rolling summary of at most SUMMARY_TOKEN_BUDGET tokens
+CONTEXT_MAX_MESSAGES = int(os.getenv("CONTEXT_MAX_MESSAGES", "20"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "500"))
+# Extra messages read past the window so the ones just pushed out can be summarized
+SUMMARY_FOLD_SLACK = int(os.getenv("SUMMARY_FOLD_SLACK", "10"))
+
+# Cache of LLM replies keyed by (normalized question, prompt context, model)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+# SQLite file shared by the workers on a host as a second cache tier (empty disables it)
+RESPONSE_CACHE_DB_PATH = os.getenv("RESPONSE_CACHE_DB_PATH", "")
+# Opt-in near-duplicate matching: reuse a reply when the question embeddings have at
+# least this cosine similarity (0 disables; e.g. 0.9)
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0"))
+
+# Chat sessions older than this many days are deleted with their messages (0 keeps them forever);
+# the default matches the 30-day session cookie
+SESSION_TTL_DAYS = float(os.getenv("SESSION_TTL_DAYS", "30"))
+# Seconds between retention sweeps, and most sessions deleted per sweep transaction
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "3600"))
+SESSION_SWEEP_BATCH_SIZE = int(os.getenv("SESSION_SWEEP_BATCH_SIZE", "500"))
+
+# Connection pool for server databases such as PostgreSQL (SQLite keeps SQLAlchemy's defaults)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Seconds after which pooled connections are replaced, and whether to test them on checkout
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Prepared statements cached per asyncpg connection; set to 0 behind PgBouncer in transaction mode
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+
+# SQLite connection profile, applied on every new connection (ignored for other databases)
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+# Milliseconds a connection waits for the write lock before "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Page cache per connection; negative values are KiB, as in PRAGMA cache_size
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+# Route chat message inserts through one in-process writer task that group-commits them
+DB_SINGLE_WRITER = os.getenv("DB_SINGLE_WRITER", "true").lower() in ("1", "true", "yes")
+# Most queued writes committed together in one writer transaction
+DB_WRITER_MAX_BATCH = int(os.getenv("DB_WRITER_MAX_BATCH", "256"))
+
 KB_PATH = "knowledge_base"
+# Directory holding the persisted, memory-mapped KB index (built once, shared by all workers)
+KB_INDEX_PATH = os.getenv("KB_INDEX_PATH", "kb_index")
+# Seconds between background scans of KB_PATH for added, changed or deleted files
+KB_POLL_INTERVAL = float(os.getenv("KB_POLL_INTERVAL", "5"))
+# Worker processes used to read, chunk and embed KB files in parallel
+KB_INGEST_WORKERS = int(os.getenv("KB_INGEST_WORKERS", os.cpu_count() or 1))
+# Seconds a worker may spend extracting, chunking and embedding a single file before it is skipped
+KB_EXTRACT_TIMEOUT = float(os.getenv("KB_EXTRACT_TIMEOUT", "60"))
+# Retrieval results (top-k chunks, formatted context) remembered per query and index generation
+KB_RETRIEVAL_CACHE_SIZE = int(os.getenv("KB_RETRIEVAL_CACHE_SIZE", "4096"))
+# Mirror KB chunks into the documents table, so every node shares one durable, full-text indexed copy
+KB_DB_MIRROR = os.getenv("KB_DB_MIRROR", "true").lower() in ("1", "true", "yes")
+# Files whose mirrored chunks are replaced per transaction, so chat writes are not locked out for long
+KB_MIRROR_BATCH_FILES = int(os.getenv("KB_MIRROR_BATCH_FILES", "16"))
+# Where the lexical side of KB retrieval runs: "memory" (per-process BM25) or "database" (FTS5 / tsvector)
+KB_LEXICAL_BACKEND = os.getenv("KB_LEXICAL_BACKEND", "memory")
+# Retrieval used to build chat context: "vector" (embeddings), "lexical" (BM25) or "hybrid" (both, fused)
+KB_SEARCH_MODE = os.getenv("KB_SEARCH_MODE", "hybrid")
+# BM25 term-frequency saturation and document-length normalization
+KB_BM25_K1 = float(os.getenv("KB_BM25_K1", "1.2"))
+KB_BM25_B = float(os.getenv("KB_BM25_B", "0.75"))
+# Hybrid search fuses this many results from each retriever, with reciprocal rank fusion constant KB_RRF_K
+KB_FUSION_DEPTH = int(os.getenv("KB_FUSION_DEPTH", "50"))
+KB_RRF_K = int(os.getenv("KB_RRF_K", "60"))
+# Approximate vector index built next to the exact one: "" (off), "ivf" or "ivfpq" (product-quantized)
+KB_ANN_INDEX = os.getenv("KB_ANN_INDEX", "")
+# Smaller corpora are always searched exactly
+KB_ANN_MIN_CHUNKS = int(os.getenv("KB_ANN_MIN_CHUNKS", "50000"))
+# k-means cells (0 picks the square root of the chunk count) and cells probed per query
+KB_ANN_NLIST = int(os.getenv("KB_ANN_NLIST", "0"))
+KB_ANN_NPROBE = int(os.getenv("KB_ANN_NPROBE", "16"))
+# One-byte PQ codes per vector (must divide EMBEDDING_DIM) and PQ candidates re-scored exactly
+KB_ANN_PQ_SUBSPACES = int(os.getenv("KB_ANN_PQ_SUBSPACES", "64"))
+KB_ANN_RERANK = int(os.getenv("KB_ANN_RERANK", "100"))
 
 
 # Base directory for the knowledge base
@@ -22,6 +112,9 @@ SUPPORTED_EXTENSIONS = {
     '.json'
 }
 
+# Dimension of the hashed TF-IDF embeddings used for KB retrieval
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "1024"))
+
 # Chunking settings for document processing
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
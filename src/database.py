@@ -1,16 +1,87 @@
 # database.py
 import os
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import declarative_base
 
+from src.config import (
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_STATEMENT_CACHE_SIZE,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_CACHE_SIZE,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_MMAP_SIZE,
+    SQLITE_SYNCHRONOUS,
+)
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Pragmas run on every new SQLite connection: WAL lets readers proceed while a write
+# commits, NORMAL skips the fsync per commit (a power cut may lose the last commits but
+# never corrupts the file), and the busy timeout makes writers wait for the lock
+# instead of failing with "database is locked"
+SQLITE_PRAGMAS = {
+    "journal_mode": SQLITE_JOURNAL_MODE,
+    "synchronous": SQLITE_SYNCHRONOUS,
+    "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+    "mmap_size": SQLITE_MMAP_SIZE,
+    "cache_size": SQLITE_CACHE_SIZE,
+    "foreign_keys": "ON",
+}
+
+
+def apply_sqlite_pragmas(engine: AsyncEngine, pragmas: dict = SQLITE_PRAGMAS) -> None:
+    """Run `pragmas` on each new connection of `engine`; does nothing for other databases."""
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def engine_options(url: str) -> dict:
+    """
+    create_async_engine() keyword arguments for the database at `url`.
+
+    SQLite keeps SQLAlchemy's default pool; server databases get a sized pool with
+    pre-ping and recycling, and asyncpg caches prepared statements per connection.
+    """
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        return {}
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if url.get_driver_name() == "asyncpg":
+        # SQLAlchemy's own prepared statement cache and asyncpg's statement cache
+        options["connect_args"] = {
+            "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        }
+    return options
+
+
 # Async engine
 engine = create_async_engine(
     DATABASE_URL,
     echo=False,
     future=True,
+    **engine_options(DATABASE_URL),
 )
+apply_sqlite_pragmas(engine)
 
 # Async session factory
 async_session = async_sessionmaker(
@@ -28,5 +99,3 @@ Base = declarative_base()
 async def get_session() -> AsyncSession:
     async with async_session() as session:
         yield session
-
-
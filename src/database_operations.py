@@ -1,16 +1,22 @@
-from sqlalchemy import select, desc
-from typing import List
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import (
+    Integer, String, case, column, delete, func, literal, literal_column, or_, select, insert, table, tuple_,
+)
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.models import ChatSession, Message, Document
 from src.schemas import MessageOut, DocumentOut
+from src.services.embeddings import tokenize
 
 
 async def create_chat_session(db: AsyncSession, session_id: str) -> ChatSession:
-    session = ChatSession(session_id=session_id)
-    db.add(session)
+    # INSERT ... RETURNING hands back the server defaults without a refresh round trip
+    session = await db.scalar(
+        insert(ChatSession).values(session_id=session_id).returning(ChatSession)
+    )
     await db.commit()
-    await db.refresh(session)
     return session
 
 async def get_chat_session(db: AsyncSession, session_id: str):
@@ -28,6 +34,30 @@ async def add_message(db: AsyncSession, session_id: int, role: str, content: str
     return msg
 
 
+async def insert_messages(db: AsyncSession, messages: Sequence[Tuple[int, str, str]]) -> List[MessageOut]:
+    """
+    Insert (session_id, role, content) messages with one multi-row INSERT ... RETURNING.
+
+    Ids and timestamps come back without a refresh. Rows are returned in insertion
+    (id) order. The caller commits.
+    """
+    # SQLite returns multi-row INSERT rows in order anyway, and asking for it explicitly
+    # would make SQLAlchemy insert them one at a time there
+    ordered = db.get_bind().dialect.name != "sqlite"
+    result = await db.scalars(
+        insert(Message).returning(Message, sort_by_parameter_order=ordered),
+        [{"session_id": session_id, "role": role, "content": content} for session_id, role, content in messages],
+    )
+    return sorted((MessageOut.model_validate(msg) for msg in result.all()), key=lambda msg: msg.id)
+
+
+async def add_messages(db: AsyncSession, session_id: int, messages: Sequence[Tuple[str, str]]) -> List[MessageOut]:
+    """Insert several (role, content) messages of one session in one statement and one transaction."""
+    rows = await insert_messages(db, [(session_id, role, content) for role, content in messages])
+    await db.commit()
+    return rows
+
+
 async def get_messages(db: AsyncSession, session_id: int) -> List[MessageOut]:
     """
     Get all messages for a session and return them as Pydantic models.
@@ -43,7 +73,7 @@ async def get_messages(db: AsyncSession, session_id: int) -> List[MessageOut]:
     result = await db.execute(
         select(Message)
         .where(Message.session_id == session_id)
-        .order_by(Message.created_at.asc())
+        .order_by(Message.id.asc())
     )
     
     # Get all messages and convert to Pydantic models
@@ -52,17 +82,139 @@ async def get_messages(db: AsyncSession, session_id: int) -> List[MessageOut]:
     return [MessageOut.model_validate(msg) for msg in messages]
 
 
-async def get_all_chat_sessions(db: AsyncSession) -> List[ChatSession]:
+async def get_recent_messages(
+    db: AsyncSession,
+    session_id: int,
+    limit: int,
+    after_id: int = 0,
+    before_id: Optional[int] = None
+) -> List[MessageOut]:
     """
-    Get all chat sessions, ordered by creation date (newest first)
+    Get the newest `limit` messages of a session with an id in (`after_id`, `before_id`), oldest first.
+
+    Reads only the tail of the conversation (ORDER BY id DESC LIMIT) instead of the whole
+    history; `before_id` is the keyset cursor for paging further back.
     """
-    result = await db.execute(
-        select(ChatSession)
-        .order_by(desc(ChatSession.created_at))
-    )
+    query = select(Message).where(Message.session_id == session_id, Message.id > after_id)
+    if before_id is not None:
+        query = query.where(Message.id < before_id)
+    result = await db.execute(query.order_by(Message.id.desc()).limit(limit))
+    messages = result.scalars().all()
+    return [MessageOut.model_validate(msg) for msg in reversed(messages)]
+
+
+# Keyset position in the session listing: the (created_at, id) of the last session seen
+SessionCursor = Tuple[datetime, int]
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def session_cursor(session: ChatSession) -> str:
+    """
+    Encode the listing position after `session` as "<created_at in epoch microseconds>_<id>".
+
+    The cursor carries the values themselves, so it stays valid when the session it
+    came from is deleted before the next page is read.
+    """
+    created_at = session.created_at
+    if created_at.tzinfo is None:
+        # SQLite returns the stored UTC timestamps without a zone
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return f"{(created_at - _EPOCH) // timedelta(microseconds=1)}_{session.id}"
+
+
+def parse_session_cursor(cursor: str) -> SessionCursor:
+    """Decode a session_cursor() string; raises ValueError if it is malformed."""
+    micros, _, session_id = cursor.partition("_")
+    return _EPOCH + timedelta(microseconds=int(micros)), int(session_id)
+
+
+def _sessions_query(before: Optional[SessionCursor] = None, limit: Optional[int] = None, dialect: str = ""):
+    """
+    Sessions ordered newest first by (created_at, id), starting after the `before` cursor.
+
+    The cursor is compared as a row value, so ties on created_at are broken by id.
+    """
+    query = select(ChatSession).order_by(ChatSession.created_at.desc(), ChatSession.id.desc())
+    if before is not None:
+        created_at, session_id = before
+        if dialect == "sqlite":
+            # SQLite compares the stored text. CURRENT_TIMESTAMP writes "YYYY-MM-DD HH:MM:SS" in UTC,
+            # which SQLAlchemy's own bind format (always with microseconds) would not compare equal to
+            timestamp_format = "%Y-%m-%d %H:%M:%S.%f" if created_at.microsecond else "%Y-%m-%d %H:%M:%S"
+            cursor_created_at = literal(created_at.strftime(timestamp_format), String)
+        else:
+            cursor_created_at = literal(created_at, ChatSession.created_at.type)
+        query = query.where(
+            tuple_(ChatSession.created_at, ChatSession.id) < tuple_(cursor_created_at, session_id)
+        )
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+async def get_chat_sessions_page(
+    db: AsyncSession, limit: int, before: Optional[SessionCursor] = None
+) -> List[ChatSession]:
+    """
+    Get one page of chat sessions, newest first, using the (created_at, id) index.
+
+    Pass the decoded cursor of the last session of the previous page as `before` to get the next page.
+    """
+    result = await db.execute(_sessions_query(before, limit, db.get_bind().dialect.name))
     return result.scalars().all()
 
 
+async def stream_chat_sessions(
+    db: AsyncSession,
+    before: Optional[SessionCursor] = None,
+    limit: Optional[int] = None,
+    batch_size: int = 1000
+) -> AsyncIterator[ChatSession]:
+    """
+    Yield chat sessions, newest first, without materializing the whole result set.
+
+    Rows are fetched from a server-side cursor `batch_size` at a time.
+    """
+    result = await db.stream_scalars(
+        _sessions_query(before, limit, db.get_bind().dialect.name).execution_options(yield_per=batch_size)
+    )
+    async for session in result:
+        yield session
+
+
+async def delete_chat_sessions(db: AsyncSession, session_ids: Sequence[str]) -> int:
+    """
+    Delete the chat sessions with the given public session ids in one statement.
+
+    Their messages are removed by the database (ON DELETE CASCADE). Returns the
+    number of sessions deleted.
+    """
+    if not session_ids:
+        return 0
+    result = await db.execute(delete(ChatSession).where(ChatSession.session_id.in_(session_ids)))
+    await db.commit()
+    return result.rowcount
+
+
+async def delete_chat_sessions_before(db: AsyncSession, cutoff: datetime, batch_size: int) -> int:
+    """
+    Delete up to `batch_size` of the oldest sessions created before `cutoff`, with their messages.
+
+    Bounded so each call is a short write transaction; call it until it returns less
+    than `batch_size`. Returns the number of sessions deleted.
+    """
+    expired = (
+        select(ChatSession.id)
+        .where(ChatSession.created_at < cutoff)
+        .order_by(ChatSession.created_at, ChatSession.id)
+        .limit(batch_size)
+    )
+    result = await db.execute(delete(ChatSession).where(ChatSession.id.in_(expired)))
+    await db.commit()
+    return result.rowcount
+
+
 async def add_document(db: AsyncSession, filename: str, content: str) -> Document:
     doc = Document(filename=filename, content=content)
     db.add(doc)
@@ -80,4 +232,85 @@ async def list_documents(db: AsyncSession) -> List[DocumentOut]:
     return [DocumentOut.model_validate(doc).model_dump(include=['filename', 'content']) for doc in documents]
 
 
+async def get_document_files(db: AsyncSession) -> Dict[str, Tuple[Optional[str], Optional[int], Optional[float]]]:
+    """The (hash, size, mtime) of every file that has chunks in the documents table, by filename."""
+    result = await db.execute(
+        select(Document.filename, func.max(Document.file_hash), func.max(Document.file_size),
+               func.max(Document.file_mtime))
+        .group_by(Document.filename)
+    )
+    return {filename: (file_hash, size, mtime) for filename, file_hash, size, mtime in result}
+
+
+async def replace_document_chunks(db: AsyncSession, filename: str, chunks: Sequence[dict]) -> None:
+    """
+    Replace the chunks of one file with `chunks` (column values without `filename`).
+
+    One DELETE and one multi-row INSERT; the caller commits.
+    """
+    await db.execute(delete(Document).where(Document.filename == filename))
+    if chunks:
+        await db.execute(insert(Document), [{**chunk, "filename": filename} for chunk in chunks])
+
+
+async def delete_document_files(db: AsyncSession, filenames: Sequence[str]) -> int:
+    """Delete every chunk of the given files; the caller commits. Returns the number of chunks deleted."""
+    if not filenames:
+        return 0
+    result = await db.execute(delete(Document).where(Document.filename.in_(filenames)))
+    return result.rowcount
 
+
+async def stream_document_chunks(db: AsyncSession, batch_size: int = 1000) -> AsyncIterator[Document]:
+    """Stream every chunk ordered by file and chunk number, buffering one batch at a time."""
+    result = await db.stream_scalars(
+        select(Document)
+        .order_by(Document.filename, Document.chunk)
+        .execution_options(yield_per=batch_size)
+    )
+    async for document in result:
+        yield document
+
+
+def _like_search(terms: Sequence[str]):
+    """Unindexed substring search for databases without a full-text index."""
+    content = func.lower(Document.content)
+    found = [content.contains(term, autoescape=True) for term in terms]
+    score = sum((case((condition, 1), else_=0) for condition in found), literal(0, Integer))
+    return select(Document, score.label("score")).where(or_(*found)).order_by(score.desc())
+
+
+async def search_documents(db: AsyncSession, query: str, limit: int = 10) -> List[Tuple[Document, float]]:
+    """
+    Full-text search over the chunk texts, best match first.
+
+    Uses the documents_fts FTS5 table and its BM25 ranking on SQLite, and the GIN
+    index on to_tsvector('simple', content) with ts_rank_cd on PostgreSQL. Other
+    databases fall back to a LIKE scan scored by the number of terms found. A chunk
+    matches if it contains any query term; higher scores are better on all of them.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms or limit <= 0:
+        return []
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        fts = table("documents_fts", column("rowid"))
+        rank = func.bm25(literal_column("documents_fts"))  # lower is better
+        # Quoted terms are plain strings to FTS5, never query syntax
+        match = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        statement = (
+            select(Document, (-rank).label("score"))
+            .join(fts, fts.c.rowid == Document.id)
+            .where(literal_column("documents_fts").op("MATCH")(match))
+            .order_by(rank)
+        )
+    elif dialect == "postgresql":
+        # Must match the indexed expression exactly, so 'simple' is inlined rather than bound
+        vector = func.to_tsvector(literal_column("'simple'"), Document.content)
+        tsquery = func.to_tsquery(literal_column("'simple'"), " | ".join(terms))
+        rank = func.ts_rank_cd(vector, tsquery)
+        statement = select(Document, rank.label("score")).where(vector.op("@@")(tsquery)).order_by(rank.desc())
+    else:
+        statement = _like_search(terms)
+    result = await db.execute(statement.order_by(Document.id).limit(limit))
+    return [(document, float(score)) for document, score in result]
@@ -1,3 +1,5 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
@@ -6,6 +8,13 @@ import uvicorn
 import os
 from src.routers.chat import chat_router
 from src.routers.kb import kb_router
+from src.routers.metrics import metrics_router
+from src.services.kb_indexer import kb_indexer
+from src.config import DB_SINGLE_WRITER
+from src.database import engine
+from src.services.llm_client import open_client, close_client
+from src.services.message_writer import message_writer
+from src.services.session_retention import session_sweeper
 
 """
 Prod ready run:
@@ -13,7 +22,24 @@ Prod ready run:
 
 """
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load and watch the knowledge base in the background instead of on the first chat request
+    await kb_indexer.start()
+    await open_client()
+    # SQLite allows one writer at a time, so funnel message inserts through one task
+    if DB_SINGLE_WRITER and engine.dialect.name == "sqlite":
+        await message_writer.start()
+    # Expire old sessions so the messages table does not grow without bound
+    await session_sweeper.start()
+    yield
+    await session_sweeper.stop()
+    await message_writer.stop()
+    await close_client()
+    await kb_indexer.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Set up static files and templates
 app.mount("/static", StaticFiles(directory=os.path.join(os.path.dirname(__file__), "static")), name="static")
@@ -22,6 +48,7 @@ templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), "t
 # Include routers
 app.include_router(chat_router)
 app.include_router(kb_router)
+app.include_router(metrics_router)
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
@@ -1,5 +1,7 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, event
+from sqlalchemy import (
+    DDL, BigInteger, Column, Float, Integer, String, Text, ForeignKey, DateTime, Index, event, text,
+)
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declared_attr
@@ -13,18 +15,31 @@ metadata.clear()
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
-    __table_args__ = {'extend_existing': True}  # Allow table extension if it exists
+    __table_args__ = (
+        # Serves the newest-first session listing and its keyset cursor
+        Index("ix_chat_sessions_created_at_id", "created_at", "id"),
+        {'extend_existing': True},  # Allow table extension if it exists
+    )
 
     id = Column(Integer, primary_key=True)
     session_id = Column(String(255), index=True, unique=True, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Rolling summary of the messages that no longer fit the LLM context window,
+    # and the id of the last message folded into it
+    summary = Column(Text, nullable=True)
+    summarized_until = Column(Integer, nullable=False, server_default="0")
 
-    messages = relationship("Message", back_populates="session", cascade="all, delete-orphan")
+    # passive_deletes: the database's ON DELETE CASCADE removes the messages, not the ORM
+    messages = relationship("Message", back_populates="session", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Message(Base):
     __tablename__ = "messages"
-    __table_args__ = {'extend_existing': True}  # Allow table extension if it exists
+    __table_args__ = (
+        # Serves per-session history reads in id order, including keyset pages (id < ?)
+        Index("ix_messages_session_id_id", "session_id", "id"),
+        {'extend_existing': True},  # Allow table extension if it exists
+    )
 
     id = Column(Integer, primary_key=True)
     session_id = Column(Integer, ForeignKey("chat_sessions.id", ondelete="CASCADE"), nullable=False)
@@ -36,13 +51,44 @@ class Message(Base):
 
 
 class Document(Base):
+    """A knowledge base chunk, mirrored from the KB index; `filename` is the source file."""
     __tablename__ = "documents"
-    __table_args__ = {'extend_existing': True}  # Allow table extension if it exists
+    __table_args__ = (
+        # Serves per-file replacement and the ordered cold-start scan
+        Index("ix_documents_filename_chunk", "filename", "chunk"),
+        # Full-text search on PostgreSQL; SQLite uses the documents_fts FTS5 table below
+        Index(
+            "ix_documents_content_fts", text("to_tsvector('simple', content)"), postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+        {'extend_existing': True},  # Allow table extension if it exists
+    )
 
     id = Column(Integer, primary_key=True)
     filename = Column(String(255), nullable=False)
     content = Column(Text, nullable=False)
     added_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Position of the chunk in its file and the file state it was cut from
+    chunk = Column(Integer, nullable=False, server_default="0")
+    file_hash = Column(String(32), nullable=True)
+    file_size = Column(BigInteger, nullable=True)
+    file_mtime = Column(Float, nullable=True)
+
+
+# External-content FTS5 index over documents.content, kept in sync by triggers
+SQLITE_DOCUMENTS_FTS = [
+    "CREATE VIRTUAL TABLE documents_fts USING fts5(content, content='documents', content_rowid='id')",
+    "CREATE TRIGGER documents_fts_insert AFTER INSERT ON documents BEGIN "
+    "INSERT INTO documents_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER documents_fts_delete AFTER DELETE ON documents BEGIN "
+    "INSERT INTO documents_fts(documents_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER documents_fts_update AFTER UPDATE OF content ON documents BEGIN "
+    "INSERT INTO documents_fts(documents_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO documents_fts(rowid, content) VALUES (new.id, new.content); END",
+]
+
+for _statement in SQLITE_DOCUMENTS_FTS:
+    event.listen(Document.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+event.listen(Document.__table__, 'before_drop', DDL("DROP TABLE IF EXISTS documents_fts").execute_if(dialect='sqlite'))
 
 # This ensures tables are created only once
 @event.listens_for(Base.metadata, 'before_create')
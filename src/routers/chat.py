@@ -1,28 +1,37 @@
+import json
+from contextlib import aclosing
+from typing import AsyncIterator, Literal, Optional
 from uuid import uuid4
 
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi import Request, Response, status
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import Request, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
 from fastapi.templating import Jinja2Templates
+from pydantic import ValidationError
 from pathlib import Path
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import delete
 from src.constants import SESSION_COOKIE_NAME
 from src.database import get_session
-from src.database_operations import add_message, create_chat_session, get_chat_session, get_messages, get_all_chat_sessions
-from src.models import Message
-from src.schemas import ChatRequest, ChatResponse, ChatSessionOut
-from src.services.chat_service import generate_ai_response
+from src.database_operations import add_message, create_chat_session, get_chat_session, get_recent_messages
+from src.database_operations import delete_chat_sessions, get_chat_sessions_page, stream_chat_sessions
+from src.database_operations import parse_session_cursor, session_cursor
+from src.schemas import ChatRequest, ChatResponse, ChatSessionOut, DeleteSessionsRequest
+from src.services.chat_service import generate_ai_response, load_conversation, stream_ai_response
 
 templates = Jinja2Templates(directory=str(Path(__file__).parent.parent / "templates"))
 chat_router = APIRouter(prefix="/chat")
 
+# Default and maximum number of messages per history page
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+# Default and maximum number of sessions per listing page
+SESSIONS_PAGE_SIZE = 50
+SESSIONS_MAX_PAGE_SIZE = 500
 
 
-@chat_router.post("/", response_model=ChatResponse)
-async def chat(req: ChatRequest,
-               request: Request,
-               response: Response,
-               db: AsyncSession = Depends(get_session)):
+
+async def resolve_chat_session(request: Request, response: Response, db: AsyncSession):
+    """Load the chat session named by the session cookie, creating it (and the cookie) if needed."""
     # Create or load session
     session_id = request.cookies.get(SESSION_COOKIE_NAME)
     if not session_id:
@@ -52,13 +61,21 @@ async def chat(req: ChatRequest,
                 samesite="Lax",
                 path="/",
             )
+    return chat_session
 
 
-    # # fetch previous messages
-    history = await get_messages(db, chat_session.id)
-    history_dicts = [msg.model_dump() for msg in history]
+@chat_router.post("/", response_model=ChatResponse)
+async def chat(req: ChatRequest,
+               request: Request,
+               response: Response,
+               db: AsyncSession = Depends(get_session)):
+    chat_session = await resolve_chat_session(request, response, db)
+
+    # # fetch previous messages (the recent window only; older turns live in the summary)
+    conversation = await load_conversation(db, chat_session)
+    history_dicts = [msg.model_dump() for msg in conversation.messages]
 
-    agent_reply = await generate_ai_response(db, chat_session.id, req.message)
+    agent_reply = await generate_ai_response(db, chat_session.id, req.message, conversation=conversation)
 
     # Convert MessageOut objects to dictionaries before returning
 
@@ -69,19 +86,117 @@ async def chat(req: ChatRequest,
     )
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@chat_router.post("/stream")
+async def chat_stream(req: ChatRequest,
+                      request: Request,
+                      response: Response,
+                      db: AsyncSession = Depends(get_session)):
+    """
+    Stream the AI reply as Server-Sent Events.
+
+    Emits a ``token`` event per token as it arrives from the LLM, then a ``done``
+    event (or an ``error`` event). The assistant message is saved when the stream ends.
+    """
+    chat_session = await resolve_chat_session(request, response, db)
+    conversation = await load_conversation(db, chat_session)
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async with aclosing(stream_ai_response(db, chat_session.id, req.message, conversation=conversation)) as tokens:
+                async for token in tokens:
+                    yield _sse("token", {"content": token})
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+            return
+        yield _sse("done", {"session_id": chat_session.session_id})
+
+    stream = StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # A returned response does not inherit headers set on the injected one
+    for key, value in response.raw_headers:
+        if key == b"set-cookie":
+            stream.raw_headers.append((key, value))
+    return stream
+
+
+async def _load_or_create_session(db: AsyncSession, session_id: str):
+    chat_session = await get_chat_session(db, session_id)
+    if not chat_session:
+        chat_session = await create_chat_session(db, session_id)
+    return chat_session
+
+
+@chat_router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket, db: AsyncSession = Depends(get_session)):
+    """
+    Chat over a WebSocket, streaming the reply token by token.
+
+    The client sends ``{"message": ...}`` frames and receives ``session``,
+    ``token``, ``done`` and ``error`` frames. The session comes from the session
+    cookie or a ``session_id`` query parameter, and is created if missing.
+
+    The database session is closed after every message, so an idle socket holds no
+    pooled connection and no open transaction between messages.
+    """
+    await websocket.accept()
+    session_id = websocket.cookies.get(SESSION_COOKIE_NAME) or websocket.query_params.get("session_id")
+    session_id = (await _load_or_create_session(db, session_id or str(uuid4()))).session_id
+    await db.close()
+    await websocket.send_json({"type": "session", "session_id": session_id})
+
+    try:
+        while True:
+            try:
+                req = ChatRequest.model_validate(await websocket.receive_json())
+            except (ValidationError, ValueError) as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+            try:
+                # Re-read every turn: the summary may have moved on, or the session been deleted
+                chat_session = await _load_or_create_session(db, session_id)
+                conversation = await load_conversation(db, chat_session)
+                async with aclosing(stream_ai_response(db, chat_session.id, req.message, conversation=conversation)) as tokens:
+                    async for token in tokens:
+                        await websocket.send_json({"type": "token", "content": token})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+            finally:
+                # Ends the read transaction and returns the connection to the pool
+                await db.close()
+            await websocket.send_json({"type": "done"})
+    except WebSocketDisconnect:
+        pass
+
+
 @chat_router.get("/{session_id}/history")
 async def get_chat_history(
     session_id: str,
+    response: Response,
+    before: Optional[int] = Query(None, description="Return messages older than this message id"),
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
     db: AsyncSession = Depends(get_session)
 ):
     """
-    Retrieve message history for a specific chat session.
+    Retrieve message history for a specific chat session, one page at a time.
 
     Args:
         session_id: The ID of the chat session
+        before: Keyset cursor; only messages with a smaller id are returned
+        limit: Maximum number of messages in the page
 
     Returns:
-        List of messages in the chat history
+        The newest `limit` messages before the cursor, oldest first. When older
+        messages may exist, the ``X-Next-Before`` header holds the cursor for the next page.
     """
     # Get the chat session
     chat_session = await get_chat_session(db, session_id)
@@ -91,27 +206,55 @@ async def get_chat_history(
             detail="Chat session not found"
         )
 
-    # Get messages for the session
-    messages = await get_messages(db, chat_session.id)
+    # Get one page of messages for the session (served by the (session_id, id) index)
+    messages = await get_recent_messages(db, chat_session.id, limit=limit, before_id=before)
+    if len(messages) == limit:
+        response.headers["X-Next-Before"] = str(messages[0].id)
 
     # Convert messages to dictionaries
     return [msg.model_dump() for msg in messages]
 
 
+def _session_summary(session) -> dict:
+    return {
+        "session_id": session.session_id,
+        "created_at": session.created_at.isoformat() if session.created_at else None
+    }
+
+
 @chat_router.get("/sessions")
 async def list_chat_sessions(
-    request: Request,
+    response: Response,
+    cursor: Optional[str] = Query(None, description="Return sessions after this cursor (from X-Next-Cursor)"),
+    limit: Optional[int] = Query(None, ge=1, le=SESSIONS_MAX_PAGE_SIZE),
+    format: Literal["json", "ndjson"] = "json",
     db: AsyncSession = Depends(get_session)
 ):
-    """List all chat sessions"""
-    sessions = await get_all_chat_sessions(db)
-    return [
-        {
-            "session_id": session.session_id,
-            "created_at": session.created_at.isoformat() if session.created_at else None
-        }
-        for session in sessions
-    ]
+    """
+    List chat sessions, newest first.
+
+    In ``json`` format a page of at most `limit` sessions is returned, and the
+    ``X-Next-Cursor`` header holds the cursor for the next page when there may be one.
+    In ``ndjson`` format all sessions after the cursor (or `limit` of them) are
+    streamed one JSON object per line, without loading them all into memory.
+    """
+    try:
+        before = parse_session_cursor(cursor) if cursor is not None else None
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    if format == "ndjson":
+        async def lines() -> AsyncIterator[str]:
+            async for session in stream_chat_sessions(db, before=before, limit=limit):
+                yield json.dumps(_session_summary(session)) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    limit = limit or SESSIONS_PAGE_SIZE
+    sessions = await get_chat_sessions_page(db, limit, before=before)
+    if len(sessions) == limit:
+        response.headers["X-Next-Cursor"] = session_cursor(sessions[-1])
+    return [_session_summary(session) for session in sessions]
 
 
 @chat_router.delete("/sessions/{session_id}")
@@ -120,24 +263,26 @@ async def delete_chat_session(
     db: AsyncSession = Depends(get_session)
 ):
     """Delete a chat session and all its messages"""
-    session = await get_chat_session(db, session_id)
-    if not session:
+    # One DELETE; the messages go with it through ON DELETE CASCADE
+    if not await delete_chat_sessions(db, [session_id]):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Chat session not found"
         )
 
-    # Delete messages first due to foreign key constraint
-    await db.execute(
-        delete(Message).where(Message.session_id == session.id)
-    )
-    # Then delete the session
-    await db.delete(session)
-    await db.commit()
-
     return {"status": "success", "message": "Session deleted successfully"}
 
 
+@chat_router.post("/sessions/delete")
+async def delete_chat_sessions_bulk(
+    req: DeleteSessionsRequest,
+    db: AsyncSession = Depends(get_session)
+):
+    """Delete many chat sessions and their messages in one statement"""
+    deleted = await delete_chat_sessions(db, req.session_ids)
+    return {"status": "success", "deleted": deleted}
+
+
 @chat_router.get("/sessions/page")
 async def view_chat_sessions(request: Request):
     """Render the chat sessions page"""
@@ -1,8 +1,115 @@
-from fastapi import APIRouter
-from src.services.kb_service import load_kb_documents
+import json
+from typing import Iterator, Literal, Optional
+
+import numpy as np
+from fastapi import APIRouter, Query, Response
+from fastapi.responses import StreamingResponse
+from src.services.chunk_store import ChunkStore
+from src.services.kb_service import get_knowledge_base
 
 kb_router = APIRouter(prefix="/kb")
 
+# Default and maximum number of chunks or files per listing page
+KB_PAGE_SIZE = 100
+KB_MAX_PAGE_SIZE = 1000
+
+
+def _chunk_summary(store: ChunkStore, row: int, include_content: bool) -> dict:
+    metadata = store.file_metadata(row)
+    summary = {
+        "id": row,
+        "source": metadata.get("source"),
+        "chunk": int(store.chunk_numbers[row]),
+        # Read from the offsets, so summaries never decode the text
+        "size": int(store.offsets[row + 1] - store.offsets[row]),
+    }
+    if include_content:
+        summary["content"] = store.chunk_text(row)
+    return summary
+
+
+def _file_summary(store: ChunkStore, file_id: int, chunk_counts: np.ndarray) -> dict:
+    metadata = store.files[file_id]
+    return {
+        "id": file_id,
+        "source": metadata.get("source"),
+        "hash": metadata.get("hash"),
+        "size": metadata.get("size"),
+        "last_modified": metadata.get("last_modified"),
+        "chunks": int(chunk_counts[file_id]),
+    }
+
+
+def _page(response: Response, generation: int, cursor: int, limit: int, total: int) -> range:
+    """The ids of one page; sets X-Next-Cursor when more follow."""
+    rows = range(cursor, min(cursor + limit, total))
+    if rows.stop < total:
+        response.headers["X-Next-Cursor"] = str(rows.stop)
+    response.headers["X-KB-Generation"] = str(generation)
+    return rows
+
+
+def _ndjson(summaries: Iterator[dict], generation: int) -> StreamingResponse:
+    # A plain iterator is consumed in the threadpool, so a full export does not block the event loop
+    return StreamingResponse(
+        (json.dumps(summary) + "\n" for summary in summaries),
+        media_type="application/x-ndjson",
+        headers={"X-KB-Generation": str(generation)},
+    )
+
+
 @kb_router.get("/")
-def get_kb():
-    return {"documents": load_kb_documents()}
+async def list_kb_chunks(
+    response: Response,
+    cursor: int = Query(0, ge=0, description="Return chunks from this cursor on (from X-Next-Cursor)"),
+    limit: Optional[int] = Query(None, ge=1, le=KB_MAX_PAGE_SIZE),
+    include_content: bool = False,
+    format: Literal["json", "ndjson"] = "json",
+):
+    """
+    List the chunks of the loaded knowledge base index, in index order.
+
+    Each chunk is summarized by its source file, chunk number and size in bytes;
+    `include_content` adds its text. In ``json`` format a page of at most `limit`
+    chunks is returned, and the ``X-Next-Cursor`` header holds the cursor for the
+    next page when there is one. In ``ndjson`` format all chunks from the cursor
+    (or `limit` of them) are streamed one JSON object per line.
+
+    Cursors are positions in one index generation, named by the ``X-KB-Generation``
+    header; after a reindex, restart from the beginning.
+    """
+    kb = get_knowledge_base()
+    # One store for the whole request, even if a reindex swaps the index meanwhile
+    store = kb.store
+    if format == "ndjson":
+        stop = len(store) if limit is None else min(cursor + limit, len(store))
+        return _ndjson(
+            (_chunk_summary(store, row, include_content) for row in range(cursor, stop)), kb.generation
+        )
+
+    rows = _page(response, kb.generation, cursor, limit or KB_PAGE_SIZE, len(store))
+    return [_chunk_summary(store, row, include_content) for row in rows]
+
+
+@kb_router.get("/files")
+async def list_kb_files(
+    response: Response,
+    cursor: int = Query(0, ge=0, description="Return files from this cursor on (from X-Next-Cursor)"),
+    limit: Optional[int] = Query(None, ge=1, le=KB_MAX_PAGE_SIZE),
+    format: Literal["json", "ndjson"] = "json",
+):
+    """
+    List the files of the loaded knowledge base index with their hash, size, mtime
+    and number of chunks. Paginated and streamed like ``GET /kb/``.
+    """
+    kb = get_knowledge_base()
+    store = kb.store
+    chunk_counts = np.bincount(store.file_ids, minlength=len(store.files))
+    if format == "ndjson":
+        stop = len(store.files) if limit is None else min(cursor + limit, len(store.files))
+        return _ndjson(
+            (_file_summary(store, file_id, chunk_counts) for file_id in range(cursor, stop)), kb.generation
+        )
+
+    file_ids = _page(response, kb.generation, cursor, limit or KB_PAGE_SIZE, len(store.files))
+    return [_file_summary(store, file_id, chunk_counts) for file_id in file_ids]
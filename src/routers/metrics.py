@@ -0,0 +1,20 @@
+from fastapi import APIRouter
+from src.services.chat_service import llm_calls
+from src.services.kb_service import get_knowledge_base, retrieval_cache
+from src.services.response_cache import response_cache
+
+metrics_router = APIRouter(prefix="/metrics")
+
+@metrics_router.get("/")
+def get_metrics():
+    """Counters of this worker process"""
+    return {
+        "response_cache": response_cache.stats(),
+        "llm_coalescing": llm_calls.stats(),
+        "kb_retrieval_cache": {
+            "generation": get_knowledge_base().generation,
+            "entries": len(retrieval_cache),
+            "hits": retrieval_cache.hits,
+            "misses": retrieval_cache.misses,
+        },
+    }
@@ -24,6 +24,9 @@ class ChatRequest(BaseModel):
     session_id: Optional[str] = Field(None, description="Existing session ID. If not provided, a new session will be created")
     message: str = Field(..., description="User's message content")
 
+class DeleteSessionsRequest(BaseModel):
+    session_ids: List[str] = Field(..., max_length=1000, description="Session IDs to delete")
+
 # Response schemas
 class MessageOut(MessageBase):
     id: int
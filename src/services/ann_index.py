@@ -0,0 +1,219 @@
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+from src.services.chunk_store import save_array
+
+# Points fed to k-means per centroid; larger corpora are subsampled for training
+TRAIN_POINTS_PER_CENTROID = 64
+KMEANS_ITERATIONS = 10
+# Product quantization codebooks have one byte per code
+PQ_CENTROIDS = 256
+
+
+def _assign(data: np.ndarray, centroids: np.ndarray, block: int = 16384) -> np.ndarray:
+    """Index of the nearest (L2) centroid of every row, block by block to bound memory."""
+    half_norms = 0.5 * np.einsum('ij,ij->i', centroids, centroids)
+    labels = np.empty(len(data), dtype=np.int32)
+    for start in range(0, len(data), block):
+        chunk = np.asarray(data[start:start + block], dtype=np.float32)
+        labels[start:start + block] = np.argmax(chunk @ centroids.T - half_norms, axis=1)
+    return labels
+
+
+def _kmeans(data: np.ndarray, k: int, rng: np.random.Generator, iterations: int = KMEANS_ITERATIONS) -> np.ndarray:
+    """Lloyd's k-means; empty clusters are re-seeded with random points."""
+    centroids = data[rng.choice(len(data), k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        labels = _assign(data, centroids)
+        order = np.argsort(labels, kind='stable')
+        counts = np.bincount(labels, minlength=k)
+        filled = np.flatnonzero(counts)
+        sums = np.add.reduceat(data[order], np.concatenate([[0], np.cumsum(counts)[:-1]])[filled], axis=0)
+        centroids[filled] = sums / counts[filled, None]
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest neighbour index over row-normalized embeddings.
+
+    k-means splits the vectors into ``nlist`` cells; a query only scores the rows of
+    the ``nprobe`` cells whose centroids are closest to it, so the work per query is
+    about nprobe / nlist of an exact scan. Rows of cell ``c`` are
+    ``rows[offsets[c]:offsets[c + 1]]``.
+
+    Without quantization the index keeps a cell-ordered copy of the vectors, so every
+    probed cell is scored from one contiguous block; it is saved next to the index
+    and memory-mapped when loaded, so workers share it instead of each copying it. With ``pq_subspaces`` set, rows
+    are product-quantized instead: the residual from the cell centroid is split into
+    that many subvectors, each stored as a one-byte code, and scored through per-query
+    lookup tables without touching the embedding matrix. ``rerank`` then re-scores
+    that many of the best candidates exactly.
+    """
+
+    def __init__(self, nlist: int, nprobe: int = 8, pq_subspaces: int = 0, rerank: int = 0, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_subspaces = pq_subspaces
+        self.rerank = rerank
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self.codebooks: Optional[np.ndarray] = None  # (pq_subspaces, PQ_CENTROIDS, dim / pq_subspaces)
+        self.trained_size = 0
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.rows = np.empty(0, dtype=np.int32)
+        self.codes: Optional[np.ndarray] = None  # (rows, pq_subspaces) uint8, in self.rows order
+        self.vectors: Optional[np.ndarray] = None  # the embedding matrix the index was built over
+        self.cell_vectors: Optional[np.ndarray] = None  # vectors[rows], only without quantization
+
+    @property
+    def kind(self) -> str:
+        return 'ivfpq' if self.pq_subspaces else 'ivf'
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def train(self, embeddings: np.ndarray) -> 'IVFIndex':
+        """Learn the coarse centroids (and PQ codebooks) from a sample of the embeddings."""
+        rng = np.random.default_rng(self.seed)
+        n, dim = embeddings.shape
+        self.nlist = max(1, min(self.nlist, n))
+        sample_size = min(n, self.nlist * TRAIN_POINTS_PER_CENTROID)
+        sample = np.asarray(embeddings[np.sort(rng.choice(n, sample_size, replace=False))], dtype=np.float32)
+        self.centroids = _kmeans(sample, self.nlist, rng)
+        if self.pq_subspaces:
+            if dim % self.pq_subspaces:
+                raise ValueError(f"pq_subspaces={self.pq_subspaces} does not divide the dimension {dim}")
+            residuals = sample - self.centroids[_assign(sample, self.centroids)]
+            sub = residuals.reshape(len(sample), self.pq_subspaces, -1)
+            k = min(PQ_CENTROIDS, len(sample))
+            self.codebooks = np.stack([_kmeans(sub[:, m], k, rng) for m in range(self.pq_subspaces)])
+        self.trained_size = n
+        return self
+
+    def add(self, embeddings: np.ndarray) -> 'IVFIndex':
+        """Return a copy of this trained index holding `embeddings`, which replace any previous contents."""
+        index = IVFIndex(self.nlist, self.nprobe, self.pq_subspaces, self.rerank, self.seed)
+        index.centroids, index.codebooks, index.trained_size = self.centroids, self.codebooks, self.trained_size
+        labels = _assign(embeddings, self.centroids)
+        index.rows = np.argsort(labels, kind='stable').astype(np.int32)
+        index.offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=self.nlist))]).astype(np.int64)
+        if self.codebooks is not None:
+            index.codes = np.empty((len(embeddings), self.pq_subspaces), dtype=np.uint8)
+            for start in range(0, len(embeddings), 16384):
+                rows = index.rows[start:start + 16384]
+                residuals = np.asarray(embeddings[rows], dtype=np.float32) - self.centroids[labels[rows]]
+                sub = residuals.reshape(len(rows), self.pq_subspaces, -1)
+                for m in range(self.pq_subspaces):
+                    index.codes[start:start + len(rows), m] = _assign(sub[:, m], self.codebooks[m])
+        return index._attach(embeddings)
+
+    def _attach(self, vectors: np.ndarray, cell_vectors: Optional[np.ndarray] = None) -> 'IVFIndex':
+        self.vectors = vectors
+        if self.codes is None:
+            if cell_vectors is None:
+                cell_vectors = np.asarray(vectors[self.rows], dtype=np.float32)
+            self.cell_vectors = cell_vectors
+        return self
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, nlist: int, nprobe: int = 8, pq_subspaces: int = 0,
+              rerank: int = 0, seed: int = 0) -> 'IVFIndex':
+        return cls(nlist, nprobe, pq_subspaces, rerank, seed).train(embeddings).add(embeddings)
+
+    def search(self, queries: np.ndarray, top_k: int, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top_k rows for every query as (indices, scores) of shape (queries, k), best first.
+
+        Scores are inner products (exact for flat and reranked candidates, PQ estimates
+        otherwise). Rows are padded with -1 and -inf when the probed cells hold fewer
+        than top_k rows.
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        half_norms = 0.5 * np.einsum('ij,ij->i', self.centroids, self.centroids)
+        coarse = queries @ self.centroids.T
+        probes = np.argpartition(half_norms - coarse, nprobe - 1, axis=1)[:, :nprobe]
+
+        indices = np.full((len(queries), top_k), -1, dtype=np.intp)
+        scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        if self.codes is not None:
+            # Lookup tables: inner products of every query subvector with every codeword
+            tables = np.einsum('qmd,mkd->qmk', queries.reshape(len(queries), self.pq_subspaces, -1), self.codebooks)
+            code_offsets = np.arange(self.pq_subspaces) * self.codebooks.shape[1]
+        for q, (query, cells) in enumerate(zip(queries, probes)):
+            bounds = [(self.offsets[c], self.offsets[c + 1]) for c in cells]
+            candidates = np.concatenate([self.rows[start:end] for start, end in bounds])
+            if not len(candidates):
+                continue
+            if self.codes is None:
+                candidate_scores = np.concatenate([self.cell_vectors[start:end] @ query for start, end in bounds])
+            else:
+                table = tables[q].ravel()
+                candidate_scores = np.concatenate([
+                    coarse[q, c] + table[self.codes[start:end] + code_offsets].sum(axis=1)
+                    for c, (start, end) in zip(cells, bounds)
+                ])
+                if self.rerank and self.vectors is not None:
+                    keep = _best_positions(candidate_scores, max(top_k, self.rerank))
+                    # Ascending rows keep reads of a memory-mapped matrix sequential
+                    candidates = np.sort(candidates[keep])
+                    candidate_scores = np.asarray(self.vectors[candidates], dtype=np.float32) @ query
+            keep = _best_positions(candidate_scores, top_k)
+            order = keep[np.argsort(-candidate_scores[keep], kind='stable')]
+            indices[q, :len(order)] = candidates[order]
+            scores[q, :len(order)] = candidate_scores[order]
+        return indices, scores
+
+    def save(self, path: Path) -> None:
+        """
+        Write the trained quantizers and inverted lists to an .npz file, and the
+        cell-ordered vectors of an unquantized index to an .npy file next to it.
+        """
+        arrays = {
+            'params': np.asarray([self.nlist, self.nprobe, self.pq_subspaces, self.rerank, self.seed,
+                                  self.trained_size], dtype=np.int64),
+            'centroids': self.centroids, 'offsets': self.offsets, 'rows': self.rows,
+        }
+        if self.codebooks is not None:
+            arrays.update(codebooks=self.codebooks, codes=self.codes)
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+        if self.codes is None:
+            save_array(_cells_path(path), np.ascontiguousarray(self.cell_vectors, dtype=np.float32))
+
+    @classmethod
+    def load(cls, path: Path, vectors: np.ndarray) -> 'IVFIndex':
+        """
+        Read an index written by save() and attach the embedding matrix it was built over;
+        the cell-ordered vectors are memory-mapped.
+        """
+        with np.load(path) as data:
+            nlist, nprobe, pq_subspaces, rerank, seed, trained_size = (int(value) for value in data['params'])
+            index = cls(nlist, nprobe, pq_subspaces, rerank, seed)
+            index.centroids, index.offsets, index.rows = data['centroids'], data['offsets'], data['rows']
+            if pq_subspaces:
+                index.codebooks, index.codes = data['codebooks'], data['codes']
+        index.trained_size = trained_size
+        cell_vectors = None
+        if not pq_subspaces:
+            cell_vectors = np.load(_cells_path(path), mmap_mode='r')
+            if cell_vectors.shape != (len(index.rows), vectors.shape[1]):
+                raise ValueError(f"{_cells_path(path)} does not match the index")
+        return index._attach(vectors, cell_vectors)
+
+
+def _cells_path(path: Path) -> Path:
+    """Where save() puts the cell-ordered vectors of the index saved at `path`."""
+    return path.with_name(f"{path.stem}_cells.npy")
+
+
+def _best_positions(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k largest scores, in no particular order."""
+    if k >= len(scores):
+        return np.arange(len(scores))
+    return np.argpartition(-scores, k - 1)[:k]
@@ -1,12 +1,26 @@
-from typing import List, Dict, Optional
+import hashlib
+import json
+import logging
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.orm.attributes import set_committed_value
 
-from src.models import Message
+from src.config import (
+    MODEL_NAME, CONTEXT_MAX_MESSAGES, CONTEXT_TOKEN_BUDGET, SUMMARY_TOKEN_BUDGET, SUMMARY_FOLD_SLACK,
+    KB_LEXICAL_BACKEND,
+)
+from src.database_operations import add_messages, get_recent_messages
+from src.models import ChatSession, Message
 from src.schemas import MessageOut
-from src.services.llm_client import ask_openrouter
+from src.services.llm_client import ask_openrouter, stream_openrouter
+from src.services.message_writer import message_writer
+from src.services.response_cache import context_fingerprint, response_cache
+from src.utils.singleflight import SingleFlight
 from src.services.kb_service import get_knowledge_base
+from src.services.kb_indexer import kb_indexer
+from src.services.kb_mirror import get_database_context
 
 SYSTEM_PROMPT = """You are a helpful assistant that answers questions based on the provided context. 
 
@@ -26,6 +40,17 @@ USER QUESTION: {question}
 YOUR RESPONSE (based on the context above):"""
 
 
+logger = logging.getLogger(__name__)
+
+# Concurrent requests with an identical prompt share one upstream LLM call
+llm_calls = SingleFlight()
+
+
+def prompt_fingerprint(message_dicts: List[dict]) -> str:
+    """Key of the exact prompt (messages and model) sent to the LLM."""
+    payload = json.dumps([MODEL_NAME, message_dicts], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
 
 async def save_message(db: AsyncSession, session_id: int, role: str, content: str) -> Message:
     """Save a message to the database."""
@@ -41,26 +66,229 @@ async def get_messages(db: AsyncSession, session_id: int) -> List[MessageOut]:
     result = await db.execute(
         select(Message)
         .where(Message.session_id == session_id)
-        .order_by(Message.created_at.asc())
+        .order_by(Message.id.asc())
     )
     messages = result.scalars().all()
     return [MessageOut.model_validate(msg) for msg in messages]
 
 
-def get_knowledge_context(question: str, top_k: int = 3) -> str:
-    """Get relevant context from the knowledge base for the given question."""
+async def get_knowledge_context(question: str, top_k: int = 3, db: Optional[AsyncSession] = None) -> str:
+    """
+    Get relevant context from the knowledge base for the given question.
+
+    With KB_LEXICAL_BACKEND=database and a `db` session, the lexical ranking comes
+    from the database's full-text index of the mirrored chunks.
+    """
     kb = get_knowledge_base()
-    if not kb.documents:
-        kb.load_documents()
+    # The background indexer owns loading when it runs; never build on the request path then
+    if not kb.documents and not kb_indexer.running:
+        kb.load_or_build()
+    if db is not None and KB_LEXICAL_BACKEND == "database":
+        return await get_database_context(db, kb, question, top_k=top_k)
     return kb.get_relevant_context(question, top_k=top_k)
 
 
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about four characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def _gist(content: str, limit: int = 200) -> str:
+    """First sentence of a message, capped at `limit` characters."""
+    text = " ".join(content.split())
+    for end in (". ", "? ", "! "):
+        cut = text.find(end)
+        if 0 < cut < limit:
+            return text[:cut + 1]
+    return text if len(text) <= limit else text[:limit].rstrip() + "..."
+
+
+def _summary_lines(messages: List[MessageOut]) -> List[str]:
+    return [f"{msg.role}: {_gist(msg.content)}" for msg in messages]
+
+
+def fold_into_summary(summary: Optional[str], messages: List[MessageOut], budget: int = SUMMARY_TOKEN_BUDGET) -> str:
+    """
+    Append the gist of `messages` to a rolling summary, keeping it within `budget` tokens.
+
+    Only the newly evicted messages are processed, so the summary is updated
+    incrementally rather than recomputed; the oldest lines fall off first.
+    """
+    lines = summary.splitlines() if summary else []
+    lines.extend(_summary_lines(messages))
+    while lines and estimate_tokens("\n".join(lines)) > budget:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class ConversationContext:
+    """
+    The part of a conversation that is sent to the LLM.
+
+    `messages` are the most recent messages that fit the context window; older
+    messages are represented only by the session's rolling `summary`. When this
+    turn pushed messages out of the window, `summary` and `summarized_until` hold
+    the updated values that save_turn() persists.
+    """
+
+    def __init__(self, chat_session: Optional[ChatSession], messages: List[MessageOut],
+                 summary: Optional[str], summarized_until: int, summary_changed: bool = False):
+        self.chat_session = chat_session
+        self.messages = messages
+        self.summary = summary
+        self.summarized_until = summarized_until
+        self.summary_changed = summary_changed
+
+
+async def load_conversation(
+    db: AsyncSession,
+    chat_session: ChatSession,
+    max_messages: int = CONTEXT_MAX_MESSAGES,
+    token_budget: int = CONTEXT_TOKEN_BUDGET
+) -> ConversationContext:
+    """
+    Load the bounded context window for a session, usually with a single LIMIT query.
+
+    Only messages newer than the summarized prefix are read, newest first, capped at
+    the window size plus some slack for messages that are about to be folded. The
+    newest messages are kept while they fit `max_messages` and `token_budget`; the
+    rest of the fetched tail is folded into the rolling summary.
+
+    If the tail does not reach back to the summarized prefix (a long session that
+    predates the summary), the unsummarized messages before it are folded as well.
+    They are paged backwards only until they alone fill SUMMARY_TOKEN_BUDGET, since
+    anything older would fall off the summary anyway.
+    """
+    summarized_until = chat_session.summarized_until or 0
+    limit = max_messages + SUMMARY_FOLD_SLACK
+    tail = await get_recent_messages(db, chat_session.id, limit=limit, after_id=summarized_until)
+
+    gap: List[MessageOut] = []
+    older = tail
+    while len(older) == limit and estimate_tokens("\n".join(_summary_lines(gap))) <= SUMMARY_TOKEN_BUDGET:
+        older = await get_recent_messages(
+            db, chat_session.id, limit=limit, after_id=summarized_until, before_id=older[0].id
+        )
+        gap[:0] = older
+
+    kept = 0
+    tokens = 0
+    for msg in reversed(tail):
+        tokens += estimate_tokens(msg.content)
+        if kept == max_messages or tokens > token_budget:
+            break
+        kept += 1
+
+    evicted = gap + tail[:len(tail) - kept]
+    recent = tail[len(tail) - kept:]
+    if not evicted:
+        return ConversationContext(chat_session, recent, chat_session.summary, summarized_until)
+    return ConversationContext(
+        chat_session,
+        recent,
+        fold_into_summary(chat_session.summary, evicted),
+        evicted[-1].id,
+        summary_changed=True,
+    )
+
+
+async def prepare_llm_messages(
+    db: AsyncSession,
+    session_id: int,
+    user_message: str,
+    use_knowledge_base: bool = True,
+    conversation: Optional[ConversationContext] = None
+) -> Tuple[List[dict], ConversationContext, str]:
+    """
+    Build the message list to send to the LLM.
+
+    Pass the `conversation` if the caller already loaded it; it is only queried
+    when missing. Nothing is written: the turn is saved by save_turn() afterwards.
+    Also returns the fingerprint of the prompt apart from the question (KB context
+    and prior messages), which keys the response cache.
+    """
+    # 1. Get the bounded conversation window
+    if conversation is None:
+        conversation = await load_conversation(db, await db.get(ChatSession, session_id))
+    
+    # 2. Prepare messages for the LLM
+    message_dicts = [{"role": msg.role, "content": msg.content} for msg in conversation.messages]
+    message_dicts.append({"role": "user", "content": user_message})
+    if conversation.summary:
+        message_dicts.insert(0, {
+            "role": "system",
+            "content": f"Summary of the earlier conversation:\n{conversation.summary}",
+        })
+    
+    # 3. Get relevant context from knowledge base if enabled
+    context = await get_knowledge_context(user_message, 10, db) if use_knowledge_base else ""
+    context_hash = context_fingerprint(context, message_dicts[:-1])
+    if context:
+        system_prompt = SYSTEM_PROMPT.format(
+            context=context,
+            question=user_message
+        )
+        # Insert system prompt at the beginning
+        message_dicts.insert(0, {"role": "assistant", "content": system_prompt})
+    return message_dicts, conversation, context_hash
+
+
+async def save_turn(
+    db: AsyncSession,
+    session_id: int,
+    user_message: str,
+    ai_reply: Optional[str],
+    conversation: Optional[ConversationContext] = None
+) -> List[MessageOut]:
+    """
+    Save the user message, the assistant reply and any summary update in one transaction.
+
+    With no `ai_reply` (the LLM call failed) only the user message is saved, so the
+    question stays in the history. When the message writer is running the write is group-committed by it; otherwise
+    it is committed on `db`.
+    """
+    messages = [("user", user_message)]
+    if ai_reply is not None:
+        messages.append(("assistant", ai_reply))
+    session_values = None
+    if conversation is not None and conversation.summary_changed:
+        session_values = {
+            "summary": conversation.summary,
+            "summarized_until": conversation.summarized_until,
+        }
+
+    if message_writer.running:
+        rows = await message_writer.submit(session_id, messages, session_values)
+        if session_values:
+            # Already written by the writer; keep the loaded object in sync without dirtying it
+            for key, value in session_values.items():
+                set_committed_value(conversation.chat_session, key, value)
+        return rows
+
+    if session_values:
+        # Flushed by the commit in add_messages, together with the inserts
+        for key, value in session_values.items():
+            setattr(conversation.chat_session, key, value)
+    return await add_messages(db, session_id, messages)
+
+
+async def _save_unanswered(
+    db: AsyncSession, session_id: int, user_message: str, conversation: Optional[ConversationContext]
+) -> None:
+    """Save the question of a turn whose LLM call failed; the LLM error is what the caller re-raises."""
+    try:
+        await save_turn(db, session_id, user_message, None, conversation)
+    except Exception:
+        logger.exception("Saving the unanswered user message failed")
+
+
 async def generate_ai_response(
     db: AsyncSession,
     session_id: int,
     user_message: str,
-    use_knowledge_base: bool = True
-) -> tuple[str, List[MessageOut]]:
+    use_knowledge_base: bool = True,
+    conversation: Optional[ConversationContext] = None
+) -> str:
     """
     Generate an AI response to a user message, optionally using the knowledge base.
     
@@ -69,35 +297,76 @@ async def generate_ai_response(
         session_id: ID of the chat session
         user_message: The user's message
         use_knowledge_base: Whether to use the knowledge base for context
+        conversation: Context window already loaded for the session, to avoid querying it again
         
     Returns:
-        A tuple of (ai_reply, message_history)
+        The AI reply
     """
-    # 1. Save user message
-    await save_message(db, session_id, "user", user_message)
-    
-    # 2. Get conversation history
-    messages = await get_messages(db, session_id)
-    
-    # 3. Prepare messages for the LLM
-    message_dicts = [{"role": msg.role, "content": msg.content} for msg in messages]
-    
-    # 4. Get relevant context from knowledge base if enabled
-    if use_knowledge_base:
-        context = get_knowledge_context(user_message, 10)
-        if context:
-            system_prompt = SYSTEM_PROMPT.format(
-                context=context,
-                question=user_message
-            )
-            # Insert system prompt at the beginning
-            message_dicts.insert(0, {"role": "assistant", "content": system_prompt})
-    
-    # 5. Call the LLM
-    ai_reply = ask_openrouter(message_dicts)
-    
-    # 6. Save AI response
-    await save_message(db, session_id, "assistant", ai_reply)
+    message_dicts, conversation, context_hash = await prepare_llm_messages(
+        db, session_id, user_message, use_knowledge_base, conversation
+    )
     
-    # 7. Return the response and updated message history
+    # 4. Call the LLM, unless the same question was already answered against the same context
+    ai_reply = await response_cache.get(user_message, context_hash, MODEL_NAME)
+    if ai_reply is None:
+        async def ask() -> str:
+            reply = await ask_openrouter(message_dicts)
+            await response_cache.set(user_message, context_hash, MODEL_NAME, reply)
+            return reply
+
+        try:
+            # Identical prompts already in flight share that call instead of starting another
+            ai_reply = await llm_calls.do(prompt_fingerprint(message_dicts), ask)
+        except Exception:
+            await _save_unanswered(db, session_id, user_message, conversation)
+            raise
+
+    # 5. Save the user message and AI response
+    await save_turn(db, session_id, user_message, ai_reply, conversation)
     return ai_reply
+
+
+async def stream_ai_response(
+    db: AsyncSession,
+    session_id: int,
+    user_message: str,
+    use_knowledge_base: bool = True,
+    conversation: Optional[ConversationContext] = None
+) -> AsyncIterator[str]:
+    """
+    Stream an AI response token by token; the turn is saved once the stream ends.
+
+    If the upstream stream fails midway, whatever was received is still saved so the
+    history matches what the user saw, and the error is re-raised; if it fails before
+    the first token, the user message is saved alone. A cached reply is
+    yielded as a single token; only complete streams are cached. Concurrent identical
+    prompts share one upstream stream.
+    """
+    message_dicts, conversation, context_hash = await prepare_llm_messages(
+        db, session_id, user_message, use_knowledge_base, conversation
+    )
+
+    cached = await response_cache.get(user_message, context_hash, MODEL_NAME)
+    if cached is not None:
+        await save_turn(db, session_id, user_message, cached, conversation)
+        yield cached
+        return
+
+    async def stream() -> AsyncIterator[str]:
+        tokens = []
+        async for token in stream_openrouter(message_dicts):
+            tokens.append(token)
+            yield token
+        await response_cache.set(user_message, context_hash, MODEL_NAME, "".join(tokens))
+
+    parts = []
+    try:
+        # Identical prompts already streaming subscribe to that stream instead of starting another
+        async for token in llm_calls.stream(prompt_fingerprint(message_dicts), stream):
+            parts.append(token)
+            yield token
+    finally:
+        if parts:
+            await save_turn(db, session_id, user_message, "".join(parts), conversation)
+        else:
+            await _save_unanswered(db, session_id, user_message, conversation)
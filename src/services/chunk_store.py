@@ -0,0 +1,209 @@
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+# Files of a persisted store inside an index generation directory
+STORE_TEXT_FILE = 'chunks.bin'
+STORE_OFFSETS_FILE = 'chunk_offsets.npy'
+STORE_FILE_IDS_FILE = 'chunk_files.npy'
+STORE_CHUNK_NUMBERS_FILE = 'chunk_numbers.npy'
+
+
+def _link_mapped(array, path: Path) -> bool:
+    """
+    Hard-link the file that `array` memory-maps in full to `path`.
+
+    Returns False, without writing anything, if `array` is not a map of a whole
+    file (e.g. it lives in memory or is a slice of a map) or linking fails.
+    """
+    if not isinstance(array, np.memmap) or array.filename is None or not array.flags.c_contiguous:
+        return False
+    try:
+        if array.offset + array.nbytes != os.path.getsize(array.filename):
+            return False
+        os.link(array.filename, path)
+    except OSError:
+        return False
+    return True
+
+
+def save_array(path: Path, array: np.ndarray) -> None:
+    """
+    np.save() an array into an index generation.
+
+    An array that is still the unchanged map of an earlier generation's file is
+    hard-linked instead of written, so carrying it into a new generation costs
+    no I/O and keeps sharing the same page-cache pages.
+    """
+    if not _link_mapped(array, path):
+        np.save(path, array)
+
+
+class Document:
+    __slots__ = ('content', 'metadata')
+
+    def __init__(self, content: str, metadata: Optional[dict] = None):
+        self.content = content
+        self.metadata = metadata or {}
+
+
+class ChunkStore:
+    """
+    Columnar, read-only storage of the chunks of a knowledge base.
+
+    File-level metadata (source, hash, size, mtime) is kept once per file in
+    ``files``. Per chunk there are only array entries: the file it belongs to, its
+    number within the file and its byte range in ``text``, one UTF-8 buffer holding
+    every chunk back to back. A loaded store memory-maps all of them, so worker
+    processes share the page cache instead of holding a copy each.
+
+    Indexing returns a Document built on demand; nothing per chunk lives on the
+    Python heap between searches.
+    """
+
+    def __init__(self, files: List[dict], file_ids: np.ndarray, chunk_numbers: np.ndarray,
+                 offsets: np.ndarray, text):
+        self.files = files
+        self.file_ids = file_ids
+        self.chunk_numbers = chunk_numbers
+        self.offsets = offsets
+        self.text = text
+        self._rows_by_source: Optional[Dict[str, List[int]]] = None
+
+    @classmethod
+    def empty(cls) -> 'ChunkStore':
+        return ChunkStoreBuilder().build()
+
+    def __len__(self) -> int:
+        return len(self.file_ids)
+
+    def __getitem__(self, row: int) -> Document:
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return Document(self.chunk_text(row), self.metadata(row))
+
+    def __iter__(self) -> Iterator[Document]:
+        for row in range(len(self)):
+            yield self[row]
+
+    def chunk_text(self, row: int) -> str:
+        return bytes(self.text[self.offsets[row]:self.offsets[row + 1]]).decode('utf-8')
+
+    def texts(self) -> Iterator[str]:
+        """Every chunk text in row order, decoded one at a time."""
+        for row in range(len(self)):
+            yield self.chunk_text(row)
+
+    def file_metadata(self, row: int) -> dict:
+        """The file-level metadata of a chunk; shared by all chunks of the file."""
+        return self.files[self.file_ids[row]]
+
+    def metadata(self, row: int) -> dict:
+        """A fresh metadata dict of a chunk: its file's metadata plus the chunk number."""
+        return {**self.file_metadata(row), 'chunk': int(self.chunk_numbers[row])}
+
+    def rows_by_source(self) -> Dict[str, List[int]]:
+        """
+        Group the row numbers by the source file they came from.
+
+        Grouped with one stable argsort of the file ids and computed once per store,
+        so a refresh that finds nothing to do costs time per file rather than per chunk.
+        Callers get their own dict, but the row lists are shared and must not be modified.
+        """
+        if self._rows_by_source is None:
+            order = np.argsort(self.file_ids, kind='stable')
+            file_ids, starts = np.unique(np.asarray(self.file_ids)[order], return_index=True)
+            self._rows_by_source = {
+                self.files[file_id].get('source'): rows.tolist()
+                for file_id, rows in zip(file_ids.tolist(), np.split(order, starts[1:]))
+            }
+        return dict(self._rows_by_source)
+
+    def with_files(self, files: List[dict]) -> 'ChunkStore':
+        """The same chunks with a different file table (same order of files); nothing is copied."""
+        store = ChunkStore(files, self.file_ids, self.chunk_numbers, self.offsets, self.text)
+        store._rows_by_source = self._rows_by_source
+        return store
+
+    def save(self, target: Path) -> None:
+        """Write the text buffer and the per-chunk arrays; ``files`` is persisted by the caller."""
+        if not _link_mapped(self.text, target / STORE_TEXT_FILE):
+            with open(target / STORE_TEXT_FILE, 'wb') as f:
+                f.write(memoryview(self.text))
+        save_array(target / STORE_OFFSETS_FILE, self.offsets)
+        save_array(target / STORE_FILE_IDS_FILE, self.file_ids)
+        save_array(target / STORE_CHUNK_NUMBERS_FILE, self.chunk_numbers)
+
+    @classmethod
+    def load(cls, target: Path, files: List[dict]) -> 'ChunkStore':
+        """Memory-map a store written by save(); raises OSError or ValueError if it is damaged."""
+        offsets = np.load(target / STORE_OFFSETS_FILE, mmap_mode='r')
+        file_ids = np.load(target / STORE_FILE_IDS_FILE, mmap_mode='r')
+        chunk_numbers = np.load(target / STORE_CHUNK_NUMBERS_FILE, mmap_mode='r')
+        text_path = target / STORE_TEXT_FILE
+        size = text_path.stat().st_size
+        # An empty file cannot be mapped
+        text = np.memmap(text_path, dtype=np.uint8, mode='r') if size else b''
+        if (len(offsets) != len(file_ids) + 1 or len(chunk_numbers) != len(file_ids)
+                or (len(offsets) and offsets[-1] != size)
+                or (len(file_ids) and file_ids.max() >= len(files))):
+            raise ValueError(f"Inconsistent chunk store in {target}")
+        return cls(files, file_ids, chunk_numbers, offsets, text)
+
+
+class ChunkStoreBuilder:
+    """Accumulate chunks file by file, then pack them into a ChunkStore."""
+
+    def __init__(self):
+        self.files: List[dict] = []
+        self._file_index: Dict[str, int] = {}
+        self._file_ids: List[int] = []
+        self._chunk_numbers: List[int] = []
+        self._lengths: List[int] = []
+        self._parts: List[bytes] = []
+
+    def __len__(self) -> int:
+        return len(self._file_ids)
+
+    def _file_id(self, metadata: dict) -> int:
+        source = metadata.get('source')
+        if source not in self._file_index:
+            self._file_index[source] = len(self.files)
+            self.files.append({key: value for key, value in metadata.items() if key != 'chunk'})
+        return self._file_index[source]
+
+    def _append(self, file_id: int, chunk_number: int, data: bytes) -> None:
+        self._file_ids.append(file_id)
+        self._chunk_numbers.append(chunk_number)
+        self._lengths.append(len(data))
+        self._parts.append(data)
+
+    def add(self, metadata: dict, chunks: Sequence[str]) -> None:
+        """Add the chunks of one file, numbered from 0; files without chunks are not recorded."""
+        if not chunks:
+            return
+        file_id = self._file_id(metadata)
+        for number, chunk in enumerate(chunks):
+            self._append(file_id, number, chunk.encode('utf-8'))
+
+    def extend(self, store: ChunkStore, rows: Sequence[int]) -> None:
+        """Copy rows of another store, with their file metadata, without decoding the text."""
+        for row in rows:
+            start, end = store.offsets[row], store.offsets[row + 1]
+            self._append(self._file_id(store.file_metadata(row)), int(store.chunk_numbers[row]),
+                         bytes(store.text[start:end]))
+
+    def build(self) -> ChunkStore:
+        offsets = np.zeros(len(self._lengths) + 1, dtype=np.int64)
+        np.cumsum(self._lengths, out=offsets[1:])
+        return ChunkStore(
+            self.files,
+            np.asarray(self._file_ids, dtype=np.int32),
+            np.asarray(self._chunk_numbers, dtype=np.int32),
+            offsets,
+            b''.join(self._parts),
+        )
@@ -0,0 +1,78 @@
+import re
+import zlib
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r'\w+')
+_SIGN_BIT = 0x80000000
+
+
+@lru_cache(maxsize=1 << 18)
+def _hash_token(token: str) -> int:
+    """Stable 32-bit hash of a token (crc32 is the same in every process, unlike hash())."""
+    return zlib.crc32(token.encode('utf-8'))
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens of a text."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+class HashingEmbedder:
+    """
+    Deterministic feature-hashing embedder with TF-IDF weighting.
+
+    Tokens are hashed into `dim` buckets with a stable hash; the top bit of the hash
+    picks a +1/-1 sign so colliding tokens tend to cancel rather than pile up.
+    Documents are embedded as L2-normalized sublinear term frequencies, which do not
+    depend on the rest of the corpus, so chunks can be embedded independently (in
+    worker processes, incrementally) and persisted. Corpus statistics enter on the
+    query side only: query vectors are weighted by the IDF of each bucket.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def term_frequencies(self, texts: List[str]) -> np.ndarray:
+        """Build the (len(texts), dim) sublinear term-frequency matrix in one pass."""
+        rows = []
+        hashes = []
+        for i, text in enumerate(texts):
+            tokens = tokenize(text)
+            hashes.extend(map(_hash_token, tokens))
+            rows.extend([i] * len(tokens))
+
+        hashes = np.asarray(hashes, dtype=np.uint32)
+        cells = np.asarray(rows, dtype=np.int64) * self.dim + (hashes % self.dim)
+        signs = np.where(hashes & _SIGN_BIT, -1.0, 1.0)
+        counts = np.bincount(cells, weights=signs, minlength=len(texts) * self.dim)
+        counts = counts.reshape(len(texts), self.dim)
+        return (np.sign(counts) * np.log1p(np.abs(counts))).astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        """Embed document chunks as row-normalized float32 vectors."""
+        return normalize_rows(self.term_frequencies(texts))
+
+    def embed_queries(self, texts: List[str], idf: np.ndarray) -> np.ndarray:
+        """Embed queries, weighting every bucket by its inverse document frequency."""
+        return normalize_rows(self.term_frequencies(texts) * idf)
+
+    @staticmethod
+    def inverse_document_frequency(document_frequency: np.ndarray, documents: int) -> np.ndarray:
+        """Smoothed IDF: log((1 + n) / (1 + df)) + 1."""
+        return (np.log((1.0 + documents) / (1.0 + document_frequency)) + 1.0).astype(np.float32)
+
+    def document_frequency(self, embeddings: np.ndarray, block: int = 65536) -> np.ndarray:
+        """Count the documents that use each bucket, block by block so mmapped matrices stay paged out."""
+        df = np.zeros(self.dim, dtype=np.int64)
+        for start in range(0, embeddings.shape[0], block):
+            df += np.count_nonzero(embeddings[start:start + block], axis=0)
+        return df
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row of a 2-D float32 matrix in place."""
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-9
+    return matrix
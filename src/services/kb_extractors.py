@@ -0,0 +1,249 @@
+"""
+Text extractors for knowledge base files, keyed by file extension.
+
+Every extractor takes the path of a file and a hashlib object, feeds the raw
+bytes of the file to the hasher exactly once and yields the text as a stream
+of pieces, ready for StreamChunker.
+"""
+
+import io
+import re
+import mmap
+import zlib
+import codecs
+import signal
+import hashlib
+import zipfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional
+from xml.etree import ElementTree
+
+# Files are hashed, decoded and chunked in blocks of this many bytes
+READ_BLOCK_SIZE = 1 << 20
+
+Extractor = Callable[[str, object], Iterator[str]]
+
+EXTRACTORS: Dict[str, Extractor] = {}
+
+
+def register_extractor(*extensions: str) -> Callable[[Extractor], Extractor]:
+    """Register an extractor for one or more (lower-case, dotted) file extensions."""
+    def decorator(func: Extractor) -> Extractor:
+        for extension in extensions:
+            EXTRACTORS[extension] = func
+        return func
+    return decorator
+
+
+def extract_text(source: str, hasher) -> Iterator[str]:
+    """Yield the text of `source` using the extractor registered for its extension."""
+    extractor = EXTRACTORS.get(Path(source).suffix.lower(), read_plain_text)
+    return extractor(source, hasher)
+
+
+def needs_isolation(source: str) -> bool:
+    """Binary formats are parsed in worker processes, where a timeout can interrupt them."""
+    return Path(source).suffix.lower() in EXTRACTORS
+
+
+class ExtractionTimeout(Exception):
+    pass
+
+
+@contextmanager
+def time_limit(seconds: Optional[float]):
+    """
+    Raise ExtractionTimeout if the block runs longer than `seconds`.
+
+    Uses SIGALRM, so the limit is only enforced on the main thread of a process
+    (which is where process pool workers run their tasks); elsewhere it is a no-op.
+    """
+    if not seconds or not hasattr(signal, 'SIGALRM') or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def on_alarm(signum, frame):
+        raise ExtractionTimeout(f"timed out after {seconds:g}s")
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def hash_file(source: str, block_size: int = READ_BLOCK_SIZE) -> str:
+    """MD5 of the raw bytes of a file, as every extractor feeds them to its hasher."""
+    hasher = hashlib.md5()
+    with open(source, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def read_plain_text(source: str, hasher, block_size: int = READ_BLOCK_SIZE) -> Iterator[str]:
+    """Read a UTF-8 file block by block, feeding the raw bytes to `hasher` on the way."""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    with open(source, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            hasher.update(block)
+            yield decoder.decode(block)
+    yield decoder.decode(b'', final=True)
+
+
+# --- DOCX: a zip archive whose body text lives in word/document.xml ---
+
+_WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+@register_extractor('.docx')
+def read_docx(source: str, hasher) -> Iterator[str]:
+    """Stream paragraph text out of word/document.xml without building the whole tree."""
+    with open(source, 'rb') as f:
+        data = f.read()
+    hasher.update(data)
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive, archive.open('word/document.xml') as xml:
+        parts = []
+        for event, element in ElementTree.iterparse(xml, events=('end',)):
+            if element.tag == _WORD_NS + 't':
+                parts.append(element.text or '')
+            elif element.tag in (_WORD_NS + 'tab', _WORD_NS + 'br'):
+                parts.append(' ')
+            elif element.tag == _WORD_NS + 'p':
+                parts.append('\n')
+                yield ''.join(parts)
+                parts.clear()
+                element.clear()
+        if parts:
+            yield ''.join(parts)
+
+
+# --- PDF: text-showing operators inside (usually Flate-compressed) content streams ---
+
+_PDF_STREAM_RE = re.compile(rb'>>\s*stream\r?\n')
+# How far back from a "stream" keyword to look for the start of its object
+_PDF_DICT_LOOKBEHIND = 4096
+_PDF_ENDSTREAM = b'endstream'
+_PDF_TEXT_OPERATORS = {b'Tj', b'TJ', b"'", b'"'}
+_PDF_LINE_OPERATORS = {b'T*', b'Td', b'TD', b"'", b'"', b'ET'}
+_PDF_ESCAPES = {ord('n'): b'\n', ord('r'): b'\r', ord('t'): b'\t', ord('b'): b'\b', ord('f'): b'\f'}
+_PDF_DELIMITERS = b'()<>[]{}/% \t\r\n\x00\x0c'
+
+
+@register_extractor('.pdf')
+def read_pdf(source: str, hasher) -> Iterator[str]:
+    """
+    Yield the text of a PDF one content stream at a time.
+
+    The file is memory-mapped, so only one decompressed stream is held at a time.
+    This is a plain-stdlib path: it understands FlateDecode and uncompressed
+    streams and simple (byte or UTF-16) string encodings; text drawn with custom
+    CID font encodings comes out garbled or not at all.
+    """
+    with open(source, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        hasher.update(data)
+        for match in _PDF_STREAM_RE.finditer(data):
+            # The stream dictionary sits between "N 0 obj" and the "stream" keyword
+            obj = data.rfind(b'obj', max(0, match.start() - _PDF_DICT_LOOKBEHIND), match.start())
+            dictionary = data[obj if obj >= 0 else match.start():match.end()]
+            end = data.find(_PDF_ENDSTREAM, match.end())
+            if end < 0:
+                break
+            if b'/Subtype' in dictionary or b'/Type' in dictionary:
+                continue  # images, fonts, object/xref streams: not page content
+            if b'/Filter' in dictionary and b'/FlateDecode' not in dictionary:
+                continue
+            raw = data[match.end():end]
+            try:
+                content = zlib.decompress(raw) if b'/FlateDecode' in dictionary else raw
+            except zlib.error:
+                continue
+            text = ''.join(_iter_pdf_text(content))
+            if text.strip():
+                yield text + '\n'
+
+
+def _iter_pdf_text(content: bytes) -> Iterator[str]:
+    """Tokenize a content stream and yield the strings shown by text operators."""
+    strings = []
+    i, n = 0, len(content)
+    while i < n:
+        c = content[i]
+        if c == 0x28:  # (
+            value, i = _read_pdf_literal(content, i)
+            strings.append(value)
+        elif c == 0x3c and content[i + 1:i + 2] != b'<':  # <hex>
+            end = content.find(b'>', i)
+            if end < 0:
+                break
+            digits = re.sub(rb'\s', b'', content[i + 1:end])
+            strings.append(bytes.fromhex((digits + b'0' * (len(digits) % 2)).decode('ascii', 'ignore')))
+            i = end + 1
+        elif c == 0x25:  # % comment
+            end = content.find(b'\n', i)
+            i = n if end < 0 else end + 1
+        elif c in _PDF_DELIMITERS:
+            i += 1
+        else:
+            start = i
+            while i < n and content[i] not in _PDF_DELIMITERS:
+                i += 1
+            token = content[start:i]
+            if token[:1].isalpha() or token in (b"'", b'"', b'T*'):
+                if token in _PDF_TEXT_OPERATORS and strings:
+                    yield ''.join(_decode_pdf_string(value) for value in strings) + ' '
+                if token in _PDF_LINE_OPERATORS:
+                    yield '\n'
+                strings.clear()
+
+
+def _read_pdf_literal(content: bytes, i: int):
+    """Read a (balanced, escaped) literal string starting at content[i] == '('."""
+    out = bytearray()
+    depth = 0
+    n = len(content)
+    while i < n:
+        c = content[i]
+        if c == 0x5c:  # backslash
+            i += 1
+            if i >= n:
+                break
+            e = content[i]
+            if e in _PDF_ESCAPES:
+                out += _PDF_ESCAPES[e]
+            elif 0x30 <= e <= 0x37:
+                digits = content[i:i + 3]
+                length = 1
+                while length < len(digits) and 0x30 <= digits[length] <= 0x37:
+                    length += 1
+                out.append(int(digits[:length], 8) & 0xFF)
+                i += length - 1
+            elif e not in (0x0a, 0x0d):
+                out.append(e)
+        elif c == 0x28:
+            depth += 1
+            if depth > 1:
+                out.append(c)
+        elif c == 0x29:
+            depth -= 1
+            if depth == 0:
+                return bytes(out), i + 1
+            out.append(c)
+        else:
+            out.append(c)
+        i += 1
+    return bytes(out), n
+
+
+def _decode_pdf_string(value: bytes) -> str:
+    if value.startswith(b'\xfe\xff'):
+        return value[2:].decode('utf-16-be', 'ignore')
+    return value.decode('latin-1')
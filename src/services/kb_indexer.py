@@ -0,0 +1,169 @@
+import asyncio
+import logging
+from typing import Optional
+
+import numpy as np
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.config import KB_PATH, KB_INDEX_PATH, KB_POLL_INTERVAL, KB_DB_MIRROR
+from src.database import async_session
+from src.services.chunk_store import ChunkStore
+from src.services.kb_mirror import load_mirrored_chunks, mirror_chunks
+from src.services.kb_service import (
+    IndexLock, KnowledgeBase, current_index, get_knowledge_base, index_changed, index_exists, set_knowledge_base,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class KnowledgeBaseIndexer:
+    """
+    Background task that keeps the global knowledge base in sync with KB_PATH.
+
+    Every worker process runs an indexer, but only the one holding the IndexLock of
+    `index_path` writes: it refreshes a copy of the live knowledge base in a worker
+    thread, saves it as a new generation and swaps in that generation, memory-mapped,
+    with set_knowledge_base(). The others only open each generation it publishes.
+    Request handlers only ever see a complete index and never wait for a rebuild,
+    and all workers share the mapped pages. When the writer exits, the next poll of
+    another indexer takes over the lock.
+
+    With a `session_factory`, the writer mirrors every index generation into the
+    documents table, and starts from the mirrored chunks instead of extracting every
+    file again when there is no local index yet.
+    """
+
+    def __init__(self, directory: str = KB_PATH, index_path: str = KB_INDEX_PATH,
+                 interval: float = KB_POLL_INTERVAL, session_factory: Optional[async_sessionmaker] = None):
+        self.directory = directory
+        self.index_path = index_path
+        self.interval = interval
+        self.session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+        self._mirrored_generation: Optional[int] = None
+        self._lock = IndexLock(index_path)
+        self.ready = asyncio.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        """Start watching the knowledge base directory."""
+        if not self.running:
+            self.ready = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="kb-indexer")
+
+    async def stop(self) -> None:
+        """Stop the watcher and wait for it to exit."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._lock.release()
+
+    def _open_saved(self, kb: KnowledgeBase) -> KnowledgeBase:
+        """The generation `kb` was just saved as, memory-mapped; `kb` itself if it cannot be opened."""
+        opened = KnowledgeBase()
+        return opened if opened.load_index(self.index_path) else kb
+
+    def _initial_load(self, mirrored: Optional[ChunkStore] = None) -> KnowledgeBase:
+        kb = KnowledgeBase()
+        if not self._lock.held:
+            # Another worker writes the index; an empty one is filled in once it publishes
+            kb.load_index(self.index_path)
+            logger.info("Knowledge base opened: %d chunks", len(kb.documents))
+            return kb
+        if mirrored is not None and len(mirrored):
+            # Seed the local index from the database; refresh_index then only reads changed files
+            kb.load_store(mirrored)
+            kb.save_index(self.index_path)
+        stats = kb.refresh_index(self.directory, self.index_path)
+        if not isinstance(kb.embeddings, np.memmap):
+            kb = self._open_saved(kb)
+        logger.info("Knowledge base loaded: %d chunks (%s)", len(kb.documents), stats)
+        return kb
+
+    def _follow(self, current: KnowledgeBase) -> Optional[KnowledgeBase]:
+        """Open the generation published at `index_path` if `current` is not it."""
+        if current_index(self.index_path) in (None, current.index_dir):
+            return None
+        kb = KnowledgeBase()
+        return kb if kb.load_index(self.index_path) else None
+
+    def _refresh(self, current: KnowledgeBase) -> Optional[KnowledgeBase]:
+        """
+        Refresh a copy of `current` (building a missing approximate index) and save it;
+        return the saved generation only if something changed.
+        """
+        kb = current.copy()
+        stats = kb.refresh(self.directory)
+        if not kb.ensure_ann() and not index_changed(stats):
+            return None
+        kb.save_index(self.index_path)
+        logger.info("Knowledge base reindexed: %d chunks (%s)", len(kb.documents), stats)
+        return self._open_saved(kb)
+
+    def _poll(self, current: KnowledgeBase) -> Optional[KnowledgeBase]:
+        """One poll: follow the published index and, as the writer, refresh it; None if nothing changed."""
+        followed = self._follow(current)
+        if not self._lock.acquire(blocking=False):
+            return followed
+        return self._refresh(followed or current) or followed
+
+    async def _read_mirror(self) -> Optional[ChunkStore]:
+        """The mirrored chunks, when this node writes the index and has none to start from."""
+        if self.session_factory is None or not self._lock.held or index_exists(self.index_path):
+            return None
+        try:
+            return await load_mirrored_chunks(self.session_factory)
+        except Exception:
+            logger.exception("Reading the knowledge base mirror failed")
+            return None
+
+    async def _mirror(self, kb: KnowledgeBase) -> None:
+        """
+        As the writer, mirror the live index into the database unless this generation
+        already is. Only an index that was loaded or saved is mirrored, never the empty
+        placeholder left by a failed load.
+        """
+        if (self.session_factory is None or not self._lock.held or kb.index_dir is None
+                or kb.generation == self._mirrored_generation):
+            return
+        try:
+            await mirror_chunks(self.session_factory, kb.store)
+        except Exception:
+            logger.exception("Mirroring the knowledge base into the database failed")
+            return
+        self._mirrored_generation = kb.generation
+
+    async def _run(self) -> None:
+        loaded = False
+        try:
+            self._lock.acquire(blocking=False)
+            set_knowledge_base(await asyncio.to_thread(self._initial_load, await self._read_mirror()))
+            loaded = True
+        except Exception:
+            logger.exception("Initial knowledge base load failed")
+        self.ready.set()
+        if loaded:
+            await self._mirror(get_knowledge_base())
+
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                kb = await asyncio.to_thread(self._poll, get_knowledge_base())
+            except Exception:
+                logger.exception("Knowledge base refresh failed")
+                continue
+            if kb is not None:
+                set_knowledge_base(kb)
+            await self._mirror(get_knowledge_base())
+
+
+# Global indexer instance, started from the application lifespan
+kb_indexer = KnowledgeBaseIndexer(session_factory=async_session if KB_DB_MIRROR else None)
@@ -0,0 +1,145 @@
+import logging
+from typing import Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.config import KB_FUSION_DEPTH, KB_MIRROR_BATCH_FILES, KB_RRF_K, KB_SEARCH_MODE
+from src.database_operations import (
+    delete_document_files, get_document_files, replace_document_chunks, search_documents, stream_document_chunks,
+)
+from src.services.chunk_store import ChunkStore, ChunkStoreBuilder
+from src.services.kb_service import (
+    SEARCH_MODES, KnowledgeBase, _query_key, format_context, retrieval_cache,
+)
+from src.services.lexical_index import reciprocal_rank_fusion
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key of the PostgreSQL advisory lock that serializes mirroring across nodes
+MIRROR_LOCK_ID = 7302520
+
+
+async def _lock_mirror(db: AsyncSession) -> None:
+    if db.get_bind().dialect.name == "postgresql":
+        # Nodes indexing the same files would otherwise interleave their writes
+        await db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIRROR_LOCK_ID})
+
+
+async def mirror_chunks(
+    session_factory: async_sessionmaker, store: ChunkStore, batch_files: int = KB_MIRROR_BATCH_FILES
+) -> Dict[str, int]:
+    """
+    Bring the documents table in line with a chunk store, file by file.
+
+    Files whose hash, size and mtime already match are left alone. Changed files have
+    their chunks replaced and files that left the store are deleted, `batch_files`
+    files per transaction: every file is replaced atomically, and the database write
+    lock is never held for the whole knowledge base. An empty store deletes nothing,
+    since it more likely means the index failed to load than that every file went.
+    Returns the number of files written and deleted.
+    """
+    current = {metadata.get('source'): metadata for metadata in store.files}
+    async with session_factory() as db:
+        mirrored = await get_document_files(db)
+    if len(store):
+        stale = [filename for filename in mirrored if filename not in current]
+    else:
+        stale = []
+        if mirrored:
+            logger.warning("Not mirroring an empty knowledge base over %d mirrored files", len(mirrored))
+    changed = [
+        source for source, metadata in current.items()
+        if mirrored.get(source) != (metadata.get('hash'), metadata.get('size'), metadata.get('last_modified'))
+    ]
+
+    rows_by_source = store.rows_by_source()
+    for start in range(0, len(changed), batch_files):
+        async with session_factory() as db:
+            await _lock_mirror(db)
+            for source in changed[start:start + batch_files]:
+                metadata = current[source]
+                await replace_document_chunks(db, source, [
+                    {
+                        "chunk": int(store.chunk_numbers[row]),
+                        "content": store.chunk_text(row),
+                        "file_hash": metadata.get('hash'),
+                        "file_size": metadata.get('size'),
+                        "file_mtime": metadata.get('last_modified'),
+                    }
+                    for row in rows_by_source.get(source, [])
+                ])
+            await db.commit()
+    for start in range(0, len(stale), batch_files):
+        async with session_factory() as db:
+            await _lock_mirror(db)
+            await delete_document_files(db, stale[start:start + batch_files])
+            await db.commit()
+    if changed or stale:
+        logger.info("Mirrored the knowledge base into the database: %d files written, %d deleted",
+                    len(changed), len(stale))
+    return {'written': len(changed), 'deleted': len(stale)}
+
+
+async def load_mirrored_chunks(session_factory: async_sessionmaker) -> ChunkStore:
+    """Read every mirrored chunk back into a chunk store, without touching the source files."""
+    builder = ChunkStoreBuilder()
+    source, metadata, chunks = None, None, []
+    async with session_factory() as db:
+        async for document in stream_document_chunks(db):
+            if document.filename != source:
+                if chunks:
+                    builder.add(metadata, chunks)
+                source, chunks = document.filename, []
+                metadata = {
+                    'source': document.filename,
+                    'hash': document.file_hash,
+                    'size': document.file_size,
+                    'last_modified': document.file_mtime,
+                }
+            chunks.append(document.content)
+    if chunks:
+        builder.add(metadata, chunks)
+    return builder.build()
+
+
+async def get_database_context(
+    db: AsyncSession, kb: KnowledgeBase, query: str, top_k: int = 1, mode: Optional[str] = None
+) -> str:
+    """
+    Like KnowledgeBase.get_relevant_context, with the lexical ranking taken from the
+    database's full-text index instead of the in-process BM25 index.
+
+    Chunks are matched across the two rankings by (source file, chunk number).
+    """
+    mode = mode or KB_SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode {mode!r}; expected one of {', '.join(SEARCH_MODES)}")
+    if mode == 'vector':
+        return kb.get_relevant_context(query, top_k=top_k, mode=mode)
+
+    # The mirror follows the local index, so its generation also versions the database results
+    key = ("database-context", mode, kb.generation, top_k, _query_key(query))
+    context = retrieval_cache.get(key)
+    if context is not None:
+        return context
+
+    depth = top_k if mode == 'lexical' else max(top_k, KB_FUSION_DEPTH)
+    texts = {}
+    lexical = []
+    for document, _ in await search_documents(db, query, depth):
+        texts[document.filename, document.chunk] = document.content
+        lexical.append((document.filename, document.chunk))
+    if mode == 'lexical':
+        ranked = lexical[:top_k]
+    else:
+        dense = []
+        for document, _ in kb.search(query, top_k=depth, mode='vector', count_lookups=False):
+            chunk_key = (document.metadata.get('source'), document.metadata.get('chunk'))
+            texts.setdefault(chunk_key, document.content)
+            dense.append(chunk_key)
+        ranked = [chunk_key for chunk_key, _ in reciprocal_rank_fusion([dense, lexical], KB_RRF_K)[:top_k]]
+
+    context = format_context([texts[chunk_key] for chunk_key in ranked])
+    retrieval_cache.set(key, context)
+    return context
@@ -1,22 +1,290 @@
 import os
+import re
+import json
+import fcntl
+import time
+import shutil
 import hashlib
+import itertools
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import Iterable, Iterator, List, Dict, NamedTuple, Optional, Tuple
 import numpy as np
-from numpy.linalg import norm
-from src.config import KB_PATH, SUPPORTED_EXTENSIONS, CHUNK_SIZE, CHUNK_OVERLAP
+from src.config import (
+    KB_PATH, KB_INDEX_PATH, KB_INGEST_WORKERS, KB_EXTRACT_TIMEOUT, SUPPORTED_EXTENSIONS, CHUNK_SIZE, CHUNK_OVERLAP,
+    EMBEDDING_DIM, KB_RETRIEVAL_CACHE_SIZE, KB_SEARCH_MODE, KB_BM25_K1, KB_BM25_B, KB_FUSION_DEPTH, KB_RRF_K,
+    KB_ANN_INDEX, KB_ANN_MIN_CHUNKS, KB_ANN_NLIST, KB_ANN_NPROBE, KB_ANN_PQ_SUBSPACES, KB_ANN_RERANK,
+)
+from src.services.ann_index import IVFIndex
+from src.services.chunk_store import ChunkStore, ChunkStoreBuilder, Document, save_array
+from src.services.embeddings import HashingEmbedder, tokenize
+from src.services.kb_extractors import extract_text, hash_file, needs_isolation, time_limit
+from src.services.lexical_index import BM25Index, reciprocal_rank_fusion
+from src.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Every change of indexed contents gets a new, never reused generation number
+_generations = itertools.count(1)
+
+# Search results and formatted contexts, keyed by (kind, mode, generation, top_k, query terms).
+# Keys carry the index generation, so a reload invalidates them without an explicit flush.
+retrieval_cache: LRUCache = LRUCache(KB_RETRIEVAL_CACHE_SIZE)
+
+
+def _query_key(query: str) -> Tuple[str, ...]:
+    """
+    The query's bag of words: queries with the same key have the same embedding
+    (case, punctuation and word order do not matter), so they share cached results.
+    """
+    return tuple(sorted(tokenize(query)))
+
+# On-disk index layout: <index>/CURRENT names the live generation directory,
+# which holds the embedding matrix, the chunk store (see ChunkStore.save), the
+# BM25 inverted index (see BM25Index.save), a JSON sidecar with the file table and,
+# when KB_ANN_INDEX is enabled, the approximate index over the matrix (see
+# IVFIndex.save). <index>/LOCK is held by the one process writing generations.
+INDEX_FORMAT_VERSION = 4
+INDEX_POINTER_FILE = 'CURRENT'
+INDEX_LOCK_FILE = 'LOCK'
+INDEX_EMBEDDINGS_FILE = 'embeddings.npy'
+INDEX_FILES_FILE = 'files.json'
+INDEX_ANN_FILE = 'ann.npz'
+
+# Below this many files the process pool start-up costs more than it saves
+PARALLEL_MIN_FILES = 4
+# Chunks embedded together while a file is streamed, which bounds the embedding working set
+EMBED_BLOCK_CHUNKS = 256
+
+_WORD_RE = re.compile(r'\S+')
+
+# "vector" ranks by embedding similarity, "lexical" by BM25 over the inverted index,
+# "hybrid" fuses both rankings with reciprocal rank fusion
+SEARCH_MODES = ('vector', 'lexical', 'hybrid')
+
+
+class StreamChunker:
+    """
+    Split a text stream into overlapping windows of `chunk_size` words, incrementally.
+
+    Text is fed in pieces of any size and completed windows are yielded as
+    (start, end) character offsets into the whole stream. Only the text from the
+    start of the current window onwards is retained, so memory stays bounded by
+    one window plus one piece no matter how large the source is.
+    """
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
+        self.chunk_size = chunk_size
+        self.step = max(1, chunk_size - overlap)
+        self._buffer = ''
+        self._base = 0  # absolute offset of self._buffer[0]
+
+    def text(self, start: int, end: int) -> str:
+        """Return the text of a span; valid until the spans() generator is resumed."""
+        return self._buffer[start - self._base:end - self._base]
+
+    def spans(self, pieces: Iterable[str]) -> Iterator[Tuple[int, int]]:
+        """Yield (start, end) offsets of every chunk in the stream."""
+        self._buffer = ''
+        self._base = 0
+        window = deque()  # (start, end) of the words in the current window
+        fresh = 0         # words added since the last emitted chunk
+        scan = 0          # buffer position up to which words have been consumed
+
+        for piece in self._with_end_marker(pieces):
+            final = piece is None
+            if not final:
+                self._buffer += piece
+            for match in _WORD_RE.finditer(self._buffer, scan):
+                if match.end() == len(self._buffer) and not final:
+                    break  # the word may continue in the next piece
+                window.append((self._base + match.start(), self._base + match.end()))
+                scan = match.end()
+                fresh += 1
+                if len(window) == self.chunk_size:
+                    yield window[0][0], window[-1][1]
+                    for _ in range(self.step):
+                        window.popleft()
+                    fresh = 0
+
+            # Drop text that no future chunk can start in
+            keep_from = window[0][0] - self._base if window else scan
+            if keep_from:
+                self._buffer = self._buffer[keep_from:]
+                self._base += keep_from
+                scan -= keep_from
+
+        if fresh and window:
+            yield window[0][0], window[-1][1]
+
+    @staticmethod
+    def _with_end_marker(pieces: Iterable[str]) -> Iterator[Optional[str]]:
+        yield from pieces
+        yield None
+
+
+class IngestResult(NamedTuple):
+    """Outcome of reading one file: its metadata, chunks and their embeddings."""
+    source: str
+    metadata: dict
+    chunks: List[str]
+    embeddings: Optional[np.ndarray]
+    unchanged: bool = False
+    error: Optional[str] = None
+
+
+class IngestStats(NamedTuple):
+    """Throughput of one ingestion run."""
+    files: int
+    bytes: int
+    seconds: float
+    workers: int
+
+    @property
+    def files_per_sec(self) -> float:
+        return self.files / self.seconds if self.seconds else 0.0
+
+    @property
+    def mb_per_sec(self) -> float:
+        return self.bytes / 1_000_000 / self.seconds if self.seconds else 0.0
+
+
+def _file_metadata(source: str, file_hash: str, stat: os.stat_result) -> dict:
+    """The file-table entry of an ingested file."""
+    return {
+        'source': source,
+        'hash': file_hash,
+        'size': stat.st_size,
+        'last_modified': stat.st_mtime
+    }
+
+
+def _ingest_file(job: Tuple[str, Optional[str]]) -> IngestResult:
+    """Process-pool entry point; a fresh instance keeps the live index out of the pickled payload."""
+    return KnowledgeBase()._process_file(*job)
+
+
+def _top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Select the k best columns of every row of a (queries x documents) score matrix.
+
+    Uses np.argpartition so only the k winners are sorted, not the whole row.
+    Returns (indices, scores), both of shape (queries, k), best first.
+    """
+    n = scores.shape[1]
+    k = min(k, n)
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0), dtype=np.intp)
+        return empty, empty.astype(scores.dtype)
+    if k < n:
+        candidates = np.argpartition(scores, n - k, axis=1)[:, n - k:]
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape)
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    indices = np.take_along_axis(candidates, order, axis=1)
+    return indices, np.take_along_axis(candidate_scores, order, axis=1)
 
-class Document:
-    def __init__(self, content: str, metadata: Optional[dict] = None):
-        self.content = content
-        self.metadata = metadata or {}
 
 class KnowledgeBase:
     def __init__(self):
-        self.documents: List[Document] = []
-        self.embeddings: List[np.ndarray] = []
-        self.document_metadata: List[dict] = []
+        # Chunk texts and metadata, one row per row of the embedding matrix
+        self.store: ChunkStore = ChunkStore.empty()
+        # One contiguous, row-normalized float32 matrix: cosine similarity is a plain dot product.
+        self.embeddings: np.ndarray = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        self.last_ingest_stats: Optional[IngestStats] = None
+        self.embedder = HashingEmbedder(EMBEDDING_DIM)
+        # Number of chunks using each embedding bucket; drives query-side IDF weighting
+        self.document_frequency = np.zeros(EMBEDDING_DIM, dtype=np.int64)
+        self.idf = np.ones(EMBEDDING_DIM, dtype=np.float32)
+        # BM25 inverted index over the chunk texts, aligned with self.store
+        self.lexical = BM25Index(KB_BM25_K1, KB_BM25_B)
+        # Approximate index over self.embeddings (see KB_ANN_INDEX); None means exact search
+        self.ann: Optional[IVFIndex] = None
+        # Identifies the indexed contents; bumped whenever the embeddings change
+        self.generation = 0
+        # Name of the persisted generation directory this instance was loaded from or saved as
+        self.index_dir: Optional[str] = None
         
+    def copy(self) -> 'KnowledgeBase':
+        """
+        Shallow copy that shares the chunk store and the embedding matrix.
+
+        refresh() replaces the store and the matrix instead of mutating them, so a copy
+        can be refreshed off to the side while readers keep using the original.
+        """
+        clone = KnowledgeBase()
+        clone.store = self.store
+        clone.embeddings = self.embeddings
+        clone.document_frequency = self.document_frequency
+        clone.idf = self.idf
+        clone.lexical = self.lexical
+        clone.ann = self.ann
+        clone.generation = self.generation
+        return clone
+
+    def _set_embeddings(
+        self, embeddings: np.ndarray, document_frequency: Optional[np.ndarray] = None, ann: Optional[IVFIndex] = None,
+        build_ann: bool = True
+    ) -> None:
+        """
+        Install a new embedding matrix, the IDF weights derived from it and its approximate
+        index, which is built when not given unless `build_ann` is False.
+        """
+        if document_frequency is None:
+            document_frequency = self.embedder.document_frequency(embeddings)
+        if ann is None and build_ann:
+            ann = self._build_ann(embeddings)
+        self.ann = ann
+        self.embeddings = embeddings
+        self.document_frequency = np.asarray(document_frequency, dtype=np.int64)
+        self.idf = self.embedder.inverse_document_frequency(self.document_frequency, embeddings.shape[0])
+        self.generation = next(_generations)
+
+    def _build_ann(self, embeddings: np.ndarray) -> Optional[IVFIndex]:
+        """
+        Build the approximate index selected by KB_ANN_INDEX, or None for exact search.
+
+        The trained centroids and codebooks of the current index are reused until the
+        corpus doubles in size; only the assignment of vectors to cells is redone.
+        """
+        if KB_ANN_INDEX in ('', 'none') or embeddings.shape[0] < KB_ANN_MIN_CHUNKS:
+            return None
+        if KB_ANN_INDEX not in ('ivf', 'ivfpq'):
+            raise ValueError(f"Unknown KB_ANN_INDEX {KB_ANN_INDEX!r}; expected ivf or ivfpq")
+        previous = self.ann
+        if previous is not None and previous.kind == KB_ANN_INDEX and embeddings.shape[0] <= 2 * previous.trained_size:
+            return previous.add(embeddings)
+        return IVFIndex.build(
+            embeddings,
+            nlist=KB_ANN_NLIST or int(np.sqrt(embeddings.shape[0])),
+            nprobe=KB_ANN_NPROBE,
+            pq_subspaces=KB_ANN_PQ_SUBSPACES if KB_ANN_INDEX == 'ivfpq' else 0,
+            rerank=KB_ANN_RERANK,
+        )
+
+    @property
+    def documents(self) -> ChunkStore:
+        """The chunks as a sequence of Documents, which are created as they are accessed."""
+        return self.store
+
+    def _set_store(self, store: ChunkStore, lexical: Optional[BM25Index] = None) -> None:
+        """Install a new chunk store with its inverted index, which is built over its texts if not given."""
+        self.store = store
+        self.lexical = lexical if lexical is not None else BM25Index.build(store.texts(), KB_BM25_K1, KB_BM25_B)
+
+    def load_store(self, store: ChunkStore, block: int = 4096) -> None:
+        """Index chunks that were already extracted (e.g. read back from the database) without reading any file."""
+        self._set_store(store)
+        blocks = [np.empty((0, EMBEDDING_DIM), dtype=np.float32)]
+        for start in range(0, len(store), block):
+            rows = range(start, min(start + block, len(store)))
+            blocks.append(self._embed_batch([store.chunk_text(row) for row in rows]))
+        self._set_embeddings(np.concatenate(blocks))
+
     def _get_file_hash(self, file_path: str) -> str:
         """Generate a hash for file content to detect changes."""
         hasher = hashlib.md5()
@@ -27,117 +295,459 @@ class KnowledgeBase:
     
     def _chunk_text(self, text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
         """Split text into overlapping chunks."""
-        if not text.strip():
-            return []
-            
-        words = text.split()
-        chunks = []
-        start = 0
-        
-        while start < len(words):
-            end = start + chunk_size
-            chunk = ' '.join(words[start:end])
-            chunks.append(chunk)
-            start = end - overlap
-            
-            # Prevent infinite loop with very small chunks
-            if end >= len(words):
-                break
-                
-        return chunks
+        chunker = StreamChunker(chunk_size, overlap)
+        return [chunker.text(start, end) for start, end in chunker.spans([text])]
     
     def _get_embedding(self, text: str) -> np.ndarray:
-        """Generate a simple embedding for the text (placeholder - replace with actual embedding model)."""
-        # This is a simple placeholder - in practice, you'd use a pre-trained model
-        # like OpenAI's text-embedding-ada-002 or similar
-        words = text.lower().split()
-        unique_words = list(set(words))
-        embedding = np.zeros(100)  # Simple fixed-size embedding
-        for i, word in enumerate(unique_words[:100]):
-            embedding[i % 100] = hash(word) % 100 / 100.0  # Simple hash-based embedding
-        return embedding / (norm(embedding) + 1e-9)  # Normalize
-    
-    def load_documents(self, directory: str = None) -> List[Document]:
+        """Embed a single chunk of text (see _embed_batch)."""
+        return self._embed_batch([text])[0]
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        """Embed a list of chunks into a contiguous (len(texts), EMBEDDING_DIM) float32 matrix."""
+        return self.embedder.embed_documents(texts)
+
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Embed search queries, weighted by the IDF of the loaded corpus."""
+        return self.embedder.embed_queries(queries, self.idf)
+
+    def _iter_source_files(self, directory: str):
+        """Yield every supported file below the knowledge base directory."""
+        for file_path in Path(directory).rglob('*'):
+            if file_path.suffix.lower() in SUPPORTED_EXTENSIONS and file_path.is_file():
+                yield file_path
+
+    def _process_file(self, source: str, known_hash: Optional[str] = None) -> IngestResult:
+        """
+        Stream a file once, hashing, extracting and chunking it piece by piece, and embed
+        its chunks EMBED_BLOCK_CHUNKS at a time as they are produced.
+
+        Text comes from the extractor registered for the file extension (plain UTF-8
+        otherwise) and processing is bounded by KB_EXTRACT_TIMEOUT when running in a
+        worker process. If the MD5 of the file equals `known_hash` the file is reported
+        as unchanged before any text is extracted. Memory is bounded by the chunks and
+        vectors of the file plus one block. Errors are returned rather than raised so a
+        single bad file does not abort a whole ingestion run.
+        """
+        try:
+            stat = os.stat(source)
+            with time_limit(KB_EXTRACT_TIMEOUT):
+                if known_hash is not None and hash_file(source) == known_hash:
+                    metadata = _file_metadata(source, known_hash, stat)
+                    return IngestResult(source, metadata, [], None, unchanged=True)
+
+                hasher = hashlib.md5()
+                chunker = StreamChunker()
+                chunks: List[str] = []
+                blocks = [np.empty((0, EMBEDDING_DIM), dtype=np.float32)]
+                embedded = 0
+                for start, end in chunker.spans(extract_text(source, hasher)):
+                    chunks.append(chunker.text(start, end))
+                    if len(chunks) - embedded == EMBED_BLOCK_CHUNKS:
+                        blocks.append(self._embed_batch(chunks[embedded:]))
+                        embedded = len(chunks)
+                if embedded < len(chunks):
+                    blocks.append(self._embed_batch(chunks[embedded:]))
+
+            metadata = _file_metadata(source, hasher.hexdigest(), stat)
+            return IngestResult(source, metadata, chunks, np.concatenate(blocks))
+        except Exception as e:
+            return IngestResult(source, {}, [], None, error=str(e))
+
+    def _ingest(self, jobs: List[Tuple[str, Optional[str]]], workers: Optional[int] = None) -> Iterator[IngestResult]:
+        """
+        Process (source, known_hash) jobs, fanning out to a process pool for larger batches.
+
+        Binary formats (PDF, DOCX) always go through the pool so their per-file timeout
+        can fire. Results are streamed back in job order as soon as they are ready;
+        throughput of the run is logged and kept in `last_ingest_stats` once it completes.
+        """
+        if workers is None:
+            workers = KB_INGEST_WORKERS
+        workers = max(1, min(workers, len(jobs)))
+        started = time.perf_counter()
+        total_bytes = 0
+        isolate = any(needs_isolation(source) for source, _ in jobs)
+
+        if not isolate and (workers == 1 or len(jobs) < PARALLEL_MIN_FILES):
+            workers = 1
+            results = (self._process_file(*job) for job in jobs)
+            executor = None
+        else:
+            # spawn: forking a process that runs the indexer thread is not safe
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            results = executor.map(_ingest_file, jobs, chunksize=max(1, len(jobs) // (workers * 8)))
+
+        try:
+            for result in results:
+                total_bytes += result.metadata.get('size', 0)
+                yield result
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        self.last_ingest_stats = IngestStats(len(jobs), total_bytes, time.perf_counter() - started, workers)
+        if jobs:
+            logger.info(
+                "Ingested %d files (%.1f MB) with %d worker(s): %.1f files/sec, %.2f MB/sec",
+                len(jobs), total_bytes / 1_000_000, workers,
+                self.last_ingest_stats.files_per_sec, self.last_ingest_stats.mb_per_sec,
+            )
+
+    def load_documents(self, directory: str = None, workers: Optional[int] = None) -> ChunkStore:
         """Load and process all supported documents from the knowledge base directory."""
         if directory is None:
             directory = KB_PATH
-            
-        self.documents = []
-        self.document_metadata = []
-        
-        for file_path in Path(directory).rglob('*'):
-            if file_path.suffix.lower() in SUPPORTED_EXTENSIONS:
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        file_hash = self._get_file_hash(str(file_path))
-                        
-                        # Create document metadata
-                        metadata = {
-                            'source': str(file_path),
-                            'hash': file_hash,
-                            'size': os.path.getsize(file_path),
-                            'last_modified': os.path.getmtime(file_path)
-                        }
-                        
-                        # Split into chunks and create documents
-                        chunks = self._chunk_text(content)
-                        for i, chunk in enumerate(chunks):
-                            chunk_metadata = metadata.copy()
-                            chunk_metadata['chunk'] = i
-                            self.documents.append(Document(chunk, chunk_metadata))
-                            self.document_metadata.append(chunk_metadata)
-                            
-                except Exception as e:
-                    print(f"Error loading {file_path}: {str(e)}")
-                    continue
-                    
-        # Generate embeddings for all documents
-        self.embeddings = [self._get_embedding(doc.content) for doc in self.documents]
+
+        builder = ChunkStoreBuilder()
+        blocks = []
+        jobs = [(str(file_path), None) for file_path in self._iter_source_files(directory)]
+        for result in self._ingest(jobs, workers):
+            if result.error is not None:
+                logger.warning("Error loading %s: %s", result.source, result.error)
+                continue
+            builder.add(result.metadata, result.chunks)
+            blocks.append(result.embeddings)
+
+        self._set_store(builder.build())
+        self._set_embeddings(np.concatenate(blocks) if blocks else np.empty((0, EMBEDDING_DIM), dtype=np.float32))
         return self.documents
-    
-    def search(self, query: str, top_k: int = 10) -> List[Tuple[Document, float]]:
-        """Search for relevant documents based on the query."""
-        if not self.documents:
-            return []
-            
-        query_embedding = self._get_embedding(query)
-        similarities = []
-        
-        for doc_embedding in self.embeddings:
-            # Calculate cosine similarity
-            sim = np.dot(query_embedding, doc_embedding) / (
-                norm(query_embedding) * norm(doc_embedding) + 1e-9
+
+    def refresh(self, directory: str = None, workers: Optional[int] = None) -> Dict[str, int]:
+        """
+        Incrementally bring the index in line with the knowledge base directory.
+
+        Files whose size and mtime match the indexed metadata are skipped without being
+        read; otherwise the MD5 hash decides whether the file really changed. Only added
+        or modified files are re-chunked and re-embedded, and chunks of deleted files
+        are dropped. Files that were touched without being edited only get their new
+        size and mtime recorded, and indexed files that cannot be read right now keep
+        their chunks. Returns counts of added, modified, removed, unchanged (of which
+        touched) and failed files; see index_changed().
+
+        The chunk store and its file table are replaced, never modified, so the
+        instance this one was copy()'d from is left as it was.
+        """
+        if directory is None:
+            directory = KB_PATH
+
+        # Group the existing rows by source file
+        indexed = self.store.rows_by_source()
+
+        stats = {'added': 0, 'modified': 0, 'removed': 0, 'unchanged': 0, 'touched': 0, 'failed': 0}
+        kept_rows: List[int] = []
+        jobs: List[Tuple[str, Optional[str]]] = []
+        previous_rows: Dict[str, List[int]] = {}
+        # New file-table entries of touched files, by source
+        touched: Dict[str, dict] = {}
+
+        for file_path in self._iter_source_files(directory):
+            source = str(file_path)
+            rows = indexed.pop(source, None)
+            if not rows:
+                jobs.append((source, None))
+                continue
+            metadata = self.store.file_metadata(rows[0])
+            try:
+                stat = file_path.stat()
+            except OSError as e:
+                logger.warning("Keeping the indexed chunks of %s, which cannot be read: %s", source, e)
+                kept_rows.extend(rows)
+                stats['failed'] += 1
+                continue
+            if stat.st_size == metadata.get('size') and stat.st_mtime == metadata.get('last_modified'):
+                kept_rows.extend(rows)
+                stats['unchanged'] += 1
+                continue
+            previous_rows[source] = rows
+            jobs.append((source, metadata.get('hash')))
+
+        new_files: List[IngestResult] = []
+        blocks = []
+        for result in self._ingest(jobs, workers):
+            rows = previous_rows.get(result.source)
+            if result.error is not None:
+                if rows:
+                    # Possibly a transient read error; the old chunks beat none at all
+                    logger.warning("Keeping the indexed chunks of %s: %s", result.source, result.error)
+                    kept_rows.extend(rows)
+                else:
+                    logger.warning("Error loading %s: %s", result.source, result.error)
+                stats['failed'] += 1
+                continue
+            if result.unchanged:
+                # Touched but not edited: keep the chunks, remember the new size and mtime
+                touched[result.source] = {
+                    **self.store.file_metadata(rows[0]),
+                    'size': result.metadata['size'],
+                    'last_modified': result.metadata['last_modified'],
+                }
+                kept_rows.extend(rows)
+                stats['unchanged'] += 1
+                stats['touched'] += 1
+                continue
+
+            new_files.append(result)
+            blocks.append(result.embeddings)
+            stats['modified' if rows else 'added'] += 1
+
+        # Whatever is left was not found on disk any more
+        stats['removed'] = len(indexed)
+
+        if stats['added'] or stats['modified'] or stats['removed']:
+            # Kept chunks stay in their order, so the inverted index can be merged rather than rebuilt
+            kept_rows.sort()
+            kept = np.asarray(kept_rows, dtype=np.intp)
+            dropped = np.setdiff1d(np.arange(len(self.store)), kept)
+            # Adjust bucket document frequencies by the rows that left and arrived
+            document_frequency = self.document_frequency - self.embedder.document_frequency(self.embeddings[dropped])
+            for block in blocks:
+                document_frequency = document_frequency + self.embedder.document_frequency(block)
+            self._set_embeddings(
+                np.concatenate([np.asarray(self.embeddings[kept], dtype=np.float32)] + blocks),
+                document_frequency,
             )
-            similarities.append(sim)
-            
-        # Get top-k most similar documents
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
-        return [(self.documents[i], similarities[i]) for i in top_indices]
+            builder = ChunkStoreBuilder()
+            builder.extend(self.store, kept_rows)
+            for result in new_files:
+                builder.add(result.metadata, result.chunks)
+            lexical = self.lexical.update(kept, (chunk for result in new_files for chunk in result.chunks))
+            self._set_store(builder.build(), lexical)
+        if touched:
+            # The texts are the same, so the inverted index and the generation stay
+            self.store = self.store.with_files([touched.get(file.get('source'), file) for file in self.store.files])
+        return stats
+
+    def save_index(self, index_path: str = None) -> str:
+        """
+        Persist the loaded documents as a new index generation and make it current.
+
+        The generation is written into its own directory and published by atomically
+        replacing the CURRENT pointer, so concurrent readers never see a partial index.
+        Callers should hold the IndexLock of `index_path`. Returns the path of the
+        written generation.
+        """
+        if index_path is None:
+            index_path = KB_INDEX_PATH
+        root = Path(index_path)
+        root.mkdir(parents=True, exist_ok=True)
+
+        previous = current_index(index_path)
+        generation = f"gen-{time.time_ns()}-{os.getpid()}"
+        target = root / generation
+        target.mkdir()
+
+        save_array(target / INDEX_EMBEDDINGS_FILE, np.ascontiguousarray(self.embeddings, dtype=np.float32))
+        self.store.save(target)
+        self.lexical.save(target)
+        if self.ann is not None:
+            self.ann.save(target / INDEX_ANN_FILE)
+        with open(target / INDEX_FILES_FILE, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': INDEX_FORMAT_VERSION,
+                'dim': EMBEDDING_DIM,
+                'document_frequency': self.document_frequency.tolist(),
+                'files': self.store.files,
+            }, f, ensure_ascii=False, separators=(',', ':'))
+
+        pointer_tmp = root / f"{INDEX_POINTER_FILE}.{generation}.tmp"
+        pointer_tmp.write_text(generation)
+        os.replace(pointer_tmp, root / INDEX_POINTER_FILE)
+        self.index_dir = generation
+
+        # The previous generation stays: a worker may have just read CURRENT and still be opening it.
+        # Older ones can at most still be mapped by other workers, and unlinking is safe on POSIX
+        if previous is not None:
+            cutoff = _generation_time(previous)
+            for stale in root.glob('gen-*'):
+                started = _generation_time(stale.name)
+                if cutoff is not None and started is not None and started < cutoff:
+                    shutil.rmtree(stale, ignore_errors=True)
+        return str(target)
+
+    def load_index(self, index_path: str = None) -> bool:
+        """
+        Open the current persisted index, memory-mapping the embedding matrix, chunk store
+        and inverted index.
+
+        All are opened read-only (np.load(mmap_mode='r')), so every worker process
+        shares the same page-cache pages. A persisted approximate index of the
+        configured kind is loaded as well; it is never trained here, so without one the
+        index is searched exactly until the writer publishes a generation that has it.
+        Returns False if no usable index exists.
+        """
+        if index_path is None:
+            index_path = KB_INDEX_PATH
+        root = Path(index_path)
+        try:
+            generation = (root / INDEX_POINTER_FILE).read_text().strip()
+            target = root / generation
+            with open(target / INDEX_FILES_FILE, 'r', encoding='utf-8') as f:
+                sidecar = json.load(f)
+            if sidecar.get('version') != INDEX_FORMAT_VERSION or sidecar.get('dim') != EMBEDDING_DIM:
+                return False
+            embeddings = np.load(target / INDEX_EMBEDDINGS_FILE, mmap_mode='r')
+            store = ChunkStore.load(target, sidecar['files'])
+            lexical = BM25Index.load(target, KB_BM25_K1, KB_BM25_B)
+        except (OSError, ValueError, KeyError):
+            return False
+
+        if embeddings.shape != (len(store), EMBEDDING_DIM) or len(lexical) != len(store):
+            return False
+
+        self._set_store(store, lexical)
+        # Never trained here: every worker opens each generation, and only the writer builds (see ensure_ann)
+        self._set_embeddings(
+            embeddings, sidecar.get('document_frequency'), self._load_ann(target, embeddings), build_ann=False
+        )
+        self.index_dir = generation
+        return True
+
+    def _load_ann(self, target: Path, embeddings: np.ndarray) -> Optional[IVFIndex]:
+        """The persisted approximate index of a generation, if it matches KB_ANN_INDEX and the matrix."""
+        if KB_ANN_INDEX in ('', 'none') or not (target / INDEX_ANN_FILE).exists():
+            return None
+        try:
+            ann = IVFIndex.load(target / INDEX_ANN_FILE, embeddings)
+        except (OSError, ValueError, KeyError):
+            return None
+        if ann.kind != KB_ANN_INDEX or len(ann) != embeddings.shape[0]:
+            return None
+        # Search-time settings follow the current configuration
+        ann.nprobe, ann.rerank = KB_ANN_NPROBE, KB_ANN_RERANK
+        return ann
+
+    def load_or_build(self, directory: str = None, index_path: str = None) -> ChunkStore:
+        """Open the persisted index if there is one; otherwise build it from the documents and persist it."""
+        if not self.load_index(index_path):
+            self.load_documents(directory)
+            self.save_index(index_path)
+        return self.documents
+
+    def refresh_index(self, directory: str = None, index_path: str = None) -> Dict[str, int]:
+        """
+        Open the persisted index, refresh it incrementally and persist it again if anything
+        changed or it lacked the approximate index KB_ANN_INDEX asks for.
+        """
+        if not self.load_index(index_path):
+            self.load_documents(directory)
+            self.save_index(index_path)
+            return {'added': len(self.store.files),
+                    'modified': 0, 'removed': 0, 'unchanged': 0, 'touched': 0, 'failed': 0}
+        stats = self.refresh(directory)
+        if self.ensure_ann() or index_changed(stats):
+            self.save_index(index_path)
+        return stats
+
+    def ensure_ann(self) -> bool:
+        """
+        Build the approximate index KB_ANN_INDEX asks for if this instance was opened
+        without one, e.g. from a generation saved before it was enabled. Meant for the
+        index writer, which then saves the result. Returns whether one was built.
+        """
+        if self.ann is not None:
+            return False
+        self.ann = self._build_ann(self.embeddings)
+        if self.ann is None:
+            return False
+        self.generation = next(_generations)
+        return True
+
+    def search(
+        self, query: str, top_k: int = 10, mode: str = 'vector', count_lookups: bool = True
+    ) -> List[Tuple[Document, float]]:
+        """Search for relevant documents based on the query (see search_batch for the modes)."""
+        return self.search_batch([query], top_k=top_k, mode=mode, count_lookups=count_lookups)[0]
+
+    def search_batch(
+        self, queries: List[str], top_k: int = 10, mode: str = 'vector', count_lookups: bool = True
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        Search for several queries at once.
+
+        ``mode`` is one of SEARCH_MODES. Queries answered before against the same
+        index generation come from the retrieval cache; the rest are ranked together.
+        The result list is aligned with ``queries``. Scores are cosine similarities,
+        BM25 scores or fused reciprocal-rank scores depending on the mode.
+
+        Callers that already counted a cache lookup for the same request (a missed
+        context) pass count_lookups=False, so one query is one hit or miss.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode {mode!r}; expected one of {', '.join(SEARCH_MODES)}")
+        if not self.store or not queries:
+            return [[] for _ in queries]
+
+        keys = [("search", mode, self.generation, top_k, _query_key(query)) for query in queries]
+        hits = [retrieval_cache.get(key, count_lookups) for key in keys]
+        missing = [i for i, hit in enumerate(hits) if hit is None]
+        if missing:
+            ranked = self._rank([queries[i] for i in missing], top_k, mode)
+            for i, hit in zip(missing, ranked):
+                hits[i] = hit
+                retrieval_cache.set(keys[i], hit)
+        return [[(self.store[row], score) for row, score in hit] for hit in hits]
+
+    def _rank(self, queries: List[str], top_k: int, mode: str) -> List[List[Tuple[int, float]]]:
+        """Rank the chunks for every query as (row, score) pairs, best first."""
+        if mode == 'vector':
+            query_matrix = self._embed_queries(queries)
+            if self.ann is not None:
+                top_indices, top_scores = self.ann.search(query_matrix, top_k)
+            else:
+                # One matrix product scores all queries against all chunks
+                top_indices, top_scores = _top_k(query_matrix @ self.embeddings.T, top_k)
+            return [
+                [(int(row), float(score)) for row, score in zip(row_indices, row_scores) if row >= 0]
+                for row_indices, row_scores in zip(top_indices, top_scores)
+            ]
+        if mode == 'lexical':
+            return [
+                [(int(row), float(score)) for row, score in zip(*self.lexical.search(query, top_k))]
+                for query in queries
+            ]
+        depth = max(top_k, KB_FUSION_DEPTH)
+        vector = self._rank(queries, depth, 'vector')
+        lexical = self._rank(queries, depth, 'lexical')
+        return [
+            reciprocal_rank_fusion([[row for row, _ in dense], [row for row, _ in sparse]], KB_RRF_K)[:top_k]
+            for dense, sparse in zip(vector, lexical)
+        ]
     
-    def get_relevant_context(self, query: str, top_k: int = 1) -> str:
+    def get_relevant_context(self, query: str, top_k: int = 1, mode: Optional[str] = None) -> str:
         """
         Get the most relevant context from knowledge base for a given query.
         Focuses on the top result and includes it in the system prompt.
+        Chunks are retrieved with ``mode``, KB_SEARCH_MODE by default.
         """
-        results = self.search(query, top_k=top_k)
-        if not results:
-            return ""
-            
-        # Get the top result
-        #top_doc, score = results[0]
-        docs_merged_context = "\n\n".join([doc.content for doc, _ in results])
-        # Format the context to emphasize this is the most relevant information
-        context = (
-            "IMPORTANT: The following is the most relevant information from the knowledge base:\n"
-            # f"SOURCE: {top_doc.metadata.get('source', 'Unknown')}\n"
-            f"CONTENT: {docs_merged_context}\n\n"
-            "Use this information to provide an accurate and detailed response. "
-            "If the information is relevant to the user's question, make sure to reference it in your answer."
-        )
-        
+        mode = mode or KB_SEARCH_MODE
+        key = ("context", mode, self.generation, top_k, _query_key(query))
+        context = retrieval_cache.get(key)
+        if context is not None:
+            return context
+
+        results = self.search(query, top_k=top_k, mode=mode, count_lookups=False)
+        context = format_context([doc.content for doc, _ in results])
+        retrieval_cache.set(key, context)
         return context
 
+
+def index_changed(stats: Dict[str, int]) -> bool:
+    """Whether a refresh() changed anything that has to be persisted: chunks or file metadata."""
+    return bool(stats['added'] or stats['modified'] or stats['removed'] or stats['touched'])
+
+def format_context(chunks: List[str]) -> str:
+    """Wrap retrieved chunk texts, best first, into the context block of the system prompt."""
+    if not chunks:
+        return ""
+    docs_merged_context = "\n\n".join(chunks)
+    # Format the context to emphasize this is the most relevant information
+    return (
+        "IMPORTANT: The following is the most relevant information from the knowledge base:\n"
+        f"CONTENT: {docs_merged_context}\n\n"
+        "Use this information to provide an accurate and detailed response. "
+        "If the information is relevant to the user's question, make sure to reference it in your answer."
+    )
+
 # Global knowledge base instance
 knowledge_base = KnowledgeBase()
 
@@ -145,8 +755,65 @@ def get_knowledge_base() -> KnowledgeBase:
     """Get the global knowledge base instance."""
     return knowledge_base
 
-def load_kb_documents() -> List[str]:
-    """Legacy function for backward compatibility."""
-    kb = get_knowledge_base()
-    kb.load_documents()
-    return [doc.content for doc in kb.documents]
+def set_knowledge_base(kb: KnowledgeBase) -> None:
+    """
+    Atomically replace the global knowledge base instance.
+
+    Callers that already hold the previous instance keep a consistent view of it;
+    new calls to get_knowledge_base() see the fully built replacement.
+    """
+    global knowledge_base
+    knowledge_base = kb
+
+def index_exists(index_path: str = None) -> bool:
+    """Whether a persisted index has been published at `index_path`."""
+    return (Path(index_path or KB_INDEX_PATH) / INDEX_POINTER_FILE).exists()
+
+def current_index(index_path: str = None) -> Optional[str]:
+    """The name of the generation directory published at `index_path`, if any."""
+    try:
+        return (Path(index_path or KB_INDEX_PATH) / INDEX_POINTER_FILE).read_text().strip() or None
+    except OSError:
+        return None
+
+def _generation_time(name: str) -> Optional[int]:
+    """The creation time encoded in a generation directory name ("gen-<ns>-<pid>")."""
+    parts = name.split('-')
+    return int(parts[1]) if len(parts) == 3 and parts[1].isdigit() else None
+
+
+class IndexLock:
+    """
+    Exclusive lock on an index directory, so that one process at a time writes generations.
+
+    An advisory fcntl.flock() on <index>/LOCK: the kernel drops it when the holder
+    exits, however it exits, so another process can take over.
+    """
+
+    def __init__(self, index_path: str = None):
+        self.path = Path(index_path or KB_INDEX_PATH) / INDEX_LOCK_FILE
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Take the lock; without `blocking`, return False at once if another process holds it."""
+        if self._file is not None:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        return True
+
+    def release(self) -> None:
+        if self._file is not None:
+            # Closing the file releases the lock
+            self._file.close()
+            self._file = None
@@ -0,0 +1,215 @@
+from pathlib import Path
+from typing import Dict, Hashable, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from src.services.chunk_store import save_array
+from src.services.embeddings import tokenize
+
+# Files of a persisted index inside an index generation directory
+BM25_TERMS_FILE = 'bm25_terms.txt'
+BM25_OFFSETS_FILE = 'bm25_offsets.npy'
+BM25_POSTINGS_FILE = 'bm25_postings.npy'
+BM25_FREQUENCIES_FILE = 'bm25_frequencies.npy'
+BM25_LENGTHS_FILE = 'bm25_lengths.npy'
+
+
+def _best(candidates: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """The k highest-scoring candidates, best first (ties keep candidate order)."""
+    if k < len(scores):
+        keep = np.argpartition(-scores, k - 1)[:k]
+        candidates, scores = candidates[keep], scores[keep]
+    order = np.argsort(-scores, kind='stable')
+    return candidates[order], scores[order]
+
+
+class BM25Index:
+    """
+    In-memory inverted index over document chunks, scored with Okapi BM25.
+
+    Postings are kept in CSR form: the documents containing term ``t`` are
+    ``postings[offsets[t]:offsets[t + 1]]`` (ascending row numbers) and their term
+    counts sit at the same positions in ``frequencies``. A query only reads the
+    postings of its own terms, so selective queries cost time proportional to
+    those postings rather than to the size of the corpus.
+
+    The arrays are saved with each index generation and memory-mapped on load;
+    update() merges the postings of new documents in without re-reading the rest.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: Dict[str, int] = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.postings = np.empty(0, dtype=np.int32)
+        self.frequencies = np.empty(0, dtype=np.uint16)
+        # Token count of every document
+        self.lengths = np.empty(0, dtype=np.int32)
+        self.idf = np.empty(0, dtype=np.float32)
+        # Per-document denominator term k1 * (1 - b + b * length / average length)
+        self.length_norm = np.empty(0, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def _finish(self) -> 'BM25Index':
+        """Derive the IDF weights and length norms from the postings and document lengths."""
+        count = len(self.lengths)
+        document_frequency = np.diff(self.offsets)
+        self.idf = np.log1p((count - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        average_length = self.lengths.mean() if count and self.lengths.any() else 1.0
+        self.length_norm = (self.k1 * (1.0 - self.b + self.b * self.lengths / average_length)).astype(np.float32)
+        return self
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = 1.2, b: float = 0.75) -> 'BM25Index':
+        """Tokenize the texts once, in a single pass, and lay their postings out term by term."""
+        index = cls(k1, b)
+        vocabulary = index.vocabulary
+        term_ids: List[int] = []
+        token_counts: List[int] = []
+        for text in texts:
+            tokens = tokenize(text)
+            token_counts.append(len(tokens))
+            term_ids.extend(vocabulary.setdefault(token, len(vocabulary)) for token in tokens)
+        count = len(token_counts)
+        lengths = np.asarray(token_counts, dtype=np.int64)
+
+        documents = max(count, 1)
+        cells = np.asarray(term_ids, dtype=np.int64) * documents + np.repeat(np.arange(count), lengths)
+        # np.unique sorts the (term, document) cells, which groups the postings by term
+        cells, counts = np.unique(cells, return_counts=True)
+        terms = cells // documents
+        document_frequency = np.bincount(terms, minlength=len(vocabulary))
+
+        index.offsets = np.concatenate([[0], np.cumsum(document_frequency)]).astype(np.int64)
+        index.postings = (cells % documents).astype(np.int32)
+        index.frequencies = np.minimum(counts, np.iinfo(np.uint16).max).astype(np.uint16)
+        index.lengths = lengths.astype(np.int32)
+        return index._finish()
+
+    def update(self, kept: Sequence[int], texts: Iterable[str]) -> 'BM25Index':
+        """
+        A new index over the documents `kept` (ascending rows of this index, renumbered
+        from 0) followed by `texts`.
+
+        Only the new texts are tokenized. Postings of dropped documents are masked out
+        and the new ones merged in behind the kept ones, term by term, in one linear
+        pass over the arrays; terms left without documents are dropped. This index is
+        not modified.
+        """
+        kept = np.asarray(kept, dtype=np.int64)
+        added = BM25Index.build(texts, self.k1, self.b)
+        merged = BM25Index(self.k1, self.b)
+
+        # Old postings: re-numbered, without the dropped documents; still grouped by term
+        renumbered = np.full(len(self), -1, dtype=np.int64)
+        renumbered[kept] = np.arange(len(kept))
+        old_terms = np.repeat(np.arange(len(self.vocabulary)), np.diff(self.offsets))
+        old_rows = renumbered[self.postings]
+        live = old_rows >= 0
+        old_terms, old_rows, old_frequencies = old_terms[live], old_rows[live], self.frequencies[live]
+
+        # New postings: their own vocabulary mapped onto this one, rows after the kept ones
+        vocabulary = dict(self.vocabulary)
+        global_ids = np.asarray(
+            [vocabulary.setdefault(term, len(vocabulary)) for term in added.vocabulary], dtype=np.int64
+        )
+        new_local = np.repeat(np.arange(len(added.vocabulary)), np.diff(added.offsets))
+        new_terms = global_ids[new_local]
+
+        old_counts = np.bincount(old_terms, minlength=len(vocabulary))
+        new_counts = np.bincount(new_terms, minlength=len(vocabulary))
+        offsets = np.concatenate([[0], np.cumsum(old_counts + new_counts)]).astype(np.int64)
+        old_starts = np.concatenate([[0], np.cumsum(old_counts)])
+        positions_old = offsets[old_terms] + np.arange(len(old_terms)) - old_starts[old_terms]
+        positions_new = (offsets[new_terms] + old_counts[new_terms]
+                         + np.arange(len(new_terms)) - added.offsets[new_local])
+
+        postings = np.empty(offsets[-1], dtype=np.int32)
+        frequencies = np.empty(offsets[-1], dtype=np.uint16)
+        postings[positions_old] = old_rows
+        postings[positions_new] = added.postings + len(kept)
+        frequencies[positions_old] = old_frequencies
+        frequencies[positions_new] = added.frequencies
+
+        present = (old_counts + new_counts) > 0
+        if not present.all():
+            term_ids = np.cumsum(present) - 1
+            vocabulary = {term: int(term_ids[term_id]) for term, term_id in vocabulary.items() if present[term_id]}
+            offsets = np.concatenate([[0], np.cumsum((old_counts + new_counts)[present])]).astype(np.int64)
+
+        merged.vocabulary = vocabulary
+        merged.offsets = offsets
+        merged.postings = postings
+        merged.frequencies = frequencies
+        merged.lengths = np.concatenate([np.asarray(self.lengths)[kept], added.lengths]).astype(np.int32)
+        return merged._finish()
+
+    def save(self, target: Path) -> None:
+        """Write the vocabulary (one term per line, in id order) and the arrays into a generation directory."""
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        (target / BM25_TERMS_FILE).write_text('\n'.join(terms), encoding='utf-8')
+        save_array(target / BM25_OFFSETS_FILE, self.offsets)
+        save_array(target / BM25_POSTINGS_FILE, self.postings)
+        save_array(target / BM25_FREQUENCIES_FILE, self.frequencies)
+        save_array(target / BM25_LENGTHS_FILE, self.lengths)
+
+    @classmethod
+    def load(cls, target: Path, k1: float = 1.2, b: float = 0.75) -> 'BM25Index':
+        """Memory-map an index written by save(); raises OSError or ValueError if it is damaged."""
+        index = cls(k1, b)
+        text = (target / BM25_TERMS_FILE).read_text(encoding='utf-8')
+        terms = text.split('\n') if text else []
+        index.vocabulary = {term: term_id for term_id, term in enumerate(terms)}
+        index.offsets = np.load(target / BM25_OFFSETS_FILE, mmap_mode='r')
+        index.postings = np.load(target / BM25_POSTINGS_FILE, mmap_mode='r')
+        index.frequencies = np.load(target / BM25_FREQUENCIES_FILE, mmap_mode='r')
+        index.lengths = np.load(target / BM25_LENGTHS_FILE, mmap_mode='r')
+        if (len(index.offsets) != len(terms) + 1 or len(index.vocabulary) != len(terms)
+                or index.offsets[-1] != len(index.postings) or len(index.frequencies) != len(index.postings)):
+            raise ValueError(f"Inconsistent BM25 index in {target}")
+        return index._finish()
+
+    def search(self, query: str, top_k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return (rows, scores) of the top_k documents for a query, best first.
+
+        Only documents sharing at least one term with the query are scored;
+        repeated query terms count once.
+        """
+        terms = sorted({self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary})
+        if not terms or top_k <= 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+
+        rows = []
+        contributions = []
+        for term in terms:
+            start, end = self.offsets[term], self.offsets[term + 1]
+            docs = self.postings[start:end]
+            tf = self.frequencies[start:end].astype(np.float32)
+            rows.append(docs)
+            contributions.append(self.idf[term] * tf * (self.k1 + 1.0) / (tf + self.length_norm[docs]))
+
+        if len(terms) == 1:
+            candidates, scores = rows[0], contributions[0]
+        else:
+            candidates, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(contributions)).astype(np.float32)
+        return _best(candidates.astype(np.intp), scores, top_k)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hashable]], k: int = 60) -> List[Tuple[Hashable, float]]:
+    """
+    Merge ranked lists of rows (or any hashable keys) into one list of (row, score), best first.
+
+    Each list contributes 1 / (k + rank) to every row it contains (rank starts at 1),
+    so rows ranked well by several retrievers rise to the top regardless of how the
+    retrievers scale their raw scores. Ties keep the order rows were first seen in.
+    """
+    fused: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])
@@ -1,19 +1,106 @@
-import requests
-from src.config import OPENROUTER_API_KEY, MODEL_NAME
+import json
+from typing import AsyncIterator, List, Optional
 
-def ask_openrouter(messages):
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
+import httpx
+from src.config import (
+    OPENROUTER_API_KEY, OPENROUTER_BASE_URL, MODEL_NAME,
+    LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT, LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS,
+)
+
+# Shared, connection-pooled client; opened and closed by the application lifespan
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_client(**kwargs) -> httpx.AsyncClient:
+    """Build an AsyncClient for the OpenRouter API with the configured pool and timeouts."""
+    options = dict(
+        base_url=OPENROUTER_BASE_URL,
         headers={
             "Authorization": f"Bearer {OPENROUTER_API_KEY}",
             "Content-Type": "application/json",
             "X-Title": "FastAPI Chat",
         },
-        json={
-            "model": MODEL_NAME,
-            "messages": messages,
-            "max_tokens": 512,
-        }
+        timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        ),
+        http2=_http2_available(),
     )
+    options.update(kwargs)
+    return httpx.AsyncClient(**options)
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it on first use outside of the app lifespan."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_client()
+    return _client
+
+
+def set_client(client: Optional[httpx.AsyncClient]) -> None:
+    """Install a different shared client (e.g. one bound to a local stand-in server)."""
+    global _client
+    _client = client
+
+
+async def open_client() -> None:
+    get_client()
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _completion_request(messages: List[dict], stream: bool = False) -> dict:
+    payload = {
+        "model": MODEL_NAME,
+        "messages": messages,
+        "max_tokens": 512,
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+async def ask_openrouter(messages: List[dict]) -> str:
+    response = await get_client().post("/chat/completions", json=_completion_request(messages))
+    response.raise_for_status()
     data = response.json()
     return data["choices"][0]["message"]["content"]
+
+
+async def stream_openrouter(messages: List[dict]) -> AsyncIterator[str]:
+    """
+    Yield completion tokens as OpenRouter produces them (``stream: true``).
+
+    The response is Server-Sent Events: ``data: {json}`` lines carrying
+    ``choices[0].delta.content``, ``: comment`` keep-alives and a final ``data: [DONE]``.
+    """
+    async with get_client().stream("POST", "/chat/completions", json=_completion_request(messages, stream=True)) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            if "error" in chunk:
+                raise httpx.HTTPError(chunk["error"].get("message", "upstream error"))
+            choices = chunk.get("choices") or [{}]
+            content = (choices[0].get("delta") or {}).get("content")
+            if content:
+                yield content
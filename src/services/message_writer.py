@@ -0,0 +1,137 @@
+import asyncio
+import logging
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.config import DB_WRITER_MAX_BATCH
+from src.database import async_session
+from src.database_operations import insert_messages
+from src.models import ChatSession
+from src.schemas import MessageOut
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingWrite(NamedTuple):
+    session_id: int
+    messages: Sequence[Tuple[str, str]]
+    session_values: Optional[dict]
+    future: asyncio.Future
+
+
+class MessageWriter:
+    """
+    Single in-process writer that group-commits chat message inserts.
+
+    Request handlers submit their messages and await the result; one background task
+    drains the queue and commits everything that arrived while the previous commit
+    was running in a single transaction, with one multi-row INSERT. On SQLite this
+    turns many small competing write transactions (each waiting on the database lock
+    and paying for its own commit) into one writer and a few larger commits.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker = async_session, max_batch: int = DB_WRITER_MAX_BATCH):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        """Start the writer task."""
+        if not self.running:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run(), name="message-writer")
+
+    async def stop(self) -> None:
+        """Commit whatever is queued, then stop the writer task."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(
+        self,
+        session_id: int,
+        messages: Sequence[Tuple[str, str]],
+        session_values: Optional[dict] = None
+    ) -> List[MessageOut]:
+        """
+        Queue (role, content) messages for a session and wait until they are committed.
+
+        `session_values` are column values for the ChatSession row, updated in the
+        same transaction. Returns the inserted messages in insertion order.
+        """
+        if not self.running:
+            raise RuntimeError("Message writer is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_PendingWrite(session_id, messages, session_values, future))
+        return await future
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            pending = await self._queue.get()
+            if pending is None:
+                break
+            batch = [pending]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                pending = self._queue.get_nowait()
+                if pending is None:
+                    stopping = True
+                    break
+                batch.append(pending)
+            await self._commit(batch)
+
+    async def _commit(self, batch: List[_PendingWrite]) -> None:
+        try:
+            results = await self._write(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                if not batch[0].future.done():
+                    batch[0].future.set_exception(e)
+                return
+            # Retry one by one so a single bad write does not fail the whole group
+            logger.warning("Group commit of %d writes failed, retrying individually: %s", len(batch), e)
+            for pending in batch:
+                await self._commit([pending])
+            return
+
+        for pending, messages in zip(batch, results):
+            if not pending.future.done():
+                pending.future.set_result(messages)
+
+    async def _write(self, batch: List[_PendingWrite]) -> List[List[MessageOut]]:
+        async with self.session_factory() as db:
+            rows = await insert_messages(db, [
+                (pending.session_id, role, content)
+                for pending in batch
+                for role, content in pending.messages
+            ])
+            for pending in batch:
+                if pending.session_values:
+                    await db.execute(
+                        update(ChatSession)
+                        .where(ChatSession.id == pending.session_id)
+                        .values(**pending.session_values)
+                    )
+            await db.commit()
+        self.batches += 1
+
+        # Ids are assigned in statement order, so the sorted rows split back per write
+        results = []
+        offset = 0
+        for pending in batch:
+            results.append(rows[offset:offset + len(pending.messages)])
+            offset += len(pending.messages)
+        return results
+
+
+message_writer = MessageWriter()
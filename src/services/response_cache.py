@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.config import (
+    EMBEDDING_DIM,
+    RESPONSE_CACHE_DB_PATH,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_SIMILARITY,
+    RESPONSE_CACHE_SIZE,
+    RESPONSE_CACHE_TTL,
+)
+from src.services.embeddings import HashingEmbedder
+from src.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+_TRAILING_PUNCTUATION_RE = re.compile(r'[\s?!.]+$')
+
+
+def normalize_question(question: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation, so trivial variants share a key."""
+    return _TRAILING_PUNCTUATION_RE.sub('', " ".join(question.casefold().split()))
+
+
+def context_fingerprint(kb_context: str, history: List[dict]) -> str:
+    """Hash of everything besides the question that shapes the reply: KB context and prior messages."""
+    payload = json.dumps([kb_context, history], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SharedResponseStore:
+    """
+    Response cache tier kept in a SQLite file, so every worker process on the host sees
+    the replies cached by the others. Calls are blocking; run them in a thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache "
+                "(key TEXT PRIMARY KEY, reply TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key: str) -> Optional[str]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT reply FROM response_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def set(self, key: str, reply: str, ttl: float) -> None:
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, reply, expires_at) VALUES (?, ?, ?)",
+                    (key, reply, time.time() + ttl),
+                )
+                conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),))
+        finally:
+            conn.close()
+
+    def clear(self) -> None:
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM response_cache")
+        finally:
+            conn.close()
+
+
+class ResponseCache:
+    """
+    Cache of LLM replies keyed by (normalized question, context fingerprint, model).
+
+    Lookups go through an in-process LRU/TTL tier, then the optional shared SQLite
+    tier. With `similarity` set, a miss on the exact key may still reuse the reply to
+    a near-duplicate question: one asked against the same context and model whose
+    hashed-TF embedding has at least that cosine similarity.
+    """
+
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL,
+                 db_path: str = RESPONSE_CACHE_DB_PATH, similarity: float = RESPONSE_CACHE_SIMILARITY,
+                 enabled: bool = RESPONSE_CACHE_ENABLED):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.similarity = similarity
+        self.memory: LRUCache[str] = LRUCache(max_size, ttl)
+        self.shared = SharedResponseStore(db_path) if enabled and db_path else None
+        self.embedder = HashingEmbedder(EMBEDDING_DIM)
+        # Question vectors of the entries in `memory`, grouped by (context, model)
+        self._vectors: Dict[Tuple[str, str], Dict[str, np.ndarray]] = {}
+        self.shared_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(question: str, context_hash: str, model: str) -> str:
+        return hashlib.sha256(
+            "\0".join((normalize_question(question), context_hash, model)).encode('utf-8')
+        ).hexdigest()
+
+    def _embed(self, question: str) -> np.ndarray:
+        return self.embedder.embed_documents([normalize_question(question)])[0]
+
+    def _find_similar(self, question: str, context_hash: str, model: str) -> Optional[str]:
+        group = self._vectors.get((context_hash, model))
+        if not group:
+            return None
+        # Forget vectors whose entries were evicted from the memory tier
+        for key in [key for key in group if key not in self.memory]:
+            del group[key]
+        if not group:
+            return None
+        keys = list(group)
+        scores = np.stack([group[key] for key in keys]) @ self._embed(question)
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+        return self.memory.peek(keys[best])
+
+    async def get(self, question: str, context_hash: str, model: str) -> Optional[str]:
+        """Return the cached reply for this prompt, or None."""
+        if not self.enabled:
+            return None
+        key = self.key(question, context_hash, model)
+        reply = self.memory.get(key)
+        if reply is not None:
+            return reply
+
+        if self.shared is not None:
+            try:
+                reply = await asyncio.to_thread(self.shared.get, key)
+            except sqlite3.Error:
+                logger.exception("Shared response cache lookup failed")
+            if reply is not None:
+                self.shared_hits += 1
+                self._remember(key, reply, question, context_hash, model)
+                return reply
+
+        if self.similarity:
+            reply = self._find_similar(question, context_hash, model)
+            if reply is not None:
+                self.similar_hits += 1
+                return reply
+
+        self.misses += 1
+        return None
+
+    def _remember(self, key: str, reply: str, question: str, context_hash: str, model: str) -> None:
+        self.memory.set(key, reply)
+        if self.similarity:
+            self._vectors.setdefault((context_hash, model), {})[key] = self._embed(question)
+
+    async def set(self, question: str, context_hash: str, model: str, reply: str) -> None:
+        """Cache a reply in every tier."""
+        if not self.enabled:
+            return
+        key = self.key(question, context_hash, model)
+        self._remember(key, reply, question, context_hash, model)
+        if self.shared is not None:
+            try:
+                await asyncio.to_thread(self.shared.set, key, reply, self.ttl)
+            except sqlite3.Error:
+                logger.exception("Shared response cache write failed")
+
+    def clear(self) -> None:
+        """Drop every cached reply (in this process and the shared tier) and reset the counters."""
+        self.memory.clear()
+        self._vectors.clear()
+        if self.shared is not None:
+            self.shared.clear()
+        self.shared_hits = self.similar_hits = self.misses = 0
+
+    def stats(self) -> dict:
+        hits = self.memory.hits + self.shared_hits + self.similar_hits
+        lookups = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self.memory),
+            "hits": hits,
+            "misses": self.misses,
+            "memory_hits": self.memory.hits,
+            "shared_hits": self.shared_hits,
+            "similar_hits": self.similar_hits,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+
+response_cache = ResponseCache()
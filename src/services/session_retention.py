@@ -0,0 +1,75 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.config import SESSION_SWEEP_BATCH_SIZE, SESSION_SWEEP_INTERVAL, SESSION_TTL_DAYS
+from src.database import async_session
+from src.database_operations import delete_chat_sessions_before
+
+logger = logging.getLogger(__name__)
+
+
+class SessionRetentionSweeper:
+    """
+    Background task that deletes chat sessions older than the retention TTL.
+
+    Each sweep deletes expired sessions (and, through ON DELETE CASCADE, their
+    messages) in batches of `batch_size`, one short transaction per batch, and
+    yields to other work between batches so it never holds the write lock for long.
+    """
+
+    def __init__(self, ttl_days: float = SESSION_TTL_DAYS, interval: float = SESSION_SWEEP_INTERVAL,
+                 batch_size: int = SESSION_SWEEP_BATCH_SIZE, session_factory: async_sessionmaker = async_session):
+        self.ttl = timedelta(days=ttl_days)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        """Start sweeping periodically; does nothing when retention is disabled (TTL of 0)."""
+        if not self.running and self.ttl:
+            self._task = asyncio.create_task(self._run(), name="session-retention")
+
+    async def stop(self) -> None:
+        """Stop the sweeper and wait for it to exit."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def sweep(self, now: Optional[datetime] = None) -> int:
+        """Delete every session created before now - TTL; returns how many were deleted."""
+        cutoff = (now or datetime.now(timezone.utc)) - self.ttl
+        total = 0
+        while True:
+            async with self.session_factory() as db:
+                deleted = await delete_chat_sessions_before(db, cutoff, self.batch_size)
+            total += deleted
+            if deleted < self.batch_size:
+                return total
+            await asyncio.sleep(0)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                deleted = await self.sweep()
+                if deleted:
+                    logger.info("Retention sweep deleted %d expired chat sessions", deleted)
+            except Exception:
+                logger.exception("Chat session retention sweep failed")
+            await asyncio.sleep(self.interval)
+
+
+session_sweeper = SessionRetentionSweeper()
@@ -0,0 +1,76 @@
+import time
+from collections import OrderedDict
+from typing import Generic, Hashable, Optional, TypeVar
+
+V = TypeVar("V")
+
+
+class LRUCache(Generic[V]):
+    """
+    In-memory LRU cache with an optional per-entry time to live.
+
+    Holds at most `max_size` entries; the least recently used entry is evicted
+    first. Entries older than `ttl` seconds are treated as missing (ttl=None keeps
+    them until evicted). Not thread-safe: meant to be used from one event loop.
+    """
+
+    def __init__(self, max_size: int, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Whether `key` is cached (expired entries included); does not count as a hit or miss."""
+        return key in self._entries
+
+    def get(self, key: Hashable, count: bool = True) -> Optional[V]:
+        """
+        The cached value of `key`, or None. With count=False the lookup is not added to
+        the hit/miss counters, e.g. when it serves a lookup that was already counted.
+        """
+        value = self._lookup(key)
+        if count:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def _lookup(self, key: Hashable) -> Optional[V]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def peek(self, key: Hashable) -> Optional[V]:
+        """Like get(), but without touching the LRU order or the hit/miss counters."""
+        entry = self._entries.get(key)
+        if entry is None or (entry[1] is not None and entry[1] <= time.monotonic()):
+            return None
+        return entry[0]
+
+    def set(self, key: Hashable, value: V) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Optional[V]:
+        entry = self._entries.pop(key, None)
+        return entry[0] if entry else None
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,102 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, Generic, Hashable, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class _SharedStream(Generic[T]):
+    """Items of one upstream stream, replayed to every subscriber from the start."""
+
+    def __init__(self):
+        self.items: List[T] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+    async def pump(self, source: AsyncIterator[T]) -> None:
+        try:
+            async for item in source:
+                async with self.changed:
+                    self.items.append(item)
+                    self.changed.notify_all()
+        except BaseException as e:
+            self.error = e
+        finally:
+            async with self.changed:
+                self.done = True
+                self.changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[T]:
+        position = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: position < len(self.items) or self.done)
+                items = self.items[position:]
+                finished = self.done
+            for item in items:
+                yield item
+            position += len(items)
+            if finished and position == len(self.items):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into one.
+
+    The first caller for a key starts the call; callers arriving with the same key
+    while it is in flight wait for and share its outcome (result or exception)
+    instead of starting their own. The call runs as its own task, so a caller that
+    goes away (e.g. a client disconnect) does not cancel it for the others.
+    Nothing is cached: once the call finishes, the next caller starts a new one.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._streams: Dict[Hashable, _SharedStream] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Return the result of `fn()`, sharing one in-flight call per key."""
+        task = self._calls.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(self._calls, key, done))
+        else:
+            self.followers += 1
+        return await asyncio.shield(task)
+
+    async def stream(self, key: Hashable, fn: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """Iterate `fn()`, sharing one in-flight stream per key; late joiners get every item from the start."""
+        shared = self._streams.get(key)
+        if shared is None:
+            self.leaders += 1
+            shared = _SharedStream()
+            shared.task = asyncio.ensure_future(shared.pump(fn()))
+            self._streams[key] = shared
+            shared.task.add_done_callback(lambda done: self._forget(self._streams, key, shared))
+        else:
+            self.followers += 1
+        async for item in shared.subscribe():
+            yield item
+
+    @staticmethod
+    def _forget(calls: dict, key: Hashable, value) -> None:
+        if calls.get(key) is value:
+            del calls[key]
+        if isinstance(value, asyncio.Task) and not value.cancelled():
+            # Mark the exception as retrieved even if every caller went away
+            value.exception()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
@@ -0,0 +1,67 @@
+# tests/fake_openrouter.py
+"""
+Local stand-in for the OpenRouter chat completions API.
+
+Used in-process by the tests (through httpx.ASGITransport) and as a standalone
+server for load measurements:
+    FAKE_OPENROUTER_LATENCY=0.5 uvicorn tests.fake_openrouter:app --port 8001
+    OPENROUTER_BASE_URL=http://localhost:8001/api/v1 uvicorn src.main:app
+"""
+import asyncio
+import json
+import os
+from uuid import uuid4
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+# Simulated upstream generation time, in seconds
+LATENCY = float(os.getenv("FAKE_OPENROUTER_LATENCY", "0"))
+
+app = FastAPI()
+app.state.requests = []
+
+
+def fake_reply(messages: list) -> str:
+    """Deterministic reply derived from the last user message."""
+    last = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+    return f"Echo: {last}"
+
+
+@app.post("/api/v1/chat/completions")
+async def chat_completions(request: Request):
+    payload = await request.json()
+    app.state.requests.append(payload)
+    reply = fake_reply(payload["messages"])
+    if payload.get("stream"):
+        return StreamingResponse(stream_reply(payload, reply), media_type="text/event-stream")
+    if LATENCY:
+        await asyncio.sleep(LATENCY)
+    return {
+        "id": f"gen-{uuid4().hex}",
+        "object": "chat.completion",
+        "model": payload.get("model"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": reply},
+            "finish_reason": "stop",
+        }],
+    }
+
+
+async def stream_reply(payload: dict, reply: str):
+    """Emit the reply word by word as OpenRouter-style Server-Sent Events."""
+    generation_id = f"gen-{uuid4().hex}"
+    words = reply.split(" ")
+    yield ": OPENROUTER PROCESSING\n\n"
+    for i, word in enumerate(words):
+        if LATENCY:
+            await asyncio.sleep(LATENCY / len(words))
+        chunk = {
+            "id": generation_id,
+            "object": "chat.completion.chunk",
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+    yield "data: [DONE]\n\n"
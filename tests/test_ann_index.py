@@ -0,0 +1,96 @@
+# tests/test_ann_index.py
+import numpy as np
+import pytest
+
+from src.services import kb_service
+from src.services.ann_index import IVFIndex
+from src.services.kb_service import KnowledgeBase, _top_k
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(1)
+    centers = rng.standard_normal((8, 32))
+    data = np.repeat(centers, 60, axis=0) + 0.3 * rng.standard_normal((480, 32))
+    data = (data / np.linalg.norm(data, axis=1, keepdims=True)).astype(np.float32)
+    return data, data[::37] + np.float32(0.05)
+
+
+@pytest.mark.parametrize("pq_subspaces, rerank", [(0, 0), (8, 480)])
+def test_probing_every_cell_matches_exact_search(vectors, pq_subspaces, rerank):
+    data, queries = vectors
+    index = IVFIndex.build(data, nlist=8, pq_subspaces=pq_subspaces, rerank=rerank)
+    assert sorted(index.rows.tolist()) == list(range(len(data)))
+
+    found, scores = index.search(queries, top_k=5, nprobe=8)
+    expected, expected_scores = _top_k(queries @ data.T, 5)
+    assert found.tolist() == expected.tolist()
+    assert np.allclose(scores, expected_scores, atol=1e-5)
+
+
+def test_product_quantization_approximates_scores(vectors):
+    data, queries = vectors
+    index = IVFIndex.build(data, nlist=8, nprobe=2, pq_subspaces=8)
+    assert index.codes.dtype == np.uint8 and index.codes.shape == (len(data), 8)
+
+    found, scores = index.search(queries, top_k=5)
+    exact = np.take_along_axis(queries @ data.T, found, axis=1)
+    assert np.abs(scores - exact).mean() < 0.1
+
+
+def test_knowledge_base_builds_and_persists_the_configured_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(kb_service, "KB_ANN_INDEX", "ivf")
+    monkeypatch.setattr(kb_service, "KB_ANN_MIN_CHUNKS", 1)
+    monkeypatch.setattr(kb_service, "KB_ANN_NLIST", 2)
+    monkeypatch.setattr(kb_service, "KB_ANN_NPROBE", 2)
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for i, topic in enumerate(["cats purr", "dogs bark", "fish swim", "birds sing"]):
+        (docs / f"{i}.txt").write_text(f"{topic} all day long")
+
+    kb = KnowledgeBase()
+    kb.load_documents(str(docs))
+    assert kb.ann is not None and kb.ann.kind == "ivf"
+    assert kb.search("why do dogs bark", top_k=1)[0][0].content == "dogs bark all day long"
+
+    kb.save_index(str(tmp_path / "index"))
+    reopened = KnowledgeBase()
+    assert reopened.load_index(str(tmp_path / "index"))
+    assert reopened.ann.rows.tolist() == kb.ann.rows.tolist()
+    # The cell-ordered vectors are mapped from the generation, not gathered again
+    assert isinstance(reopened.ann.cell_vectors, np.memmap)
+    assert np.array_equal(reopened.ann.cell_vectors, kb.ann.cell_vectors)
+    assert reopened.search("why do dogs bark", top_k=1)[0][0].content == "dogs bark all day long"
+
+    monkeypatch.setattr(kb_service, "KB_ANN_INDEX", "")
+    exact = KnowledgeBase()
+    assert exact.load_index(str(tmp_path / "index")) and exact.ann is None
+
+
+def test_only_the_writer_trains_a_missing_approximate_index(tmp_path, monkeypatch):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for i, topic in enumerate(["cats purr", "dogs bark", "fish swim", "birds sing"]):
+        (docs / f"{i}.txt").write_text(f"{topic} all day long")
+    index_path = str(tmp_path / "index")
+    KnowledgeBase().load_or_build(str(docs), index_path)
+
+    # The generation predates KB_ANN_INDEX: followers search it exactly instead of training
+    monkeypatch.setattr(kb_service, "KB_ANN_INDEX", "ivf")
+    monkeypatch.setattr(kb_service, "KB_ANN_MIN_CHUNKS", 1)
+    monkeypatch.setattr(kb_service, "KB_ANN_NLIST", 2)
+    monkeypatch.setattr(kb_service, "KB_ANN_NPROBE", 2)
+    trained = []
+    build = IVFIndex.build
+    monkeypatch.setattr(IVFIndex, "build", lambda *args, **kwargs: trained.append(1) or build(*args, **kwargs))
+    follower = KnowledgeBase()
+    assert follower.load_index(index_path) and follower.ann is None and not trained
+    assert follower.search("why do dogs bark", top_k=1)[0][0].content == "dogs bark all day long"
+
+    # The writer builds it and publishes a generation that has it, with nothing else changed
+    writer = KnowledgeBase()
+    assert writer.refresh_index(str(docs), index_path)["unchanged"] == 4
+    assert writer.ann is not None and len(trained) == 1
+    reopened = KnowledgeBase()
+    assert reopened.load_index(index_path) and reopened.index_dir != follower.index_dir
+    assert reopened.ann is not None and len(trained) == 1
@@ -0,0 +1,501 @@
+# tests/test_chat_db.py
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from httpx._transports.asgi import ASGITransport
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from src.database import get_session, Base, apply_sqlite_pragmas
+from src.routers.chat import chat_router
+from src.constants import SESSION_COOKIE_NAME
+from src.utils.query_counter import QueryCounter
+from src.database_operations import (
+    _like_search, add_messages, create_chat_session, get_recent_messages, search_documents,
+)
+from src.services.chat_service import (
+    fold_into_summary, generate_ai_response, load_conversation, prepare_llm_messages, save_turn, stream_ai_response,
+)
+from src.services.chunk_store import ChunkStoreBuilder
+from src.services.kb_indexer import KnowledgeBaseIndexer
+from src.services.kb_mirror import load_mirrored_chunks, mirror_chunks
+from src.services.message_writer import MessageWriter
+from src.services.session_retention import SessionRetentionSweeper
+from src.models import ChatSession, Document, Message
+
+from tests.conftest import TEST_DATABASE_URL
+
+# Each test runs on its own event loop, and asyncpg connections cannot move between
+# loops, so server databases get a fresh connection per session instead of a pool
+engine_test = create_async_engine(
+    TEST_DATABASE_URL,
+    future=True,
+    poolclass=None if TEST_DATABASE_URL.startswith("sqlite") else NullPool,
+)
+# foreign_keys=ON, so ON DELETE CASCADE applies as in the app
+apply_sqlite_pragmas(engine_test)
+# src.models empties Base.metadata once create_all runs, so keep the tables for the teardown
+TABLES = list(Base.metadata.sorted_tables)
+AsyncSessionLocal = sessionmaker(engine_test, class_=AsyncSession, expire_on_commit=False)
+
+async def override_get_session():
+    async with AsyncSessionLocal() as session:
+        yield session
+
+app = FastAPI()
+app.include_router(chat_router)
+app.dependency_overrides[get_session] = override_get_session
+
+@pytest.fixture(scope="module", autouse=True)
+async def setup_db():
+    async with engine_test.begin() as conn:
+        # Start from empty tables on persistent databases such as PostgreSQL
+        await conn.run_sync(Base.metadata.drop_all, tables=TABLES)
+        await conn.run_sync(Base.metadata.create_all, tables=TABLES)
+    yield
+    async with engine_test.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all, tables=TABLES)
+    await engine_test.dispose()
+
+@pytest.mark.asyncio
+async def test_create_chat_session():
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as ac:
+        response = await ac.post("/chat/", json={"message": "Hello"})
+        assert response.status_code == 200
+        data = response.json()
+        assert "reply" in data
+        assert "session_id" in data
+        cookies = response.cookies
+        assert SESSION_COOKIE_NAME in cookies
+        assert cookies[SESSION_COOKIE_NAME] == data["session_id"]
+        return cookies[SESSION_COOKIE_NAME]  # for reuse in other tests
+
+@pytest.mark.asyncio
+async def test_chat_turn_query_budget():
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as ac:
+        resp = await ac.post("/chat/", json={"message": "First"})
+        ac.cookies.set(SESSION_COOKIE_NAME, resp.cookies[SESSION_COOKIE_NAME])
+
+        with QueryCounter(engine_test) as counter:
+            resp = await ac.post("/chat/", json={"message": "Second"})
+        assert resp.status_code == 200
+        assert [msg["content"] for msg in resp.json()["history"]] == ["First", "Echo: First"]
+        # session lookup, history, one INSERT ... RETURNING for both messages
+        assert counter.count == 3, counter.statements
+        assert counter.commits == 1
+
+@pytest.mark.asyncio
+async def test_context_window_folds_old_messages_into_summary():
+    async with AsyncSessionLocal() as db:
+        chat_session = await create_chat_session(db, "summary-test")
+        await add_messages(db, chat_session.id, [
+            ("user", f"Question {i}. Details follow.") if i % 2 == 0 else ("assistant", f"Answer {i}.")
+            for i in range(6)
+        ])
+
+        conversation = await load_conversation(db, chat_session, max_messages=2)
+        assert [msg.content for msg in conversation.messages] == ["Question 4. Details follow.", "Answer 5."]
+        assert conversation.summary.splitlines()[0] == "user: Question 0."
+        assert len(conversation.summary.splitlines()) == 4
+
+        message_dicts, _, _ = await prepare_llm_messages(
+            db, chat_session.id, "Next", use_knowledge_base=False, conversation=conversation
+        )
+        assert message_dicts[0]["role"] == "system"
+        assert "assistant: Answer 3." in message_dicts[0]["content"]
+        assert len(message_dicts) == 4
+
+        await save_turn(db, chat_session.id, "Next", "Echo: Next", conversation)
+        assert chat_session.summarized_until == conversation.messages[0].id - 1
+
+        # The summarized prefix is not read again; only the new overflow is folded
+        conversation = await load_conversation(db, chat_session, max_messages=2)
+        assert [msg.content for msg in conversation.messages] == ["Next", "Echo: Next"]
+        assert conversation.summary.splitlines()[-1] == "assistant: Answer 5."
+
+@pytest.mark.asyncio
+async def test_history_older_than_the_fetched_tail_is_folded_too():
+    async with AsyncSessionLocal() as db:
+        # Sessions from before the summary column start at summarized_until = 0
+        chat_session = await create_chat_session(db, "long-history")
+        await add_messages(db, chat_session.id, [("user", f"Message {i}.") for i in range(40)])
+
+        conversation = await load_conversation(db, chat_session, max_messages=2)
+        assert [msg.content for msg in conversation.messages] == ["Message 38.", "Message 39."]
+        assert conversation.summary.splitlines() == [f"user: Message {i}." for i in range(38)]
+        assert conversation.summarized_until == conversation.messages[0].id - 1
+
+        # Pages older than a full summary are not read: they would only fall off it
+        chat_session = await create_chat_session(db, "very-long-history")
+        await add_messages(db, chat_session.id, [("user", f"Message {i} " + "x" * 300) for i in range(500)])
+        with QueryCounter(engine_test) as counter:
+            conversation = await load_conversation(db, chat_session, max_messages=2)
+        assert counter.count <= 3, counter.statements
+        everything = (await get_recent_messages(db, chat_session.id, limit=500))[:-2]
+        assert conversation.summary == fold_into_summary(None, everything)
+        assert conversation.summarized_until == everything[-1].id
+
+@pytest.mark.asyncio
+async def test_failed_llm_call_keeps_the_question_in_history(monkeypatch):
+    from src.services import chat_service
+
+    async def failing_ask(messages):
+        raise RuntimeError("upstream down")
+
+    async def failing_stream(messages):
+        raise RuntimeError("upstream down")
+        yield
+
+    monkeypatch.setattr(chat_service, "ask_openrouter", failing_ask)
+    monkeypatch.setattr(chat_service, "stream_openrouter", failing_stream)
+    async with AsyncSessionLocal() as db:
+        chat_session = await create_chat_session(db, "llm-failure-test")
+        with pytest.raises(RuntimeError):
+            await generate_ai_response(db, chat_session.id, "First question", use_knowledge_base=False)
+        with pytest.raises(RuntimeError):
+            async for _ in stream_ai_response(db, chat_session.id, "Second question", use_knowledge_base=False):
+                pass
+        messages = (await load_conversation(db, chat_session)).messages
+    assert [(msg.role, msg.content) for msg in messages] == [("user", "First question"), ("user", "Second question")]
+
+@pytest.mark.asyncio
+async def test_message_writer_group_commits_concurrent_turns():
+    async with AsyncSessionLocal() as db:
+        sessions = [await create_chat_session(db, f"writer-test-{i}") for i in range(20)]
+
+    writer = MessageWriter(AsyncSessionLocal)
+    await writer.start()
+    try:
+        results = await asyncio.gather(*(
+            writer.submit(chat_session.id, [("user", f"Q{i}"), ("assistant", f"A{i}")])
+            for i, chat_session in enumerate(sessions)
+        ))
+    finally:
+        await writer.stop()
+
+    assert writer.batches < len(sessions)
+    for i, (chat_session, rows) in enumerate(zip(sessions, results)):
+        assert [(msg.session_id, msg.content) for msg in rows] == [(chat_session.id, f"Q{i}"), (chat_session.id, f"A{i}")]
+
+@pytest.mark.asyncio
+async def test_get_session_id():
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as ac:
+        # Create session first
+        resp = await ac.post("/chat/", json={"message": "Hello"})
+        session_id = resp.cookies[SESSION_COOKIE_NAME]
+
+        response = await ac.get("/chat/session", cookies={SESSION_COOKIE_NAME: session_id})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["session_id"] == session_id
+
+@pytest.mark.asyncio
+async def test_get_chat_history():
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as ac:
+        # Create session first
+        resp = await ac.post("/chat/", json={"message": "Hello"})
+        session_id = resp.cookies[SESSION_COOKIE_NAME]
+
+        response = await ac.get(f"/chat/{session_id}/history")
+        assert response.status_code == 200
+        data = response.json()
+        assert isinstance(data, list)
+        assert len(data) >= 1
+        assert data[0]["role"] == "user"
+        assert data[0]["content"] == "Hello"
+
+@pytest.mark.asyncio
+async def test_list_chat_sessions():
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as ac:
+        # Create a session
+        await ac.post("/chat/", json={"message": "Hi"})
+        response = await ac.get("/chat/sessions")
+        assert response.status_code == 200
+        data = response.json()
+        assert isinstance(data, list)
+        assert len(data) >= 1
+        assert "session_id" in data[0]
+        assert "created_at" in data[0]
+
+@pytest.mark.asyncio
+async def test_delete_chat_session():
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as ac:
+        # Create a session
+        resp = await ac.post("/chat/", json={"message": "Bye"})
+        session_id = resp.cookies[SESSION_COOKIE_NAME]
+
+        # Delete the session
+        response = await ac.delete(f"/chat/sessions/{session_id}")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["status"] == "success"
+
+        # Check it was actually deleted
+        response = await ac.get(f"/chat/{session_id}/history")
+        assert response.status_code == 404
+
+@pytest.mark.asyncio
+async def test_chat_stream_sse():
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as ac:
+        async with ac.stream("POST", "/chat/stream", json={"message": "Stream me please"}) as response:
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/event-stream")
+            session_id = response.cookies[SESSION_COOKIE_NAME]
+            events = [line async for line in response.aiter_lines() if line.startswith("event:")]
+            assert events[0] == "event: token"
+            assert events[-1] == "event: done"
+            assert events.count("event: token") > 1
+
+        response = await ac.get(f"/chat/{session_id}/history")
+        data = response.json()
+        assert [msg["role"] for msg in data] == ["user", "assistant"]
+        assert data[1]["content"] == "Echo: Stream me please"
+
+@pytest.mark.asyncio
+async def test_chat_websocket(monkeypatch):
+    from starlette.testclient import TestClient
+    from src.services import chat_service
+
+    # As in the app, turns are written by the message writer, so nothing commits the socket's session
+    writer = MessageWriter(AsyncSessionLocal)
+    monkeypatch.setattr(chat_service, "message_writer", writer)
+    # The socket's session must not sit in a transaction between messages
+    sessions = []
+
+    async def recording_session():
+        async for session in override_get_session():
+            sessions.append(session)
+            yield session
+
+    monkeypatch.setitem(app.dependency_overrides, get_session, recording_session)
+
+    with TestClient(app) as client:
+        client.portal.call(writer.start)
+        with client.websocket_connect("/chat/ws") as ws:
+            session = ws.receive_json()
+            assert session["type"] == "session"
+            for message in ("Hello socket", "Hello again"):
+                ws.send_json({"message": message})
+                tokens = []
+                while True:
+                    frame = ws.receive_json()
+                    if frame["type"] == "done":
+                        break
+                    assert frame["type"] == "token"
+                    tokens.append(frame["content"])
+                assert "".join(tokens) == f"Echo: {message}"
+                assert not sessions[0].in_transaction()
+        client.portal.call(writer.stop)
+
+@pytest.mark.asyncio
+async def test_chat_history_keyset_pages():
+    async with AsyncSessionLocal() as db:
+        chat_session = await create_chat_session(db, "paging-test")
+        await add_messages(db, chat_session.id, [("user", f"Message {i}") for i in range(5)])
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as ac:
+        pages = []
+        params = {"limit": 2}
+        while True:
+            response = await ac.get("/chat/paging-test/history", params=params)
+            assert response.status_code == 200
+            pages.append([msg["content"] for msg in response.json()])
+            if "X-Next-Before" not in response.headers:
+                break
+            params["before"] = response.headers["X-Next-Before"]
+
+    assert pages == [["Message 3", "Message 4"], ["Message 1", "Message 2"], ["Message 0"]]
+
+@pytest.mark.asyncio
+async def test_list_chat_sessions_cursor_pages_match_ndjson_stream():
+    async with AsyncSessionLocal() as db:
+        for i in range(5):
+            await create_chat_session(db, f"listing-test-{i}")
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as ac:
+        response = await ac.get("/chat/sessions", params={"format": "ndjson"})
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        streamed = [json.loads(line)["session_id"] for line in response.text.splitlines()]
+
+        paged = []
+        params = {"limit": 2}
+        while True:
+            response = await ac.get("/chat/sessions", params=params)
+            paged.extend(session["session_id"] for session in response.json())
+            if "X-Next-Cursor" not in response.headers:
+                break
+            params["cursor"] = response.headers["X-Next-Cursor"]
+
+    # Sessions created within the same second are still ordered, newest first, by id
+    assert paged == streamed
+    assert streamed.index("listing-test-4") < streamed.index("listing-test-0")
+    assert len(set(paged)) == len(paged)
+
+@pytest.mark.asyncio
+async def test_session_cursor_survives_deleting_its_session():
+    async with AsyncSessionLocal() as db:
+        for i in range(3):
+            await create_chat_session(db, f"cursor-delete-test-{i}")
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as ac:
+        streamed = [json.loads(line)["session_id"] for line in
+                    (await ac.get("/chat/sessions", params={"format": "ndjson"})).text.splitlines()]
+        first = await ac.get("/chat/sessions", params={"limit": 1})
+        [last_seen] = [session["session_id"] for session in first.json()]
+        await ac.delete(f"/chat/sessions/{last_seen}")
+
+        rest = await ac.get("/chat/sessions", params={"cursor": first.headers["X-Next-Cursor"], "limit": 100})
+        assert [session["session_id"] for session in rest.json()] == streamed[1:]
+        assert (await ac.get("/chat/sessions", params={"cursor": "not-a-cursor"})).status_code == 400
+
+@pytest.mark.asyncio
+async def test_bulk_delete_sessions_cascades_to_messages():
+    async with AsyncSessionLocal() as db:
+        for i in range(3):
+            chat_session = await create_chat_session(db, f"bulk-delete-{i}")
+            await add_messages(db, chat_session.id, [("user", "Hi"), ("assistant", "Hello")])
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as ac:
+        response = await ac.post("/chat/sessions/delete", json={"session_ids": ["bulk-delete-0", "bulk-delete-1", "missing"]})
+        assert response.json() == {"status": "success", "deleted": 2}
+
+    async with AsyncSessionLocal() as db:
+        remaining = await db.scalars(
+            select(ChatSession.session_id).where(ChatSession.session_id.like("bulk-delete-%"))
+        )
+        assert remaining.all() == ["bulk-delete-2"]
+        orphans = await db.scalar(
+            select(func.count(Message.id)).where(Message.session_id.not_in(select(ChatSession.id)))
+        )
+        assert orphans == 0
+
+@pytest.mark.asyncio
+async def test_retention_sweeper_deletes_expired_sessions_in_batches():
+    async with AsyncSessionLocal() as db:
+        for i in range(5):
+            chat_session = await create_chat_session(db, f"expired-{i}")
+            await add_messages(db, chat_session.id, [("user", "Old")])
+
+    sweeper = SessionRetentionSweeper(ttl_days=30, batch_size=2, session_factory=AsyncSessionLocal)
+    # Nothing is 30 days old yet
+    assert await sweeper.sweep() == 0
+
+    async with AsyncSessionLocal() as db:
+        total = await db.scalar(select(func.count(ChatSession.id)))
+    deleted = await sweeper.sweep(now=datetime.now(timezone.utc) + timedelta(days=31))
+    assert deleted == total
+
+    async with AsyncSessionLocal() as db:
+        assert await db.scalar(select(func.count(ChatSession.id))) == 0
+        assert await db.scalar(select(func.count(Message.id))) == 0
+
+@pytest.mark.asyncio
+async def test_kb_mirror_syncs_changed_files_and_finds_exact_terms():
+    def store(files):
+        builder = ChunkStoreBuilder()
+        for name, (digest, chunks) in files.items():
+            builder.add({'source': name, 'hash': digest, 'size': 10, 'last_modified': 1.0}, chunks)
+        return builder.build()
+
+    first = store({
+        'errors.txt': ('a1', ["Error E-4012 means the card was declined.", "Retry after a minute."]),
+        'hours.txt': ('b1', ["We open at nine."]),
+    })
+    assert await mirror_chunks(AsyncSessionLocal, first) == {'written': 2, 'deleted': 0}
+    # Nothing changed, so nothing is rewritten
+    assert await mirror_chunks(AsyncSessionLocal, first) == {'written': 0, 'deleted': 0}
+
+    async with AsyncSessionLocal() as db:
+        hits = await search_documents(db, "what does E-4012 mean")
+    assert (hits[0][0].filename, hits[0][0].chunk) == ('errors.txt', 0)
+
+    second = store({'errors.txt': ('a2', ["Error E-5000 is a timeout."])})
+    assert await mirror_chunks(AsyncSessionLocal, second) == {'written': 1, 'deleted': 1}
+    async with AsyncSessionLocal() as db:
+        assert await search_documents(db, "4012") == []
+        assert [document.content for document, _ in await search_documents(db, "E-5000")] == [
+            "Error E-5000 is a timeout."
+        ]
+
+    # Databases without a full-text index fall back to a LIKE scan
+    async with AsyncSessionLocal() as db:
+        [(document, score)] = (await db.execute(_like_search(["timeout", "5000", "missing"]))).all()
+    assert (document.filename, score) == ('errors.txt', 2)
+
+    loaded = await load_mirrored_chunks(AsyncSessionLocal)
+    assert list(loaded.texts()) == ["Error E-5000 is a timeout."]
+    assert loaded.metadata(0) == {'source': 'errors.txt', 'hash': 'a2', 'size': 10, 'last_modified': 1.0, 'chunk': 0}
+
+    # One file per transaction gives the same mirror
+    third = store({'errors.txt': ('a2', ["Error E-5000 is a timeout."]), 'a.txt': ('c1', ["A"]), 'b.txt': ('d1', ["B"])})
+    assert await mirror_chunks(AsyncSessionLocal, third, batch_files=1) == {'written': 2, 'deleted': 0}
+    assert list((await load_mirrored_chunks(AsyncSessionLocal)).texts()) == ["A", "B", "Error E-5000 is a timeout."]
+    # An empty store never wipes the mirror
+    assert await mirror_chunks(AsyncSessionLocal, store({})) == {'written': 0, 'deleted': 0}
+    assert await mirror_chunks(AsyncSessionLocal, store({'a.txt': ('c1', ["A"])}), batch_files=1) == {
+        'written': 0, 'deleted': 2
+    }
+
+@pytest.mark.asyncio
+async def test_failed_initial_load_does_not_mirror_an_empty_index(tmp_path, monkeypatch):
+    async with AsyncSessionLocal() as db:
+        mirrored = await db.scalar(select(func.count(Document.id)))
+    assert mirrored
+
+    indexer = KnowledgeBaseIndexer(str(tmp_path / "docs"), str(tmp_path / "index"), interval=60,
+                                   session_factory=AsyncSessionLocal)
+    def fail(mirrored=None):
+        raise RuntimeError("index unreadable")
+    monkeypatch.setattr(indexer, "_initial_load", fail)
+    await indexer.start()
+    try:
+        await asyncio.wait_for(indexer.ready.wait(), timeout=5)
+        await asyncio.sleep(0.05)
+        assert indexer._lock.held
+    finally:
+        await indexer.stop()
+
+    async with AsyncSessionLocal() as db:
+        assert await db.scalar(select(func.count(Document.id))) == mirrored
+
+@pytest.mark.asyncio
+async def test_repeated_question_is_answered_from_the_response_cache(fake_llm):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as ac:
+        first = await ac.post("/chat/", json={"message": "What are the opening hours?"})
+    # A new session (no cookie) with the same question and no history
+    async with AsyncClient(transport=transport, base_url="http://testserver") as ac:
+        second = await ac.post("/chat/", json={"message": "what are the opening hours"})
+
+    assert second.json()["reply"] == first.json()["reply"]
+    assert len(fake_llm.state.requests) == 1
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_questions_share_one_llm_call(fake_llm, monkeypatch):
+    from tests import fake_openrouter
+    monkeypatch.setattr(fake_openrouter, "LATENCY", 0.05)
+
+    async def ask():
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://testserver") as ac:
+            return await ac.post("/chat/", json={"message": "Is the store open today?"})
+
+    responses = await asyncio.gather(*(ask() for _ in range(5)))
+    assert {response.json()["reply"] for response in responses} == {"Echo: Is the store open today?"}
+    assert len(fake_llm.state.requests) == 1
@@ -0,0 +1,68 @@
+# tests/test_kb_extractors.py
+import hashlib
+import time
+import zipfile
+import zlib
+
+import pytest
+
+from src.services.kb_extractors import ExtractionTimeout, extract_text, time_limit
+from src.services.kb_service import KnowledgeBase
+
+DOCUMENT_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+    '<w:p><w:r><w:t>Reset the router</w:t></w:r><w:r><w:tab/><w:t>with code E42.</w:t></w:r></w:p>'
+    '<w:p><w:r><w:t>Then wait.</w:t></w:r></w:p>'
+    '</w:body></w:document>'
+)
+
+
+def write_docx(path):
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("[Content_Types].xml", "<Types/>")
+        archive.writestr("word/document.xml", DOCUMENT_XML)
+
+
+def write_pdf(path):
+    content = zlib.compress(b"BT /F1 12 Tf 72 712 Td (Reset the \\(old\\) router) Tj T* [(with co) -20 (de E42.)] TJ ET")
+    path.write_bytes(
+        b"%PDF-1.4\n1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n"
+        b"4 0 obj\n<< /Length " + str(len(content)).encode() + b" /Filter /FlateDecode >>\nstream\n"
+        + content + b"\nendstream\nendobj\n%%EOF\n"
+    )
+
+
+def test_docx_extractor(tmp_path):
+    path = tmp_path / "manual.docx"
+    write_docx(path)
+    hasher = hashlib.md5()
+    text = "".join(extract_text(str(path), hasher))
+    assert text.split() == ["Reset", "the", "router", "with", "code", "E42.", "Then", "wait."]
+    assert hasher.hexdigest() == hashlib.md5(path.read_bytes()).hexdigest()
+
+
+def test_pdf_extractor(tmp_path):
+    path = tmp_path / "manual.pdf"
+    write_pdf(path)
+    hasher = hashlib.md5()
+    text = "".join(extract_text(str(path), hasher))
+    assert text.split() == ["Reset", "the", "(old)", "router", "with", "code", "E42."]
+    assert hasher.hexdigest() == hashlib.md5(path.read_bytes()).hexdigest()
+
+
+def test_binary_formats_are_indexed(tmp_path):
+    write_docx(tmp_path / "manual.docx")
+    write_pdf(tmp_path / "manual.pdf")
+    (tmp_path / "notes.txt").write_text("plain notes")
+    kb = KnowledgeBase()
+    kb.load_documents(str(tmp_path), workers=1)
+    assert sorted(doc.metadata["source"].rsplit(".", 1)[1] for doc in kb.documents) == ["docx", "pdf", "txt"]
+    assert kb.last_ingest_stats.files == 3
+
+
+def test_time_limit_interrupts_long_extraction():
+    with pytest.raises(ExtractionTimeout):
+        with time_limit(0.05):
+            while True:
+                time.sleep(0.01)
@@ -0,0 +1,356 @@
+# tests/test_kb_service.py
+import asyncio
+import json
+import os
+
+import numpy as np
+import pytest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.routers.kb import kb_router
+from src.services import kb_service
+from src.services.kb_indexer import KnowledgeBaseIndexer
+from src.services.kb_service import KnowledgeBase, StreamChunker, get_knowledge_base
+
+
+@pytest.fixture
+def kb(tmp_path):
+    (tmp_path / "cats.txt").write_text("cats purr and sleep all day long")
+    (tmp_path / "dogs.md").write_text("dogs bark at the mailman every morning")
+    (tmp_path / "fish.txt").write_text("fish swim in the water of the pond")
+    knowledge_base = KnowledgeBase()
+    knowledge_base.load_documents(str(tmp_path))
+    return knowledge_base
+
+
+def test_embeddings_are_normalized_matrix(kb):
+    assert kb.embeddings.dtype == np.float32
+    assert kb.embeddings.shape[0] == len(kb.documents)
+    assert np.allclose(np.linalg.norm(kb.embeddings, axis=1), 1.0, atol=1e-5)
+
+
+def test_search_matches_brute_force(kb):
+    query = "do dogs bark"
+    results = kb.search(query, top_k=2)
+    query_embedding = kb._embed_queries([query])[0]
+    expected = np.argsort(kb.embeddings @ query_embedding)[::-1][:2]
+    assert [doc.content for doc, _ in results] == [kb.documents[i].content for i in expected]
+    assert results[0][1] >= results[1][1]
+
+
+def test_search_ranks_matching_document_first(kb):
+    assert kb.search("why do dogs bark", top_k=1)[0][0].content == "dogs bark at the mailman every morning"
+    assert kb.search("pond water", top_k=1)[0][0].content == "fish swim in the water of the pond"
+
+
+def test_embeddings_are_identical_across_processes(kb):
+    import subprocess
+    import sys
+
+    script = (
+        "from src.services.kb_service import KnowledgeBase;"
+        "print(KnowledgeBase()._get_embedding('cats purr and sleep all day long').tobytes().hex())"
+    )
+    other = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    assert other.stdout.strip() == kb._get_embedding("cats purr and sleep all day long").tobytes().hex()
+
+
+def test_search_batch_is_aligned_with_queries(kb):
+    queries = ["cats purr", "fish swim", "dogs bark"]
+    batched = kb.search_batch(queries, top_k=5)
+    assert len(batched) == len(queries)
+    for query, results in zip(queries, batched):
+        assert len(results) == len(kb.documents)
+        assert [doc.content for doc, _ in results] == [doc.content for doc, _ in kb.search(query, top_k=5)]
+
+
+def test_search_empty_knowledge_base():
+    assert KnowledgeBase().search("anything") == []
+    assert KnowledgeBase().search_batch(["a", "b"]) == [[], []]
+
+
+def test_stream_chunker_spans_are_independent_of_piece_boundaries():
+    text = " ".join(f"w{i}" for i in range(25)) + "\n"
+    whole = KnowledgeBase()._chunk_text(text, chunk_size=10, overlap=3)
+    assert [chunk.split() for chunk in whole] == [
+        [f"w{i}" for i in range(0, 10)],
+        [f"w{i}" for i in range(7, 17)],
+        [f"w{i}" for i in range(14, 24)],
+        [f"w{i}" for i in range(21, 25)],
+    ]
+
+    chunker = StreamChunker(chunk_size=10, overlap=3)
+    pieces = [text[i:i + 4] for i in range(0, len(text), 4)]
+    streamed = [(start, end, chunker.text(start, end)) for start, end in chunker.spans(pieces)]
+    assert [chunk for _, _, chunk in streamed] == whole
+    assert all(text[start:end] == chunk for start, end, chunk in streamed)
+
+
+def test_process_file_embeds_in_blocks_and_skips_unchanged_content(tmp_path, monkeypatch):
+    source = tmp_path / "long.txt"
+    source.write_text(" ".join(f"w{i}" for i in range(9000)))
+    monkeypatch.setattr(kb_service, "EMBED_BLOCK_CHUNKS", 3)
+    knowledge_base = KnowledgeBase()
+    batches = []
+    original = knowledge_base._embed_batch
+    monkeypatch.setattr(knowledge_base, "_embed_batch", lambda texts: batches.append(len(texts)) or original(texts))
+
+    result = knowledge_base._process_file(str(source))
+    assert len(result.chunks) == 11 and batches == [3, 3, 3, 2]
+    assert np.array_equal(result.embeddings, original(result.chunks))
+
+    # Same content: reported unchanged without extracting any text
+    monkeypatch.setattr(kb_service, "extract_text", lambda *args: pytest.fail("extracted an unchanged file"))
+    unchanged = knowledge_base._process_file(str(source), result.metadata["hash"])
+    assert unchanged.unchanged and unchanged.metadata == result.metadata
+
+
+def test_index_round_trip_is_memory_mapped(kb, tmp_path):
+    index_path = tmp_path / "index"
+    kb.save_index(str(index_path))
+
+    loaded = KnowledgeBase()
+    assert loaded.load_index(str(index_path))
+    assert isinstance(loaded.embeddings, np.memmap)
+    assert isinstance(loaded.store.text, np.memmap) and isinstance(loaded.store.offsets, np.memmap)
+    assert isinstance(loaded.lexical.postings, np.memmap)
+    assert [doc.content for doc in loaded.documents] == [doc.content for doc in kb.documents]
+    assert [doc.metadata for doc in loaded.documents] == [doc.metadata for doc in kb.documents]
+    assert [doc.content for doc, _ in loaded.search("dogs bark")] == [doc.content for doc, _ in kb.search("dogs bark")]
+
+
+def test_chunk_store_keeps_file_metadata_once(kb, tmp_path):
+    (tmp_path / "long.txt").write_text(" ".join(f"wörd{i}" for i in range(2000)))
+    kb.refresh(str(tmp_path))
+
+    store = kb.store
+    assert len(store.files) == 4 and store.file_ids.dtype == np.int32
+    rows = store.rows_by_source()[str(tmp_path / "long.txt")]
+    assert len(rows) > 1
+    assert store.rows_by_source() == {
+        metadata["source"]: [row for row in range(len(store)) if store.file_metadata(row) is metadata]
+        for metadata in store.files
+    }
+    store.rows_by_source().clear()
+    assert len(store.rows_by_source()) == 4
+    assert [store[row].metadata["chunk"] for row in rows] == list(range(len(rows)))
+    assert store[rows[0]].content.startswith("wörd0 wörd1")
+    assert store[-1].content == store[len(store) - 1].content
+    with pytest.raises(AttributeError):
+        store[0].extra = "Documents have slots"
+
+
+def test_load_index_missing_returns_false(tmp_path):
+    assert not KnowledgeBase().load_index(str(tmp_path / "missing"))
+
+
+def test_refresh_only_reembeds_changed_files(kb, tmp_path, monkeypatch):
+    (tmp_path / "cats.txt").write_text("cats hunt mice at night")
+    (tmp_path / "birds.txt").write_text("birds sing in the morning")
+    (tmp_path / "fish.txt").unlink()
+
+    embedded = []
+    original = kb._embed_batch
+    monkeypatch.setattr(kb, "_embed_batch", lambda texts: embedded.extend(texts) or original(texts))
+
+    stats = kb.refresh(str(tmp_path))
+    assert stats == {"added": 1, "modified": 1, "removed": 1, "unchanged": 1, "touched": 0, "failed": 0}
+    assert sorted(embedded) == ["birds sing in the morning", "cats hunt mice at night"]
+    assert sorted(doc.content for doc in kb.documents) == sorted(
+        ["birds sing in the morning", "cats hunt mice at night", "dogs bark at the mailman every morning"]
+    )
+    assert kb.embeddings.shape[0] == len(kb.documents)
+    rebuilt = KnowledgeBase()
+    rebuilt.load_documents(str(tmp_path))
+    assert {doc.content for doc, _ in kb.search("birds sing", top_k=2)} == {
+        doc.content for doc, _ in rebuilt.search("birds sing", top_k=2)
+    }
+    # The inverted index was merged, not rebuilt, and scores like a rebuilt one
+    for query in ("morning", "cats mice", "fish"):
+        assert [(doc.content, round(score, 5)) for doc, score in kb.search(query, top_k=3, mode="lexical")] == [
+            (doc.content, round(score, 5)) for doc, score in rebuilt.search(query, top_k=3, mode="lexical")
+        ]
+
+    assert kb.refresh(str(tmp_path)) == {"added": 0, "modified": 0, "removed": 0, "unchanged": 3, "touched": 0, "failed": 0}
+
+
+def test_touched_files_update_the_copy_and_persisted_metadata_only(kb, tmp_path, tmp_path_factory, monkeypatch):
+    index_path = str(tmp_path_factory.mktemp("index"))
+    kb.save_index(index_path)
+    live = KnowledgeBase()
+    assert live.load_index(index_path)
+    cats = str(tmp_path / "cats.txt")
+    os.utime(cats, (1_000_000, 1_000_000))
+    (tmp_path / "dogs.md").unlink()
+    (tmp_path / "fish.txt").write_text("fish swim in the sea")
+    extract = kb_service.extract_text
+    monkeypatch.setattr(kb_service, "extract_text", lambda source, hasher: (_ for _ in ()).throw(OSError("busy"))
+                        if source.endswith("fish.txt") else extract(source, hasher))
+
+    refreshed = live.copy()
+    stats = refreshed.refresh(str(tmp_path))
+    assert (stats["touched"], stats["failed"], stats["removed"]) == (1, 1, 1)
+    # The unreadable file keeps its chunks; the live instance still has its old metadata
+    assert sorted(doc.content for doc in refreshed.documents) == ["cats purr and sleep all day long",
+                                                                 "fish swim in the water of the pond"]
+    assert live.store.file_metadata(live.store.rows_by_source()[cats][0])["last_modified"] != 1_000_000
+    refreshed.save_index(index_path)
+
+    reloaded = KnowledgeBase()
+    assert reloaded.load_index(index_path)
+    assert reloaded.store.file_metadata(reloaded.store.rows_by_source()[cats][0])["last_modified"] == 1_000_000
+    # The new mtime was persisted, so only the file that failed is read again
+    read = []
+    monkeypatch.setattr(reloaded, "_ingest", lambda jobs, workers=None: read.extend(jobs) or iter(()))
+    reloaded.refresh(str(tmp_path))
+    assert [source for source, _ in read] == [str(tmp_path / "fish.txt")]
+
+
+def test_retrieval_cache_serves_repeats_until_the_index_changes(kb, tmp_path, monkeypatch):
+    embedded = []
+    original = kb._embed_queries
+    monkeypatch.setattr(kb, "_embed_queries", lambda queries: embedded.extend(queries) or original(queries))
+
+    hits, misses = kb_service.retrieval_cache.hits, kb_service.retrieval_cache.misses
+    first = kb.get_relevant_context("Why do dogs bark?", top_k=1, mode="hybrid")
+    assert kb.get_relevant_context("why do DOGS bark", top_k=1, mode="hybrid") == first
+    assert kb.search("bark dogs do why", top_k=1, mode="hybrid")[0][0].content == "dogs bark at the mailman every morning"
+    assert embedded == ["Why do dogs bark?"]
+    # The missed context does not count its nested search lookup as a second miss
+    assert (kb_service.retrieval_cache.hits - hits, kb_service.retrieval_cache.misses - misses) == (2, 1)
+
+    # A refresh that changes the index gives it a new generation, so nothing stale is served
+    generation = kb.generation
+    (tmp_path / "dogs.md").write_text("dogs bark at cats and at the rain")
+    kb.refresh(str(tmp_path))
+    assert kb.generation != generation
+    assert "dogs bark at cats" in kb.get_relevant_context("Why do dogs bark?", top_k=1)
+    assert embedded == ["Why do dogs bark?", "Why do dogs bark?"]
+
+
+def test_lexical_and_hybrid_search_find_exact_terms(kb, tmp_path):
+    (tmp_path / "errors.txt").write_text("error E1042 means the disk is full")
+    kb.refresh(str(tmp_path))
+
+    for mode in ("lexical", "hybrid"):
+        assert kb.search("what is E1042", top_k=1, mode=mode)[0][0].content == "error E1042 means the disk is full"
+    # BM25 only returns chunks sharing a term with the query
+    assert [doc.content for doc, _ in kb.search("purr", top_k=5, mode="lexical")] == [
+        "cats purr and sleep all day long"
+    ]
+    assert "E1042" in kb.get_relevant_context("E1042?", top_k=1, mode="hybrid")
+    with pytest.raises(ValueError):
+        kb.search("cats", mode="fuzzy")
+
+
+async def test_indexer_swaps_in_refreshed_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(kb_service, "knowledge_base", KnowledgeBase())
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.txt").write_text("alpha beta gamma")
+
+    indexer = KnowledgeBaseIndexer(str(docs), str(tmp_path / "index"), interval=0.01)
+    await indexer.start()
+    try:
+        await asyncio.wait_for(indexer.ready.wait(), timeout=5)
+        before = get_knowledge_base()
+        assert [doc.content for doc in before.documents] == ["alpha beta gamma"]
+
+        (docs / "b.txt").write_text("delta epsilon")
+        for _ in range(500):
+            if get_knowledge_base() is not before:
+                break
+            await asyncio.sleep(0.01)
+        after = get_knowledge_base()
+        assert sorted(doc.content for doc in after.documents) == ["alpha beta gamma", "delta epsilon"]
+        # The instance readers already held was never modified
+        assert [doc.content for doc in before.documents] == ["alpha beta gamma"]
+    finally:
+        await indexer.stop()
+    assert not indexer.running
+
+
+def test_kb_listing_pages_through_the_loaded_index(kb, monkeypatch):
+    monkeypatch.setattr(kb_service, "knowledge_base", kb)
+    # The listing must not reload the index
+    monkeypatch.setattr(KnowledgeBase, "load_or_build", lambda self: pytest.fail("index reloaded"))
+    documents = list(kb.documents)
+    app = FastAPI()
+    app.include_router(kb_router)
+    client = TestClient(app)
+
+    first = client.get("/kb/", params={"limit": 2})
+    assert [chunk["source"] for chunk in first.json()] == [doc.metadata["source"] for doc in documents[:2]]
+    assert "content" not in first.json()[0]
+    rest = client.get("/kb/", params={"cursor": first.headers["X-Next-Cursor"], "include_content": True})
+    assert "X-Next-Cursor" not in rest.headers
+    assert [chunk["content"] for chunk in rest.json()] == [documents[2].content]
+
+    export = client.get("/kb/", params={"format": "ndjson", "include_content": True})
+    lines = [json.loads(line) for line in export.text.splitlines()]
+    assert [line["content"] for line in lines] == [doc.content for doc in kb.documents]
+
+    files = client.get("/kb/files").json()
+    assert sorted(file["source"] for file in files) == sorted(doc.metadata["source"] for doc in kb.documents)
+    assert all(file["chunks"] == 1 for file in files)
+
+
+def test_one_indexer_writes_and_the_others_follow_its_generations(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.txt").write_text("alpha beta gamma")
+    index_path = str(tmp_path / "index")
+    writer = KnowledgeBaseIndexer(str(docs), index_path)
+    follower = KnowledgeBaseIndexer(str(docs), index_path)
+    try:
+        assert writer._lock.acquire(blocking=False)
+        assert not follower._lock.acquire(blocking=False)
+
+        written = writer._initial_load()
+        followed = follower._initial_load()
+        assert followed.index_dir == written.index_dir
+        assert isinstance(written.embeddings, np.memmap)
+
+        (docs / "b.txt").write_text("delta epsilon")
+        assert follower._poll(followed) is None
+        refreshed = writer._poll(written)
+        # The writer swaps in the generation it saved, memory-mapped like the followers' copy
+        assert isinstance(refreshed.embeddings, np.memmap) and isinstance(refreshed.store.text, np.memmap)
+        updated = follower._poll(followed)
+        assert updated.index_dir == refreshed.index_dir
+        assert sorted(doc.content for doc in updated.documents) == ["alpha beta gamma", "delta epsilon"]
+
+        # Publishing prunes generations older than the previous one, which may still be being opened
+        (docs / "c.txt").write_text("zeta eta")
+        latest = writer._poll(refreshed)
+        assert sorted(path.name for path in (tmp_path / "index").glob("gen-*")) == sorted(
+            [refreshed.index_dir, latest.index_dir]
+        )
+
+        # When the writer goes away, a follower takes over
+        writer._lock.release()
+        (docs / "d.txt").write_text("theta iota")
+        taken_over = follower._poll(updated)
+        assert follower._lock.held
+        assert len(taken_over.documents) == 4
+    finally:
+        writer._lock.release()
+        follower._lock.release()
+
+
+def test_parallel_ingestion_matches_serial(tmp_path):
+    for i in range(6):
+        (tmp_path / f"doc{i}.txt").write_text(f"document number {i} " + "filler words " * 50)
+    (tmp_path / "broken.txt").write_bytes(b"\xff\xfe not utf-8")
+
+    serial = KnowledgeBase()
+    serial.load_documents(str(tmp_path), workers=1)
+    parallel = KnowledgeBase()
+    parallel.load_documents(str(tmp_path), workers=2)
+
+    assert parallel.last_ingest_stats.workers == 2
+    assert parallel.last_ingest_stats.files == 7
+    assert [doc.metadata for doc in parallel.documents] == [doc.metadata for doc in serial.documents]
+    assert np.array_equal(parallel.embeddings, serial.embeddings)
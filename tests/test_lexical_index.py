@@ -0,0 +1,68 @@
+# tests/test_lexical_index.py
+import math
+
+import numpy as np
+
+from src.services.embeddings import tokenize
+from src.services.lexical_index import BM25Index, reciprocal_rank_fusion
+
+TEXTS = [
+    "the disk is full",
+    "error E1042 the disk is full the disk",
+    "network timeout while reading the disk",
+    "",
+    "cats purr",
+]
+
+
+def naive_bm25(texts, query, k1=1.2, b=0.75):
+    docs = [tokenize(text) for text in texts]
+    average = sum(map(len, docs)) / len(docs)
+    scores = {}
+    for term in set(tokenize(query)):
+        df = sum(term in doc for doc in docs)
+        idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+        for row, doc in enumerate(docs):
+            tf = doc.count(term)
+            if tf:
+                norm = k1 * (1 - b + b * len(doc) / average)
+                scores[row] = scores.get(row, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+    return scores
+
+
+def test_bm25_matches_naive_scoring():
+    index = BM25Index.build(TEXTS)
+    for query in ["disk full", "E1042 disk disk", "timeout", "purr cats network", "unknown words"]:
+        rows, scores = index.search(query, top_k=10)
+        expected = naive_bm25(TEXTS, query)
+        assert sorted(rows.tolist()) == sorted(expected)
+        assert np.allclose(scores, [expected[row] for row in rows.tolist()], rtol=1e-5)
+        assert list(scores) == sorted(scores, reverse=True)
+
+    rows, _ = index.search("disk", top_k=2)
+    assert len(rows) == 2
+    assert len(BM25Index.build([]).search("disk")[0]) == 0
+
+
+def test_update_matches_a_rebuild_and_round_trips(tmp_path):
+    added = ["cats chase the network cable", "disk quota exceeded"]
+    updated = BM25Index.build(TEXTS).update([0, 2, 4], added)
+    rebuilt = BM25Index.build([TEXTS[0], TEXTS[2], TEXTS[4]] + added)
+    # "e1042" only occurred in a dropped document
+    assert len(updated.vocabulary) == len(rebuilt.vocabulary) and "e1042" not in updated.vocabulary
+
+    updated.save(tmp_path)
+    loaded = BM25Index.load(tmp_path)
+    assert isinstance(loaded.postings, np.memmap) and isinstance(loaded.lengths, np.memmap)
+    for query in ["disk full", "cats network", "e1042", "quota the"]:
+        expected_rows, expected_scores = rebuilt.search(query, top_k=10)
+        for index in (updated, loaded):
+            rows, scores = index.search(query, top_k=10)
+            assert rows.tolist() == expected_rows.tolist()
+            assert np.allclose(scores, expected_scores, rtol=1e-6)
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1, 4]], k=60)
+    assert [row for row, _ in fused] == [1, 3, 2, 4]
+    assert math.isclose(fused[0][1], 1 / 61 + 1 / 62)
@@ -0,0 +1,48 @@
+import time
+
+from src.services.response_cache import ResponseCache, context_fingerprint, normalize_question
+from src.utils.cache import LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used_and_expires():
+    cache = LRUCache(max_size=2, ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # evicts "b", the least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (3, 2)
+
+
+def test_normalized_question_and_context_share_a_key():
+    assert normalize_question("  What is   RAG? ") == normalize_question("what is rag")
+    context = context_fingerprint("kb text", [{"role": "user", "content": "hi"}])
+    assert ResponseCache.key("What is RAG?", context, "m") == ResponseCache.key("what is rag", context, "m")
+    assert ResponseCache.key("What is RAG?", context, "m") != ResponseCache.key("What is RAG?", context, "other")
+    assert context != context_fingerprint("other kb text", [{"role": "user", "content": "hi"}])
+
+
+async def test_shared_tier_is_seen_by_another_process_cache(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    writer = ResponseCache(db_path=path, similarity=0, enabled=True)
+    reader = ResponseCache(db_path=path, similarity=0, enabled=True)
+
+    await writer.set("How do I reset my password?", "ctx", "m", "Use the reset link.")
+    assert await reader.get("how do i reset my password", "ctx", "m") == "Use the reset link."
+    assert await reader.get("how do i reset my password", "ctx", "m") == "Use the reset link."
+    assert reader.stats()["shared_hits"] == 1
+    assert reader.stats()["memory_hits"] == 1
+
+
+async def test_near_duplicate_mode_matches_similar_questions_only():
+    cache = ResponseCache(db_path="", similarity=0.8, enabled=True)
+    await cache.set("how do I reset my account password", "ctx", "m", "Use the reset link.")
+
+    assert await cache.get("how can I reset my account password", "ctx", "m") == "Use the reset link."
+    assert await cache.get("how can I reset my account password", "other ctx", "m") is None
+    assert await cache.get("what are your opening hours", "ctx", "m") is None
+    stats = cache.stats()
+    assert (stats["similar_hits"], stats["misses"]) == (1, 2)
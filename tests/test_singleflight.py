@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from src.utils.singleflight import SingleFlight
+
+
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "reply"
+
+    results = await asyncio.gather(*(flight.do("key", fetch) for _ in range(10)))
+    assert results == ["reply"] * 10
+    assert calls == 1
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "followers": 9}
+
+    # Finished calls are not cached
+    await flight.do("key", fetch)
+    assert calls == 2
+
+
+async def test_errors_are_shared_and_cancelling_one_caller_keeps_the_call():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    first = asyncio.ensure_future(flight.do("key", fail))
+    second = asyncio.ensure_future(flight.do("key", fail))
+    await asyncio.sleep(0)
+    first.cancel()
+    with pytest.raises(RuntimeError, match="upstream down"):
+        await second
+
+
+async def test_stream_is_replayed_to_late_subscribers():
+    flight = SingleFlight()
+    started = 0
+
+    async def tokens():
+        nonlocal started
+        started += 1
+        for token in ["a", "b", "c"]:
+            await asyncio.sleep(0.01)
+            yield token
+
+    async def consume(delay: float):
+        await asyncio.sleep(delay)
+        return [token async for token in flight.stream("key", tokens)]
+
+    results = await asyncio.gather(consume(0), consume(0.015))
+    assert results == [["a", "b", "c"], ["a", "b", "c"]]
+    assert started == 1